@@ -0,0 +1,270 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+import yaml
+
+# Run from anywhere: make the smartparking package importable from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger('SmartParking.bench')
+
+try:
+    from smartparking.parking_lot import ParkingLot
+    from smartparking.occupancy_logic import OccupancyLogic
+    from smartparking.visualizer import Visualizer
+    from smartparking.detections import make_detections
+    from smartparking.patch_classifier import FEATURE_COUNT, PatchClassifier
+except ImportError as e:
+    logger.error("Failed to import SmartParking modules. Ensure the requirements are installed.")
+    logger.error(f"Import Error: {e}")
+    sys.exit(1)
+
+# Bay size of the synthetic grid, close to the spaces in config/parking_zones.yaml
+SPACE_WIDTH = 100
+SPACE_HEIGHT = 180
+
+
+def write_grid_config(path: str, num_spaces: int) -> tuple:
+    """
+    Writes a zone config with num_spaces rectangular bays in a roughly square grid.
+    :return: (width, height) of the frame that contains the grid.
+    """
+    columns = int(np.ceil(np.sqrt(num_spaces * SPACE_HEIGHT / SPACE_WIDTH)))
+    rows = int(np.ceil(num_spaces / columns))
+    spaces = {}
+    for index in range(num_spaces):
+        row, column = divmod(index, columns)
+        x, y = column * SPACE_WIDTH, row * SPACE_HEIGHT
+        spaces[f"P{index + 1}"] = {"polygon": [[x, y], [x + SPACE_WIDTH, y], [x + SPACE_WIDTH, y + SPACE_HEIGHT],
+                                               [x, y + SPACE_HEIGHT]]}
+    with open(path, 'w') as f:
+        yaml.safe_dump({"parking_spaces": spaces}, f)
+    return columns * SPACE_WIDTH, rows * SPACE_HEIGHT
+
+
+def make_detection_stream(parking_lot: ParkingLot, num_frames: int, occupancy: float, churn: float,
+                          seed: int) -> List[np.ndarray]:
+    """
+    Synthetic detections: a vehicle box jittered around each occupied bay, where each frame a
+    `churn` fraction of the bays toggles (cars arriving and leaving).
+    """
+    rng = np.random.default_rng(seed)
+    bboxes = parking_lot.geometry.bboxes.astype(np.float64)  # (x1, y1, x2, y2) per space
+    occupied = rng.random(len(bboxes)) < occupancy
+    frames = []
+    for _ in range(num_frames):
+        occupied ^= rng.random(len(bboxes)) < churn
+        indices = np.flatnonzero(occupied)
+        x, y = bboxes[indices, 0], bboxes[indices, 1]
+        w, h = bboxes[indices, 2] - x, bboxes[indices, 3] - y
+        jitter = rng.uniform(-0.1, 0.1, size=(len(indices), 2))
+        x1 = x + w * (0.1 + jitter[:, 0])
+        y1 = y + h * (0.1 + jitter[:, 1])
+        boxes = np.stack([x1, y1, x1 + w * 0.8, y1 + h * 0.8], axis=1).astype(int)
+        frames.append(make_detections(boxes, np.full(len(boxes), 0.9), np.full(len(boxes), 2)))
+    return frames
+
+
+def measure(function: Callable[[int], object], iterations: int, warmup: int = 2,
+            memory_iterations: int = 20) -> Dict[str, float]:
+    """
+    Times function(i) per iteration and traces its memory allocations.
+    :param memory_iterations: Calls made under tracemalloc (after the timed ones).
+    :return: Per-call timing statistics in milliseconds and the peak traced memory in KiB.
+    """
+    for i in range(min(warmup, iterations)):
+        function(i)
+
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        function(i)
+        samples[i] = time.perf_counter() - start
+
+    # Memory is traced in a separate pass, since tracemalloc slows allocations down
+    tracemalloc.start()
+    for i in range(min(iterations, memory_iterations)):
+        function(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples *= 1000
+    return {"iterations": iterations, "mean_ms": float(samples.mean()), "p50_ms": float(np.percentile(samples, 50)),
+            "p95_ms": float(np.percentile(samples, 95)), "max_ms": float(samples.max()),
+            "peak_memory_kib": peak / 1024}
+
+
+def bench_lot(num_spaces: int, args, workdir: str) -> Dict[str, Dict]:
+    """Runs every stage benchmark for one synthetic lot size."""
+    config_path = os.path.join(workdir, f"grid_{num_spaces}.yaml")
+    width, height = write_grid_config(config_path, num_spaces)
+    results = {}
+
+    # 1. Loading the config: parsing plus rasterizing the geometry (YAML parsing makes this slow for big
+    #    lots), and from the compiled zone cache written by the first cached load
+    results["load"] = measure(lambda i: ParkingLot(config_path, smoothing_frames=args.smoothing_frames,
+                                                   use_cache=False),
+                              iterations=args.load_iterations, warmup=0, memory_iterations=1)
+    parking_lot = ParkingLot(config_path, smoothing_frames=args.smoothing_frames)
+    results["load_cached"] = measure(lambda i: ParkingLot(config_path, smoothing_frames=args.smoothing_frames),
+                                     iterations=args.load_iterations, warmup=0, memory_iterations=1)
+    stream = make_detection_stream(parking_lot, args.frames, args.occupancy, args.churn, args.seed)
+
+    # 2. Occupancy logic per mode (includes the smoothed state update)
+    for mode in ("center", "overlap"):
+        logic = OccupancyLogic(parking_lot, mode=mode)
+        results[f"occupancy_{mode}"] = measure(lambda i: logic.process_frame(stream[i]), args.frames)
+
+    # Patch classifier mode on a noise frame containing the whole grid (patch remap, features and
+    # scoring; the cost does not depend on the weights, so they are random)
+    if width * height <= args.max_draw_pixels:
+        rng = np.random.default_rng(args.seed)
+        classifier = PatchClassifier(rng.standard_normal(FEATURE_COUNT), 0.0, np.zeros(FEATURE_COUNT),
+                                     np.ones(FEATURE_COUNT))
+        logic = OccupancyLogic(parking_lot, mode="classifier", classifier=classifier)
+        noise = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(2)]
+        results["occupancy_classifier"] = measure(lambda i: logic.process_image(noise[i % 2]), args.frames)
+
+    # 3. State updates alone: vectorized store update and the per-space ParkingSpace.update_state path
+    rng = np.random.default_rng(args.seed)
+    raw = rng.random((args.frames, num_spaces)) < args.occupancy
+    results["update_states"] = measure(lambda i: parking_lot.update_states(raw[i]), args.frames)
+    spaces = list(parking_lot.spaces.values())
+    per_space_frames = max(args.frames // 10, 3)
+    results["update_state_per_space"] = measure(
+        lambda i: [space.update_state(bool(occ), args.smoothing_frames) for space, occ in zip(spaces, raw[i])],
+        per_space_frames)
+
+    # 4. Status serialization
+    results["get_status"] = measure(lambda i: parking_lot.get_status(), args.frames)
+
+    # 5. Rendering onto a frame containing the whole grid
+    if width * height <= args.max_draw_pixels:
+        visualizer = Visualizer(parking_lot)
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+
+        def draw(i):
+            parking_lot.update_states(raw[i])
+            visualizer.draw(frame, stream[i])
+
+        results["draw"] = measure(draw, args.frames)
+        results["draw"]["frame_size"] = [width, height]
+    else:
+        logger.info(f"Skipping draw for {num_spaces} spaces: {width}x{height} frame exceeds --max-draw-pixels")
+
+    # 6. /status throughput through the FastAPI test client
+    if not args.skip_api:
+        results.update(bench_api(parking_lot, raw, args))
+    return results
+
+
+def bench_api(parking_lot: ParkingLot, raw: np.ndarray, args) -> Dict[str, Dict]:
+    try:
+        from fastapi.testclient import TestClient
+        from smartparking import api
+        from smartparking.status_snapshot import StatusPublisher
+        from smartparking.change_feed import ChangeFeed
+    except ImportError as e:
+        logger.warning(f"Skipping API benchmarks ({e})")
+        return {}
+
+    # Serve only this lot; a fresh change feed holds no listeners or events from the previous lot sizes
+    api.global_parking_lots.clear()
+    api.status_publisher = StatusPublisher()
+    api.change_feed = ChangeFeed()
+    api.init_api(parking_lot)
+    client = TestClient(api.app)
+
+    results = {"publish_status": measure(lambda i: (parking_lot.update_states(raw[i]), api.publish_status()),
+                                         args.frames)}
+    etag = client.get("/status").headers["ETag"]
+    for name, headers in (("api_status", {}), ("api_status_not_modified", {"If-None-Match": etag})):
+        stats = measure(lambda i: client.get("/status", headers=headers), args.requests)
+        stats["requests_per_second"] = 1000 / stats["mean_ms"] if stats["mean_ms"] else 0.0
+        results[name] = stats
+    results["api_status"]["body_bytes"] = len(client.get("/status").content)
+    return results
+
+
+def parse_args():
+    """Parses command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="SmartParking benchmarks: synthetic lots and detections, no model or video needed.")
+
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="Number of parking spaces of each synthetic lot.")
+
+    parser.add_argument("--frames", type=int, default=200,
+                        help="Synthetic frames per stage benchmark.")
+
+    parser.add_argument("--load-iterations", type=int, default=2,
+                        help="Timed config loads per lot (loading 10,000 spaces takes tens of seconds).")
+
+    parser.add_argument("--requests", type=int, default=200,
+                        help="Requests per API benchmark.")
+
+    parser.add_argument("--occupancy", type=float, default=0.6,
+                        help="Fraction of occupied bays in the synthetic stream.")
+
+    parser.add_argument("--churn", type=float, default=0.02,
+                        help="Fraction of bays that toggle per frame.")
+
+    parser.add_argument("--smoothing-frames", type=int, default=5,
+                        help="Temporal smoothing used by the lots.")
+
+    parser.add_argument("--max-draw-pixels", type=int, default=40_000_000,
+                        help="Skip the draw benchmark when the grid frame is larger than this.")
+
+    parser.add_argument("--skip-api", action="store_true",
+                        help="Do not benchmark the API.")
+
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the synthetic detection streams.")
+
+    parser.add_argument("--output", type=str, default="benchmarks/results.json",
+                        help="Where to write the JSON results.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "settings": vars(args),
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for num_spaces in args.sizes:
+            logger.info(f"Benchmarking a lot with {num_spaces} spaces")
+            results = bench_lot(num_spaces, args, workdir)
+            report["results"][str(num_spaces)] = results
+            for stage, stats in results.items():
+                logger.info(f"  {stage:<26} mean {stats['mean_ms']:9.3f}ms  p95 {stats['p95_ms']:9.3f}ms  "
+                            f"peak mem {stats['peak_memory_kib']:9.1f}KiB")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
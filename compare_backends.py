@@ -0,0 +1,173 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger('SmartParking.compare')
+
+# --- Dynamic imports from the smartparking package ---
+try:
+    import numpy as np
+    from smartparking.backends import BACKENDS, create_backend, read_sample_frames
+    from smartparking.detections import detection_boxes
+except ImportError as e:
+    logger.error(
+        "Failed to import SmartParking modules. Ensure you are running from the project root and requirements are installed.")
+    logger.error(f"Import Error: {e}")
+    sys.exit(1)
+
+
+def parse_args():
+    """Parses command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="SmartParking backend comparison: latency and detection agreement against the PyTorch model.")
+
+    parser.add_argument("--model", type=str, default="models/yolov8n.pt",
+                        help="Path to the trained YOLO model file (e.g., yolov8n.pt).")
+
+    parser.add_argument("--source", type=str, default="parkingvideo.mp4",
+                        help="Video to sample the test frames from.")
+
+    parser.add_argument("--frames", type=int, default=100,
+                        help="Number of test frames.")
+
+    parser.add_argument("--backends", type=str, nargs="+", default=["onnx", "openvino"], choices=BACKENDS,
+                        help="Backends compared with the torch baseline.")
+
+    parser.add_argument("--int8", action="store_true",
+                        help="Also compare the INT8 variants of the onnx/openvino backends.")
+
+    parser.add_argument("--calibration-frames", type=int, default=200,
+                        help="Number of INT8 calibration frames (sampled from --source).")
+
+    parser.add_argument("--imgsz", type=int, default=640,
+                        help="Inference image size.")
+
+    parser.add_argument("--threads", type=int, default=None,
+                        help="CPU threads used for inference.")
+
+    parser.add_argument("--conf", type=float, default=0.5,
+                        help="Confidence threshold.")
+
+    parser.add_argument("--match-iou", type=float, default=0.5,
+                        help="IoU at which a detection counts as agreeing with a baseline detection.")
+
+    parser.add_argument("--output", type=str, default=None,
+                        help="Also write the report to this JSON file.")
+    return parser.parse_args()
+
+
+def pairwise_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU matrix of two (n, 4) and (m, 4) box arrays."""
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersections = np.maximum(ix2 - ix1, 0) * np.maximum(iy2 - iy1, 0)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersections / np.maximum(area_a[:, None] + area_b[None, :] - intersections, 1e-9)
+
+
+def agreement(baseline: List[np.ndarray], candidate: List[np.ndarray], match_iou: float) -> Dict[str, float]:
+    """
+    Greedy one-to-one matching (same class, highest IoU first) of each frame's detections
+    against the baseline.
+    :return: Precision / recall / F1 relative to the baseline and the mean IoU of the matches.
+    """
+    matched, ious, total_baseline, total_candidate = 0, [], 0, 0
+    for reference, detections in zip(baseline, candidate):
+        total_baseline += len(reference)
+        total_candidate += len(detections)
+        if not len(reference) or not len(detections):
+            continue
+        iou = pairwise_iou(detection_boxes(reference).astype(np.float64),
+                           detection_boxes(detections).astype(np.float64))
+        iou[reference['cls'][:, None] != detections['cls'][None, :]] = 0.0
+        while True:
+            i, j = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[i, j] < match_iou:
+                break
+            matched += 1
+            ious.append(float(iou[i, j]))
+            iou[i, :] = 0.0
+            iou[:, j] = 0.0
+
+    precision = matched / total_candidate if total_candidate else 1.0
+    recall = matched / total_baseline if total_baseline else 1.0
+    return {"precision": precision, "recall": recall,
+            "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            "mean_iou": float(np.mean(ious)) if ious else 0.0,
+            "detections": total_candidate, "baseline_detections": total_baseline}
+
+
+def run(backend, frames: List[np.ndarray]) -> tuple:
+    """Detects every frame one by one (after one warmup call) and returns (detections, latencies in ms)."""
+    backend.predict([frames[0]])
+    detections, latencies = [], np.empty(len(frames))
+    for i, frame in enumerate(frames):
+        start = time.perf_counter()
+        detections.append(backend.predict([frame])[0])
+        latencies[i] = 1000 * (time.perf_counter() - start)
+    return detections, latencies
+
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.model):
+        logger.error(f"YOLO model not found at: {args.model}.")
+        sys.exit(1)
+
+    frames = read_sample_frames(args.source, args.frames)
+    logger.info(f"Comparing on {len(frames)} frames of {args.source}")
+
+    variants = [("torch", False)] + [(name, False) for name in args.backends if name != "torch"]
+    if args.int8:
+        variants += [(name, True) for name in args.backends if name != "torch"]
+
+    report, baseline = {}, None
+    for name, int8 in variants:
+        label = name + ("-int8" if int8 else "")
+        try:
+            backend = create_backend(args.model, name, args.conf, args.imgsz, args.threads, int8,
+                                     calibration_source=args.source, calibration_frames=args.calibration_frames)
+        except Exception as e:
+            # The PyTorch model is the reference of every speedup and agreement figure
+            if name == "torch":
+                logger.error(f"The PyTorch baseline could not be loaded: {e}")
+                sys.exit(1)
+            if not isinstance(e, ImportError):
+                raise
+            logger.warning(f"Skipping {label}: {e}")
+            continue
+        detections, latencies = run(backend, frames)
+        if baseline is None:
+            baseline = detections
+        report[label] = {"mean_ms": float(latencies.mean()), "p50_ms": float(np.percentile(latencies, 50)),
+                         "p95_ms": float(np.percentile(latencies, 95)),
+                         "agreement": agreement(baseline, detections, args.match_iou)}
+
+    torch_mean = report["torch"]["mean_ms"]
+    for label, result in report.items():
+        logger.info(f"  {label:<14} mean {result['mean_ms']:8.1f}ms  p95 {result['p95_ms']:8.1f}ms  "
+                    f"speedup {torch_mean / result['mean_ms']:5.2f}x  "
+                    f"recall {result['agreement']['recall']:.3f}  precision {result['agreement']['precision']:.3f}  "
+                    f"mean IoU {result['agreement']['mean_iou']:.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"model": args.model, "source": args.source, "frames": len(frames), "settings": vars(args),
+                       "results": report}, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import logging
 import time
 import sys
 import os
+import cv2
+from contextlib import closing
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO,
@@ -11,13 +13,24 @@ logging.basicConfig(level=logging.INFO,
 logger = logging.getLogger('SmartParking')
 
 # --- Dynamic imports from the smartparking package ---
+# The model stack (torch / onnxruntime / openvino) is imported by the detector backend and the
+# API stack (FastAPI / uvicorn) in start_api(), so a bad config fails before either is loaded.
 try:
     from smartparking.video_stream import VideoStream
-    from smartparking.detector import Detector
+    from smartparking.detector import Detector, scale_detections
+    from smartparking.detections import empty_detections
+    from smartparking.batching import FrameBatcher
+    from smartparking.roi import RoiPlanner
+    from smartparking.change_detector import ChangeDetector
     from smartparking.parking_lot import ParkingLot
     from smartparking.occupancy_logic import OccupancyLogic
+    from smartparking.patch_classifier import PatchClassifier
     from smartparking.visualizer import Visualizer
-    from smartparking.api import run_api_server, init_api
+    from smartparking.history import HistoryStore
+    from smartparking.recording import DetectionRecorder
+    from smartparking.metrics import metrics, RateMeter, COUNT_BUCKETS
+    from smartparking.config_watcher import ConfigWatcher
+    from smartparking.pipeline import FramePipeline, PIPELINE_POLICIES
 except ImportError as e:
     logger.error(
         "Failed to import SmartParking modules. Ensure you are running from the project root and requirements are installed.")
@@ -41,21 +54,279 @@ def parse_args():
     parser.add_argument("--model", type=str, default="models/yolov8n.pt",
                         help="Path to the trained YOLO model file (e.g., yolov8n.pt).")
 
+    parser.add_argument("--backend", type=str, default="torch", choices=["torch", "onnx", "openvino"],
+                        help="Inference backend. onnx/openvino export the model next to the .pt file on first use.")
+
+    parser.add_argument("--imgsz", type=int, default=640,
+                        help="Inference image size.")
+
+    parser.add_argument("--threads", type=int, default=None,
+                        help="CPU threads used for inference (default: the backend's choice).")
+
+    parser.add_argument("--int8", action="store_true",
+                        help="Use an INT8 model quantized on frames of --calibration-source (onnx/openvino).")
+
+    parser.add_argument("--calibration-source", type=str, default=None,
+                        help="Video to sample INT8 calibration frames from (default: --source).")
+
+    parser.add_argument("--calibration-frames", type=int, default=200,
+                        help="Number of INT8 calibration frames.")
+
     parser.add_argument("--api-port", type=int, default=8000,
                         help="Port for the FastAPI status API.")
 
     parser.add_argument("--smoothing-frames", type=int, default=5,
                         help="Number of consecutive frames required for a state change (temporal smoothing).")
+
+    parser.add_argument("--low-latency", action="store_true",
+                        help="Read frames on a background thread and always analyse the newest one (live cameras).")
+
+    parser.add_argument("--frame-interval", type=int, default=1,
+                        help="Analyse every Nth frame; the frames in between are skipped without decoding.")
+
+    parser.add_argument("--max-width", type=int, default=None,
+                        help="Downscale frames wider than this before detection (boxes are mapped back).")
+
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Number of frames per batched inference call (1 = detect frame by frame).")
+
+    parser.add_argument("--batch-wait-ms", type=float, default=50.0,
+                        help="Maximum time to wait for a batch to fill before running it anyway.")
+
+    parser.add_argument("--roi", action="store_true",
+                        help="Only run detection on crops covering the configured parking spaces.")
+
+    parser.add_argument("--roi-margin", type=float, default=0.25,
+                        help="Growth of each space's box (fraction of its size) when planning ROI crops.")
+
+    parser.add_argument("--tile-size", type=int, default=None,
+                        help="With --roi, split crops larger than this many pixels into overlapping tiles.")
+
+    parser.add_argument("--tile-overlap", type=float, default=0.2,
+                        help="Overlap between neighbouring tiles (fraction of --tile-size).")
+
+    parser.add_argument("--skip-static", action="store_true",
+                        help="Skip detection on frames where no parking space changed (states are carried forward).")
+
+    parser.add_argument("--change-threshold", type=float, default=12.0,
+                        help="Mean gray-level change inside a space that triggers detection (with --skip-static).")
+
+    parser.add_argument("--max-stale-frames", type=int, default=50,
+                        help="Run detection at least every N frames, even without change (with --skip-static).")
+
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without any visualization or OpenCV window (servers without a display).")
+
+    parser.add_argument("--preview-fps", type=float, default=0.0,
+                        help="Maximum preview rendering rate (0 = render every analysed frame).")
+
+    parser.add_argument("--occupancy-mode", type=str, default="center", choices=["center", "overlap", "classifier"],
+                        help="'center': detection center inside the space. 'overlap': area overlap above a threshold. "
+                             "'classifier': per-space patch classifier instead of the detector (see train_classifier.py).")
+
+    parser.add_argument("--classifier", type=str, default="models/space_classifier.npz",
+                        help="Trained patch classifier for --occupancy-mode classifier.")
+
+    parser.add_argument("--classifier-threshold", type=float, default=None,
+                        help="Occupancy probability threshold of the classifier (default: the one saved with it).")
+
+    parser.add_argument("--overlap-metric", type=str, default="coverage", choices=["coverage", "iou"],
+                        help="Overlap metric for --occupancy-mode overlap: fraction of the space covered, or IoU.")
+
+    parser.add_argument("--overlap-threshold", type=float, default=0.5,
+                        help="Default overlap threshold (spaces can override it with 'overlap_threshold' in the config).")
+
+    parser.add_argument("--history-db", type=str, default=None,
+                        help="Record state transitions and occupancy rollups to this SQLite file (enables /history).")
+
+    parser.add_argument("--metrics-log-interval", type=float, default=0.0,
+                        help="Log a summary of the stage latencies every N seconds (0 = off; always on /metrics).")
+
+    parser.add_argument("--log-detections", action="store_true",
+                        help="Log every detected vehicle (debugging).")
+
+    parser.add_argument("--watch-config", type=float, default=0.0,
+                        help="Check the zone config every N seconds and hot-reload it when it changes (0 = off).")
+
+    parser.add_argument("--record", type=str, default=None,
+                        help="Record the detections of every frame to this file for offline replay (see sweep.py).")
+
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Run decoding, detection and rendering in separate processes over a shared memory frame ring.")
+
+    parser.add_argument("--pipeline-slots", type=int, default=8,
+                        help="Frames in the --pipeline ring (bounds the frames in flight).")
+
+    parser.add_argument("--pipeline-policy", type=str, default="block", choices=PIPELINE_POLICIES,
+                        help="When a --pipeline stage is behind: 'block' waits (every frame is analysed and drawn), "
+                             "'drop' sheds frames (live cameras).")
+
+    parser.add_argument("--pipeline-report-interval", type=float, default=10.0,
+                        help="Log the --pipeline queue depths every N seconds (0 = off; always on /metrics).")
     return parser.parse_args()
 
 
+def iter_detections(video_stream, detector, batch_size: int, batch_wait_ms: float, roi_planner=None,
+                    change_detector=None):
+    """
+    Yields (frame, detections) for every frame of the stream, with boxes in source-frame coordinates.
+    With batch_size > 1, frames are grouped (bounded by batch_wait_ms) and detected in one forward pass.
+    With a RoiPlanner, only the crops covering the parking spaces are analysed.
+    With a ChangeDetector, frames without relevant change are not analysed and yield detections=None.
+    Without a detector (classifier mode), analysed frames yield empty detections.
+    """
+    capture_time = metrics.stage("capture")
+    detect_time = metrics.stage("detect")
+
+    def read_frames():
+        generator = video_stream.frame_generator()
+        while True:
+            start = time.perf_counter()
+            item = next(generator, None)
+            if item is None:
+                return
+            capture_time.observe(time.perf_counter() - start)
+            ret, frame = item
+            if ret:
+                yield frame
+
+    def detect(batch):
+        if detector is None:
+            return [empty_detections() for _ in batch]
+        with detect_time.time():
+            if roi_planner is not None:
+                return detector.detect_roi(batch, roi_planner.crops_for(batch[0].shape, video_stream.scale))
+            if len(batch) == 1:
+                return [detector.detect(batch[0])]
+            return detector.detect_batch(batch)
+
+    frames = read_frames()
+
+    batches = ([frame] for frame in frames) if batch_size <= 1 else \
+        FrameBatcher(max_batch_size=batch_size, max_wait_ms=batch_wait_ms).batches(frames)
+    # Closing the batches joins the batcher's reader thread, so the capture is idle once this generator closes
+    with closing(batches):
+        for batch in batches:
+            if change_detector is None:
+                needs_detection = [True] * len(batch)
+            else:
+                needs_detection = [change_detector.should_run(frame, video_stream.scale) for frame in batch]
+            analysed = [frame for frame, needed in zip(batch, needs_detection) if needed]
+            results = iter(detect(analysed) if analysed else [])
+
+            for frame, needed in zip(batch, needs_detection):
+                yield frame, scale_detections(next(results), video_stream.scale) if needed else None
+
+
+def run_pipeline(args, parking_lot, occupancy_logic, publish_status, recorder):
+    """
+    --pipeline: decoding, detection and rendering run in their own processes. This process only
+    applies the occupancy logic to the detections and publishes the results.
+    """
+    occupancy_time, frame_time = metrics.stage("occupancy"), metrics.stage("frame")
+    frames_processed = metrics.counter("smartparking_frames_processed_total")
+    frames_analysed = metrics.counter("smartparking_frames_analysed_total")
+    state_flips = metrics.counter("smartparking_state_flips_total")
+    detections_per_frame = metrics.histogram("smartparking_detections_per_frame", buckets=COUNT_BUCKETS)
+    latency_time = metrics.histogram("smartparking_pipeline_latency_seconds",
+                                     "Capture-to-occupancy latency of --pipeline frames.")
+    fps_meter = RateMeter()
+    metrics.gauge_function("smartparking_fps", "Effective processing rate (frames per second).", fps_meter.rate)
+
+    pipeline = FramePipeline(
+        args.source, config_path=args.config, slots=args.pipeline_slots, policy=args.pipeline_policy,
+        batch_size=args.batch_size, render=not args.headless, preview_fps=args.preview_fps,
+        detector_options={'model_path': args.model, 'log_detections': args.log_detections, 'backend': args.backend,
+                          'imgsz': args.imgsz, 'threads': args.threads, 'int8': args.int8,
+                          'calibration_source': args.calibration_source or args.source,
+                          'calibration_frames': args.calibration_frames},
+        stream_options={'low_latency': args.low_latency, 'frame_interval': args.frame_interval,
+                        'max_width': args.max_width})
+
+    processed = 0
+    for stage in ("detect", "occupancy", "render"):
+        metrics.gauge_function(f"smartparking_pipeline_{stage}_queue_depth",
+                               f"Frames waiting for or in the --pipeline {stage} stage.",
+                               lambda stage=stage: pipeline.queue_depths(processed)[stage])
+    metrics.gauge_function("smartparking_pipeline_frames_dropped_total", "Frames shed by the --pipeline drop policy.",
+                           lambda: pipeline.stats()['dropped_decode'] + pipeline.stats()['dropped_render'],
+                           kind="counter")
+
+    pipeline.start(parking_lot)
+    last_report = time.monotonic()
+    try:
+        for slot, frame_number, capture_time, detections in pipeline.results():
+            start_time = time.perf_counter()
+
+            # Swap in reloaded zones between frames, so a frame is never evaluated against two geometries
+            if parking_lot.apply_pending_reload():
+                publish_status()
+            if recorder is not None:
+                recorder.write(frame_number, time.time(), detections)
+
+            with occupancy_time.time():
+                changed = occupancy_logic.process_frame(detections)
+            frames_analysed.inc()
+            detections_per_frame.observe(len(detections))
+            state_flips.inc(len(changed))
+            if len(changed):
+                publish_status()
+
+            # Hand the frame on to the renderer (or free its slot)
+            pipeline.release(slot, detections, parking_lot)
+            processed += 1
+            latency_time.observe(time.monotonic() - capture_time)
+            frame_time.observe(time.perf_counter() - start_time)
+            frames_processed.inc()
+            fps_meter.tick()
+
+            now = time.monotonic()
+            if args.pipeline_report_interval > 0 and now - last_report >= args.pipeline_report_interval:
+                last_report = now
+                depths = pipeline.queue_depths(processed)
+                logger.info(f"Pipeline queues: detect {depths['detect']} | occupancy {depths['occupancy']} | "
+                            f"render {depths['render']} | {fps_meter.rate():.1f} FPS")
+    except RuntimeError as e:
+        # A failed decoder or detector must not look like the end of the video
+        logger.error(f"Pipeline failed: {e}")
+        sys.exit(1)
+    finally:
+        pipeline.stop()
+        logger.info(f"Pipeline frames: {', '.join(f'{name} {value}' for name, value in pipeline.stats().items())}")
+
+
+def start_api(parking_lot, history, port: int):
+    """Imports and starts the API server. :return: The function that publishes a new status snapshot."""
+    try:
+        from smartparking.api import run_api_server, init_api, init_history, enable_reload, publish_status
+    except ImportError as e:
+        logger.error("Failed to import the API modules. Ensure the requirements are installed.")
+        logger.error(f"Import Error: {e}")
+        sys.exit(1)
+
+    if history is not None:
+        init_history(history)
+    init_api(parking_lot)
+    # The processing loop below applies staged reloads, so POST /lots/default/reload is safe
+    enable_reload("default")
+    run_api_server(port=port)
+    return publish_status
+
+
 def main():
     args = parse_args()
 
     # 1. Initialization and Setup
     logger.info("--- SmartParking System Starting ---")
 
-    if not os.path.exists(args.model):
+    classifier_mode = args.occupancy_mode == "classifier"
+    if classifier_mode and not os.path.exists(args.classifier):
+        logger.error(f"Patch classifier not found at: {args.classifier}. Train one with train_classifier.py.")
+        sys.exit(1)
+    if args.pipeline and (classifier_mode or args.roi or args.skip_static):
+        logger.error("--pipeline does not support --occupancy-mode classifier, --roi or --skip-static.")
+        sys.exit(1)
+    if not classifier_mode and not os.path.exists(args.model):
         logger.error(
             f"YOLO model not found at: {args.model}. Please download a YOLOv8 model (e.g., yolov8n.pt) and place it in the models/ directory.")
         sys.exit(1)
@@ -68,53 +339,137 @@ def main():
             sys.exit(1)
 
         # Initialize core components
-        detector = Detector(model_path=args.model)
-        occupancy_logic = OccupancyLogic(parking_lot=parking_lot)
-        visualizer = Visualizer(parking_lot=parking_lot)
+        # ROI crops of a frame are batched as well, so allow at least a few images per forward pass
+        detector = None if classifier_mode or args.pipeline else Detector(model_path=args.model, max_batch_size=max(args.batch_size, 8),
+                            log_detections=args.log_detections, backend=args.backend, imgsz=args.imgsz,
+                            threads=args.threads, int8=args.int8,
+                            calibration_source=args.calibration_source or args.source,
+                            calibration_frames=args.calibration_frames)
+        classifier = PatchClassifier.load(args.classifier, args.classifier_threshold) if classifier_mode else None
+        occupancy_logic = OccupancyLogic(parking_lot=parking_lot, mode=args.occupancy_mode,
+                                         overlap_metric=args.overlap_metric,
+                                         overlap_threshold=args.overlap_threshold, classifier=classifier)
+        visualizer = None if args.headless or args.pipeline else Visualizer(parking_lot=parking_lot)
+        roi_planner = RoiPlanner(parking_lot, margin=args.roi_margin, tile_size=args.tile_size,
+                                 tile_overlap=args.tile_overlap) if args.roi else None
+        change_detector = ChangeDetector(parking_lot, space_threshold=args.change_threshold,
+                                         max_stale_frames=args.max_stale_frames) if args.skip_static else None
+        history = HistoryStore(args.history_db) if args.history_db else None
+        recorder = DetectionRecorder(args.record, metadata={
+            'source': args.source, 'config': args.config, 'model': args.model,
+            'frame_interval': args.frame_interval, 'max_width': args.max_width, 'roi': args.roi,
+            'skip_static': args.skip_static}) if args.record else None
 
     except Exception as e:
         logger.error(f"Application setup failed: {e}")
         sys.exit(1)
 
     # 2. Start API Server in a separate thread
-    init_api(parking_lot)
-    api_thread = run_api_server(port=args.api_port)
+    publish_status = start_api(parking_lot, history, args.api_port)
+    watcher = ConfigWatcher(parking_lot, interval=args.watch_config) if args.watch_config > 0 else None
+    if watcher is not None:
+        watcher.start()
+
+    # Per-stage timers and counters, served on /metrics
+    occupancy_time, draw_time, frame_time = metrics.stage("occupancy"), metrics.stage("draw"), metrics.stage("frame")
+    frames_processed = metrics.counter("smartparking_frames_processed_total", "Frames through the processing loop.")
+    frames_analysed = metrics.counter("smartparking_frames_analysed_total", "Frames on which detection ran.")
+    state_flips = metrics.counter("smartparking_state_flips_total", "Official space state changes.")
+    detections_per_frame = metrics.histogram("smartparking_detections_per_frame", "Vehicles detected per analysed frame.",
+                                             buckets=COUNT_BUCKETS)
+    fps_meter = RateMeter()
+    metrics.gauge_function("smartparking_fps", "Effective processing rate (frames per second).", fps_meter.rate)
+    metrics.start_log_summary(args.metrics_log_interval)
 
     # 3. Main Video Processing Loop
+    last_preview = 0.0  # Time of the last rendered preview frame (0 = no window opened yet)
     try:
+        if args.pipeline:
+            run_pipeline(args, parking_lot, occupancy_logic, publish_status, recorder)
+            return
+
         # Use context manager for graceful video stream release
-        with VideoStream(source=args.source) as video_stream:
+        # The detection generator is closed before the stream, so no thread still reads the capture on release
+        with VideoStream(source=args.source, low_latency=args.low_latency, frame_interval=args.frame_interval,
+                         max_width=args.max_width) as video_stream, \
+                closing(iter_detections(video_stream, detector, args.batch_size, args.batch_wait_ms,
+                                        roi_planner, change_detector)) as detection_stream:
 
             # Use source FPS to calculate a better frame processing delay
             # If FPS is 30, delay should be around 1000/30 = 33ms
+            # In low-latency mode the reader thread already paces the frames.
             fps = video_stream.get_fps()
-            delay_ms = int(1000 / fps) if fps > 0 else 1
+            delay_ms = int(1000 * args.frame_interval / fps) if fps > 0 and not args.low_latency else 1
 
             logger.info(f"Video source FPS: {fps:.2f}. Using delay of {delay_ms}ms.")
 
-            for ret, frame in video_stream.frame_generator():
-                if not ret:
-                    break
-
-                start_time = time.time()
-
-                # A. Detection
-                detections = detector.detect(frame)
-
-                # B. Occupancy Logic
-                occupancy_logic.process_frame(detections)
-
-                # C. Visualization
-                visual_frame = visualizer.draw(frame, detections)
-                visualizer.show_frame(visual_frame)
-
-                # D. Control (Quit check)
-                if visualizer.wait_for_key(delay=delay_ms):
-                    break
-
-                # Logging processing time (optional, for optimization)
-                processing_time = (time.time() - start_time) * 1000  # in ms
-                # logger.debug(f"Frame processed in {processing_time:.2f}ms")
+            metrics.gauge_function("smartparking_frames_dropped_total", "Frames dropped by the low-latency reader.",
+                                   lambda: video_stream.get_stats()['dropped'], kind="counter")
+            metrics.gauge_function("smartparking_frames_skipped_total", "Frames skipped by --frame-interval.",
+                                   lambda: video_stream.get_stats()['skipped'], kind="counter")
+
+            # The preview is rendered at its own rate, independent of the analysis rate
+            preview_interval = 1.0 / args.preview_fps if args.preview_fps > 0 else 0.0
+
+            # A. Detection (single frames, or batches of consecutive frames)
+            last_detections = empty_detections()
+            frame_number = 0
+            for frame, detections in detection_stream:
+                start_time = time.perf_counter()
+
+                # Swap in reloaded zones between frames, so a frame is never evaluated against two geometries
+                if parking_lot.apply_pending_reload():
+                    publish_status()
+                if recorder is not None:
+                    recorder.write(frame_number, time.time(), detections)
+                frame_number += 1
+
+                # B. Occupancy Logic (unchanged scenes carry the last analysed result forward)
+                with occupancy_time.time():
+                    if detections is None:
+                        changed = occupancy_logic.carry_forward()
+                        detections = last_detections
+                    elif classifier_mode:
+                        changed = occupancy_logic.process_image(frame, video_stream.scale)
+                        frames_analysed.inc()
+                    else:
+                        changed = occupancy_logic.process_frame(detections)
+                        last_detections = detections
+                        frames_analysed.inc()
+                        detections_per_frame.observe(len(detections))
+                state_flips.inc(len(changed))
+
+                # Publish a new API snapshot only when a space actually flipped
+                if len(changed):
+                    publish_status()
+
+                # C. Visualization (skipped entirely in headless mode)
+                if visualizer is not None:
+                    now = time.monotonic()
+                    if now - last_preview >= preview_interval:
+                        last_preview = now
+                        if video_stream.scale != 1.0:
+                            frame = cv2.resize(frame, None, fx=video_stream.scale, fy=video_stream.scale)
+                        with draw_time.time():
+                            visual_frame = visualizer.draw(frame, detections)
+                        visualizer.show_frame(visual_frame)
+
+                    # D. Control (Quit check)
+                    if visualizer.wait_for_key(delay=delay_ms):
+                        break
+
+                # Processing time of the frame after detection (occupancy, publishing, preview)
+                frame_time.observe(time.perf_counter() - start_time)
+                frames_processed.inc()
+                fps_meter.tick()
+
+            stats = video_stream.get_stats()
+            logger.info(f"Frames delivered: {stats['delivered']} | skipped: {stats['skipped']} | "
+                        f"dropped: {stats['dropped']} | avg latency: {stats['avg_latency_ms']:.1f}ms | "
+                        f"max latency: {stats['max_latency_ms']:.1f}ms")
+            if change_detector is not None:
+                logger.info(f"Static-scene skip rate: {100 * change_detector.skip_rate:.1f}% "
+                            f"({change_detector.frames_skipped}/{change_detector.frames_checked} frames)")
 
     except IOError as e:
         logger.error(f"Video stream error: {e}")
@@ -123,7 +478,15 @@ def main():
     finally:
         logger.info("Main processing loop finished. Cleaning up.")
         # Ensure OpenCV windows are destroyed
-        visualizer.close_window()
+        if visualizer is not None and last_preview:
+            visualizer.close_window()
+        # Write the remaining history before exiting
+        if history is not None:
+            history.close()
+        if recorder is not None:
+            recorder.close()
+        if watcher is not None:
+            watcher.stop()
 
         # NOTE: The API thread is a daemon thread, so it will exit when the main thread exits.
         logger.info("--- SmartParking System Shut Down ---")
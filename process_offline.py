@@ -0,0 +1,168 @@
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger('SmartParking.offline')
+
+# --- Dynamic imports from the smartparking package ---
+try:
+    from smartparking.parking_lot import ParkingLot
+    from smartparking.offline import (GAP_STATE, VideoJob, init_worker, output_path_for, plan_segments,
+                                      process_segment, video_info)
+except ImportError as e:
+    logger.error(
+        "Failed to import SmartParking modules. Ensure you are running from the project root and requirements are installed.")
+    logger.error(f"Import Error: {e}")
+    sys.exit(1)
+
+
+def parse_args():
+    """Parses command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="SmartParking offline mode: per-space occupancy timelines of recorded footage, as fast as the hardware allows.")
+
+    parser.add_argument("--videos", type=str, nargs="+", required=True,
+                        help="Recorded video files to process.")
+
+    parser.add_argument("--config", type=str, default="config/parking_zones.yaml",
+                        help="Path to the parking zones YAML configuration file.")
+
+    parser.add_argument("--model", type=str, default="models/yolov8n.pt",
+                        help="Path to the trained YOLO model file (e.g., yolov8n.pt).")
+
+    parser.add_argument("--backend", type=str, default="torch", choices=["torch", "onnx", "openvino"],
+                        help="Inference backend.")
+
+    parser.add_argument("--imgsz", type=int, default=640,
+                        help="Inference image size.")
+
+    parser.add_argument("--threads", type=int, default=None,
+                        help="CPU threads per worker process (default: CPU count / processes).")
+
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Seconds of video between analysed frames; frames in between are skipped without decoding where possible.")
+
+    parser.add_argument("--segment-minutes", type=float, default=10.0,
+                        help="Length of the segments long videos are split into for parallel processing.")
+
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Worker processes (default: CPU count, at most the number of segments).")
+
+    parser.add_argument("--batch-size", type=int, default=8,
+                        help="Frames per forward pass.")
+
+    parser.add_argument("--max-width", type=int, default=None,
+                        help="Downscale frames wider than this before detection.")
+
+    parser.add_argument("--smoothing-frames", type=int, default=5,
+                        help="Consecutive analysed frames required to change a space's state.")
+
+    parser.add_argument("--occupancy-mode", type=str, default="center", choices=["center", "overlap"],
+                        help="Occupancy rule (see main.py).")
+
+    parser.add_argument("--overlap-metric", type=str, default="coverage", choices=["coverage", "iou"],
+                        help="Overlap metric in 'overlap' mode.")
+
+    parser.add_argument("--overlap-threshold", type=float, default=0.5,
+                        help="Default overlap threshold in 'overlap' mode.")
+
+    parser.add_argument("--start-time", type=float, default=0.0,
+                        help="Time of the first frame (e.g. Unix time the recording started); timeline times are offset by it.")
+
+    parser.add_argument("--format", type=str, default="csv", choices=["csv", "parquet"],
+                        help="Timeline file format (parquet needs pyarrow).")
+
+    parser.add_argument("--output-dir", type=str, default=None,
+                        help="Directory for the timelines (default: next to each video).")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.model):
+        logger.error(f"YOLO model not found at: {args.model}.")
+        sys.exit(1)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # 1. Compile the zones once here, so every worker loads them from the compiled cache
+    try:
+        space_ids = ParkingLot(args.config).geometry.space_ids
+    except Exception as e:
+        logger.error(f"Failed to load parking configuration: {e}")
+        sys.exit(1)
+
+    # 2. Plan the segments of every video
+    jobs: Dict[str, VideoJob] = {}
+    tasks = []
+    for path in args.videos:
+        try:
+            total_frames, fps = video_info(path)
+        except IOError as e:
+            logger.error(f"Skipping {path}: {e}")
+            continue
+        if total_frames <= 0 or fps <= 0:
+            logger.error(f"Skipping {path}: unknown frame count or frame rate")
+            continue
+        step = max(1, int(round(args.interval * fps)))
+        segments = plan_segments(total_frames, step, int(args.segment_minutes * 60 * fps))
+        jobs[path] = VideoJob(path, segments, step, fps, output_path_for(path, args.output_dir, args.format),
+                              args.start_time)
+        tasks += [(path, start, end, step) for start, end in segments]
+        logger.info(f"{path}: {total_frames} frames at {fps:.2f} FPS, every {step}th frame, {len(segments)} segment(s)")
+
+    if not tasks:
+        logger.error("Nothing to process.")
+        sys.exit(1)
+
+    # 3. Split the cores between the workers instead of letting every model use all of them
+    processes = min(args.processes or os.cpu_count() or 1, len(tasks))
+    threads = args.threads or max(1, (os.cpu_count() or 1) // processes)
+    options = {"config": args.config, "model": args.model, "backend": args.backend, "imgsz": args.imgsz,
+               "threads": threads, "batch_size": args.batch_size, "max_width": args.max_width,
+               "occupancy_mode": args.occupancy_mode, "overlap_metric": args.overlap_metric,
+               "overlap_threshold": args.overlap_threshold}
+    logger.info(f"Processing {len(tasks)} segment(s) with {processes} process(es), {threads} thread(s) each")
+
+    # 4. Process the segments; a video's timeline is written as soon as all its segments are done.
+    #    Failed segments are logged and left as 'unknown' gaps in the timeline.
+    failed = False
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker, initargs=(options,)) as executor:
+        futures = {executor.submit(process_segment, *task): task for task in tasks}
+        for future in as_completed(futures):
+            path, start, end, _ = futures[future]
+            job = jobs[path]
+            try:
+                job.add(*future.result())
+                logger.info(f"{path}: {len(job.results)}/{len(job.segments)} segment(s) done")
+            except Exception as e:
+                logger.error(f"Segment {start}-{end} of {path} failed: {e}")
+                job.fail(start, end)
+                failed = True
+            if not job.done:
+                continue
+            if not job.results:
+                logger.error(f"{path}: every segment failed, no timeline written")
+                continue
+            stats = job.finish(space_ids, args.smoothing_frames)
+            logger.info(f"{path}: {stats['frames']} frames, {stats['detections']} detections, "
+                        f"{stats['flips']} state changes in {stats['elapsed']:.1f}s "
+                        f"({stats['speed']:.1f}x real time) -> {job.output_path}")
+            if job.failed:
+                logger.warning(f"{path}: {len(job.failed)} failed segment(s) are '{GAP_STATE}' in the timeline: "
+                               f"{', '.join(f'frames {first}-{last}' for first, last in sorted(job.failed.items()))}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,314 @@
+import time
 import threading
 import uvicorn
 import logging
-from fastapi import FastAPI
-from smartparking.parking_lot import ParkingLot
+from typing import AsyncGenerator, Dict, Optional
+from fastapi import FastAPI, HTTPException, Header, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from smartparking.parking_lot import ParkingLot, STATE_NAMES
+from smartparking.status_snapshot import StatusPublisher, StatusSnapshot
+from smartparking.change_feed import ChangeFeed
+from smartparking.history import HistoryStore, ROLLUPS, AGGREGATE_GROUPS
+from smartparking.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 # Global variable to hold the FastAPI application instance
-# We use this global access to the ParkingLot instance
+# We use this global access to the ParkingLot instances (one per camera)
 app = FastAPI(title="SmartParking API")
 global_parking_lot: ParkingLot = None
+global_parking_lots: Dict[str, ParkingLot] = {}
+# Versioned, pre-serialized status snapshots served by the handlers
+status_publisher = StatusPublisher()
+# Sequenced state changes pushed to /events and /ws/events subscribers
+change_feed = ChangeFeed()
+# Optional occupancy history (see init_history)
+history_store: Optional[HistoryStore] = None
+# Lots whose zone config can be reloaded through the API (see enable_reload)
+reloadable_lots: Dict[str, ParkingLot] = {}
 
 
-def init_api(parking_lot_instance: ParkingLot):
+class RequestTimingMiddleware:
+    """ASGI middleware timing every HTTP request until its response starts, per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                # The router has resolved the route by now; use its template to keep the label set small
+                route = getattr(scope.get("route"), "path", "unmatched")
+                metrics.histogram("smartparking_api_request_seconds", "Time until the API response starts.",
+                                  route=route).observe(time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+app.add_middleware(RequestTimingMiddleware)
+
+
+def init_api(parking_lot_instance: ParkingLot, lot_id: str = "default"):
     """Initializes the global parking lot instance for the API to use."""
     global global_parking_lot
     global_parking_lot = parking_lot_instance
+    register_lot(lot_id, parking_lot_instance)
+
+
+def register_lot(lot_id: str, parking_lot_instance: ParkingLot):
+    """Adds a parking lot (e.g. one camera) to the API under the given id."""
+    global_parking_lots[lot_id] = parking_lot_instance
+    status_publisher.register(lot_id, parking_lot_instance)
+    change_feed.attach(lot_id, parking_lot_instance)
+    if history_store is not None:
+        history_store.attach(lot_id, parking_lot_instance)
+
+
+def init_history(store: HistoryStore):
+    """Enables the /history endpoints and records the lots registered from now on (call before register_lot)."""
+    global history_store
+    history_store = store
+
+
+def enable_reload(lot_id: str):
+    """
+    Allows POST /lots/{lot_id}/reload for a lot whose processing loop applies staged reloads
+    (ParkingLot.apply_pending_reload). Lots mirrored from worker processes must not be reloaded here.
+    """
+    reloadable_lots[lot_id] = global_parking_lots[lot_id]
+
+
+def publish_status(lot_id: str = "default"):
+    """
+    Publishes a new status snapshot of the lot. Called by the processing loop after a state change;
+    the API never reads the live lot state itself.
+    """
+    status_publisher.publish(lot_id)
+
+
+def _json_response(body: bytes, etag: str, if_none_match: Optional[str]) -> Response:
+    """Returns the pre-serialized body, or 304 Not Modified if the client already has this version."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _status_response(snapshot: Optional[StatusSnapshot], state: Optional[str],
+                     if_none_match: Optional[str]) -> Response:
+    if snapshot is None:
+        raise HTTPException(status_code=500, detail="Parking lot data not initialized")
+    if state is None:
+        return _json_response(snapshot.body, snapshot.etag, if_none_match)
+    if state not in STATE_NAMES:
+        raise HTTPException(status_code=400, detail=f"Unknown state '{state}'. Expected one of {list(STATE_NAMES)}.")
+    return _json_response(*snapshot.filtered(state), if_none_match)
+
+
+def _space_response(snapshot: Optional[StatusSnapshot], space_id: str, if_none_match: Optional[str]) -> Response:
+    view = snapshot.space(space_id) if snapshot is not None else None
+    if view is None:
+        raise HTTPException(status_code=404, detail=f"Unknown parking space '{space_id}'")
+    return _json_response(*view, if_none_match)
+
+
+def _get_snapshot(lot_id: str) -> StatusSnapshot:
+    snapshot = status_publisher.snapshot(lot_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Unknown parking lot '{lot_id}'")
+    return snapshot
 
 
 @app.get("/status")
-def get_parking_status():
+def get_parking_status(state: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
     """
     Returns the current occupancy status of the entire parking lot.
+    With several lots registered, returns the aggregate over all lots; every space
+    then carries the id of its lot.
+    Use ?state=free or ?state=occupied to only list spaces in that state.
     """
-    if global_parking_lot is None:
-        return {"error": "Parking lot data not initialized"}, 500
+    return _status_response(status_publisher.snapshot(), state, if_none_match)
+
+
+@app.get("/status/spaces/{space_id}")
+def get_space_status(space_id: str, if_none_match: Optional[str] = Header(None)):
+    """Returns the state of a single space (use /lots/{lot_id}/spaces/{space_id} with several lots)."""
+    if len(status_publisher.lots) > 1:
+        raise HTTPException(status_code=400, detail="Several lots are registered; use /lots/{lot_id}/spaces/{space_id}")
+    return _space_response(status_publisher.snapshot(), space_id, if_none_match)
+
+
+@app.get("/lots")
+def get_lots():
+    """Returns the occupancy summary of every registered lot."""
+    return [{"id": lot_id, **snapshot.summary} for lot_id, snapshot in status_publisher.snapshots().items()]
+
+
+@app.get("/lots/{lot_id}/status")
+def get_lot_status(lot_id: str, state: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    """Returns the occupancy status of a single lot."""
+    return _status_response(_get_snapshot(lot_id), state, if_none_match)
+
 
-    # ParkingLot.get_status() already returns the required JSON structure
-    return global_parking_lot.get_status()
+@app.get("/lots/{lot_id}/spaces/{space_id}")
+def get_lot_space_status(lot_id: str, space_id: str, if_none_match: Optional[str] = Header(None)):
+    """Returns the state of a single space of a lot."""
+    return _space_response(_get_snapshot(lot_id), space_id, if_none_match)
+
+
+def _reload(lot_id: str) -> Dict:
+    lot = reloadable_lots.get(lot_id)
+    if lot is None:
+        if lot_id in global_parking_lots:
+            raise HTTPException(status_code=409, detail=f"Parking lot '{lot_id}' cannot be reloaded through the API")
+        raise HTTPException(status_code=404, detail=f"Unknown parking lot '{lot_id}'")
+    try:
+        staged = lot.stage_reload()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zone config: {e}")
+    return {"lot": lot_id, "config": lot.config_path, "reloaded": staged}
+
+
+@app.post("/lots/{lot_id}/reload")
+def reload_lot(lot_id: str):
+    """
+    Re-reads the lot's zone config. The new zones are swapped in before the next frame; spaces that
+    keep their id keep their state. "reloaded" is false when the file is unchanged.
+    """
+    return _reload(lot_id)
+
+
+@app.post("/reload")
+def reload_all():
+    """Reloads the zone config of every reloadable lot."""
+    return [_reload(lot_id) for lot_id in list(reloadable_lots)]
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Processing and API metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _history_query(lot: Optional[str], start: Optional[float], end: Optional[float],
+                   default_range: float) -> tuple:
+    """Validates the common history parameters and fills in the defaults (the only lot, the last default_range seconds)."""
+    if history_store is None:
+        raise HTTPException(status_code=503, detail="History is not enabled (start with --history-db)")
+    if lot is None:
+        if len(status_publisher.lots) != 1:
+            raise HTTPException(status_code=400, detail="Several lots are registered; pass ?lot=<lot_id>")
+        lot = next(iter(status_publisher.lots))
+    elif lot not in status_publisher.lots:
+        raise HTTPException(status_code=404, detail=f"Unknown parking lot '{lot}'")
+    end = time.time() if end is None else end
+    start = end - default_range if start is None else start
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'start' must be before 'end'")
+    return lot, start, end
+
+
+@app.get("/history/occupancy")
+def get_history_occupancy(lot: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+                          resolution: str = "hour"):
+    """
+    Time-weighted occupancy per minute or hour between start and end (Unix timestamps,
+    default: the last 24 hours), read from the pre-aggregated rollups.
+    """
+    if resolution not in ROLLUPS:
+        raise HTTPException(status_code=400, detail=f"Unknown resolution '{resolution}'. Expected one of {list(ROLLUPS)}.")
+    lot, start, end = _history_query(lot, start, end, 24 * 3600)
+    return {"lot": lot, "start": start, "end": end, "resolution": resolution,
+            "buckets": history_store.occupancy(lot, start, end, resolution)}
+
+
+@app.get("/history/aggregate")
+def get_history_aggregate(lot: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+                          group_by: str = "hour_of_day"):
+    """
+    Average occupancy grouped by hour of day, weekday (0 = Sunday) or day between start and end
+    (default: the last 7 days), e.g. the average occupancy per hour last week.
+    """
+    if group_by not in AGGREGATE_GROUPS:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown group_by '{group_by}'. Expected one of {list(AGGREGATE_GROUPS)}.")
+    lot, start, end = _history_query(lot, start, end, 7 * 24 * 3600)
+    return {"lot": lot, "start": start, "end": end, "group_by": group_by,
+            "groups": history_store.aggregate(lot, start, end, group_by)}
+
+
+@app.get("/history/transitions")
+def get_history_transitions(lot: Optional[str] = None, space: Optional[str] = None, start: Optional[float] = None,
+                            end: Optional[float] = None, limit: int = 1000):
+    """Raw state transitions between start and end (default: the last hour), optionally of one space."""
+    lot, start, end = _history_query(lot, start, end, 3600)
+    return {"lot": lot, "start": start, "end": end,
+            "transitions": history_store.transitions(lot, start, end, space, min(max(limit, 1), 10000))}
+
+
+def _resume_seq(since: Optional[int], last_event_id: Optional[str]) -> Optional[int]:
+    """The sequence number to resume after: ?since= wins over the SSE Last-Event-ID header."""
+    if since is not None:
+        return since
+    if last_event_id is not None:
+        try:
+            return int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid Last-Event-ID '{last_event_id}'")
+    return None
+
+
+async def _sse_stream(since: Optional[int]) -> AsyncGenerator[bytes, None]:
+    # Tell the browser how long to wait before reconnecting (it then sends Last-Event-ID)
+    yield b"retry: 2000\n\n"
+    async for kind, event in change_feed.subscribe(since):
+        if kind in ("change", "reload"):
+            yield event.sse
+        elif kind == "reset":
+            yield f"event: reset\ndata: {{\"seq\":{change_feed.last_seq}}}\n\n".encode("utf-8")
+        else:
+            yield b": keepalive\n\n"
+
+
+@app.get("/events")
+def stream_events(since: Optional[int] = None, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events stream of space state changes. Each 'change' event carries
+    {"seq", "lot", "space", "old", "new", "ts"} and uses seq as its event id.
+    A zone reload sends a 'reload' event {"type", "seq", "lot", "added", "removed", "ts"}, where
+    "added" maps each new space to its initial state.
+    Reconnecting clients resume with the Last-Event-ID header or ?since=<seq>. If the
+    requested events are no longer buffered, a 'reset' event is sent: re-read /status.
+    """
+    return StreamingResponse(_sse_stream(_resume_seq(since, last_event_id)), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.websocket("/ws/events")
+async def websocket_events(websocket: WebSocket, since: Optional[int] = None):
+    """
+    WebSocket variant of /events: one JSON text message per change or reload ({"type": "reload", ...}),
+    {"type": "reset", "seq"} when events were lost. Resume with ?since=<seq>.
+    """
+    await websocket.accept()
+    try:
+        async for kind, event in change_feed.subscribe(since):
+            if kind in ("change", "reload"):
+                await websocket.send_text(event.data)
+            elif kind == "reset":
+                await websocket.send_json({"type": "reset", "seq": change_feed.last_seq})
+            else:
+                # Also notices clients that went away while the lot was quiet
+                await websocket.send_json({"type": "keepalive"})
+    except WebSocketDisconnect:
+        pass
 
 
 def run_api_server(host: str = "0.0.0.0", port: int = 8000):
@@ -43,4 +324,4 @@ def run_api_server(host: str = "0.0.0.0", port: int = 8000):
     # Start the server in a daemon thread so it automatically closes when the main thread exits
     api_thread = threading.Thread(target=start_server, daemon=True)
     api_thread.start()
-    return api_thread
\ No newline at end of file
+    return api_thread
@@ -0,0 +1,335 @@
+import os
+import contextlib
+import logging
+import shutil
+import tempfile
+from typing import List, Optional
+import cv2
+import numpy as np
+from smartparking.detections import VEHICLE_CLASS_IDS, empty_detections, make_detections
+
+logger = logging.getLogger(__name__)
+
+# Inference backends selectable with --backend. Everything except 'torch' runs a model exported
+# from the .pt file, cached next to it; the heavy libraries are only imported by the backend in use.
+BACKENDS = ("torch", "onnx", "openvino")
+
+# Ultralytics' default NMS IoU and letterbox padding value, so the exported backends match the baseline
+NMS_IOU = 0.7
+PAD_VALUE = 114
+MAX_DETECTIONS = 300
+
+
+def read_sample_frames(source: str, count: int) -> List[np.ndarray]:
+    """
+    Reads up to `count` frames spread evenly over a video file (or the first frames of a live stream),
+    e.g. for INT8 calibration or backend comparisons.
+    """
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    if not capture.isOpened():
+        raise IOError(f"Could not open video source: {source}")
+    frames = []
+    try:
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        positions = np.linspace(0, total - 1, num=min(count, total)).astype(int) if total > 0 else None
+        for i in range(count if positions is None else len(positions)):
+            if positions is not None:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, int(positions[i]))
+            ret, frame = capture.read()
+            if not ret:
+                break
+            frames.append(frame)
+    finally:
+        capture.release()
+    if not frames:
+        raise IOError(f"No frames could be read from {source}")
+    return frames
+
+
+def letterbox(frame: np.ndarray, size: int) -> tuple:
+    """
+    Resizes a frame into a size x size square keeping its aspect ratio, padding the borders.
+    :return: (image, ratio, (pad_x, pad_y)) to map boxes back to the frame.
+    """
+    height, width = frame.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    if (new_width, new_height) != (width, height):
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    image = cv2.copyMakeBorder(frame, top, size - new_height - top, left, size - new_width - left,
+                               cv2.BORDER_CONSTANT, value=(PAD_VALUE, PAD_VALUE, PAD_VALUE))
+    return image, ratio, (left, top)
+
+
+def preprocess(frames: List[np.ndarray], size: int) -> tuple:
+    """Letterboxes BGR frames into one normalized NCHW RGB float32 blob."""
+    letterboxed = [letterbox(frame, size) for frame in frames]
+    blob = cv2.dnn.blobFromImages([image for image, _, _ in letterboxed], scalefactor=1 / 255.0, swapRB=True)
+    return blob, [(ratio, pad) for _, ratio, pad in letterboxed]
+
+
+def postprocess(output: np.ndarray, transforms: list, shapes: list, confidence_threshold: float) -> List[np.ndarray]:
+    """
+    Decodes raw YOLOv8 output (batch, 4 + classes, anchors) into one detections array per frame.
+    Only vehicle classes are scored, and NMS runs per class like in Ultralytics.
+    """
+    results = []
+    for prediction, (ratio, (pad_x, pad_y)), shape in zip(output, transforms, shapes):
+        # Scores of the vehicle classes only: (anchors, vehicle classes)
+        scores = prediction[4 + VEHICLE_CLASS_IDS.astype(np.int64)].T
+        best = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), best]
+        keep = conf >= confidence_threshold
+        if not keep.any():
+            results.append(empty_detections())
+            continue
+
+        cx, cy, w, h = prediction[:4, keep]
+        conf, cls = conf[keep], VEHICLE_CLASS_IDS[best[keep]]
+        # Offsetting each class into its own coordinate range makes plain NMS class-aware
+        offset = cls.astype(np.float32) * 4096
+        rects = np.stack([cx - w / 2 + offset, cy - h / 2, w, h], axis=1)
+        indices = np.asarray(cv2.dnn.NMSBoxes(rects.tolist(), conf.tolist(), confidence_threshold, NMS_IOU),
+                             dtype=np.int64).reshape(-1)[:MAX_DETECTIONS]
+
+        # Undo the letterbox and clip to the frame
+        height, width = shape[:2]
+        boxes = np.stack([cx - w / 2 - pad_x, cy - h / 2 - pad_y, cx + w / 2 - pad_x, cy + h / 2 - pad_y],
+                         axis=1)[indices] / ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        results.append(make_detections(boxes, conf[indices], cls[indices]))
+    return results
+
+
+def _export_path(model_path: str, backend: str, imgsz: int, int8: bool) -> str:
+    stem = os.path.splitext(model_path)[0]
+    suffix = f"_{imgsz}" + ("_int8" if int8 else "")
+    return f"{stem}{suffix}.onnx" if backend == "onnx" else f"{stem}{suffix}_openvino_model/model.xml"
+
+
+def _is_current(export_path: str, model_path: str) -> bool:
+    """An export is reused until the .pt file it was made from changes."""
+    return os.path.exists(export_path) and os.path.getmtime(export_path) >= os.path.getmtime(model_path)
+
+
+@contextlib.contextmanager
+def _export_lock(model_path: str):
+    """
+    Serializes the exports of one .pt model across processes (e.g. supervisor workers starting together),
+    so it is exported and quantized once and the others reuse the result. Without fcntl (Windows) concurrent
+    exports are not serialized; their per-process temporary files still keep every cached model whole.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(os.path.splitext(model_path)[0] + ".export.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _export_onnx(model_path: str, imgsz: int) -> str:
+    export_path = _export_path(model_path, "onnx", imgsz, int8=False)
+    if _is_current(export_path, model_path):
+        return export_path
+
+    from ultralytics import YOLO
+    logger.info(f"Exporting {model_path} to ONNX ({imgsz}x{imgsz}), this takes a moment")
+    # Ultralytics writes <stem>.onnx next to the .pt, so export a private copy of it in a temporary directory
+    tmp_dir = tempfile.mkdtemp(prefix=".export-", dir=os.path.dirname(export_path) or ".")
+    try:
+        tmp_model = shutil.copy2(model_path, tmp_dir)
+        exported = YOLO(tmp_model).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True, verbose=False)
+        os.replace(exported, export_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return export_path
+
+
+def export_onnx(model_path: str, imgsz: int) -> str:
+    """Exports the .pt model to ONNX (dynamic batch) next to it, or returns the cached export."""
+    with _export_lock(model_path):
+        return _export_onnx(model_path, imgsz)
+
+
+def export_model(model_path: str, backend: str, imgsz: int = 640, int8: bool = False,
+                 calibration_frames: Optional[List[np.ndarray]] = None) -> str:
+    """
+    Returns the path of the optimized model for a backend, exporting (and quantizing) it on first use.
+    Every file is written under a per-process temporary name and renamed into place once complete.
+    :param calibration_frames: BGR frames from the deployment footage, required for int8.
+    """
+    export_path = _export_path(model_path, backend, imgsz, int8)
+    if _is_current(export_path, model_path):
+        logger.info(f"Using cached {backend} model {export_path}")
+        return export_path
+    if int8 and not calibration_frames:
+        raise ValueError("INT8 quantization needs calibration frames (--calibration-source).")
+
+    with _export_lock(model_path):
+        # Another process may have finished the export while this one waited for the lock
+        if _is_current(export_path, model_path):
+            logger.info(f"Using cached {backend} model {export_path}")
+            return export_path
+
+        onnx_path = _export_onnx(model_path, imgsz)
+        if backend == "onnx" and not int8:
+            return onnx_path
+
+        calibration = [preprocess([frame], imgsz)[0] for frame in calibration_frames or []]
+        tmp_suffix = f".{os.getpid()}.tmp"
+        if backend == "onnx":
+            from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+            class FrameReader(CalibrationDataReader):
+                def __init__(self, input_name: str):
+                    self._blobs = iter(calibration)
+                    self._input_name = input_name
+
+                def get_next(self):
+                    blob = next(self._blobs, None)
+                    return None if blob is None else {self._input_name: blob}
+
+            import onnx
+            input_name = onnx.load(onnx_path, load_external_data=False).graph.input[0].name
+            logger.info(f"Quantizing {onnx_path} to INT8 with {len(calibration)} calibration frames")
+            tmp_path = export_path + tmp_suffix
+            quantize_static(onnx_path, tmp_path, FrameReader(input_name), quant_format=QuantFormat.QDQ,
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+            os.replace(tmp_path, export_path)
+        else:
+            import openvino as ov
+            ov_model = ov.convert_model(onnx_path)
+            if int8:
+                import nncf
+                logger.info(f"Quantizing the OpenVINO model to INT8 with {len(calibration)} calibration frames")
+                ov_model = nncf.quantize(ov_model, nncf.Dataset(calibration),
+                                         preset=nncf.QuantizationPreset.MIXED, subset_size=len(calibration))
+            export_dir = os.path.dirname(export_path)
+            os.makedirs(export_dir, exist_ok=True)
+            tmp_xml = os.path.join(export_dir, f"model{tmp_suffix}.xml")
+            ov.save_model(ov_model, tmp_xml)
+            # The .xml marks the export as complete, so it is moved last
+            os.replace(os.path.splitext(tmp_xml)[0] + ".bin", os.path.join(export_dir, "model.bin"))
+            os.replace(tmp_xml, export_path)
+    logger.info(f"Cached {backend}{' INT8' if int8 else ''} model at {export_path}")
+    return export_path
+
+
+class TorchBackend:
+    """The PyTorch .pt model through Ultralytics (the reference implementation)."""
+
+    def __init__(self, model_path: str, confidence_threshold: float, imgsz: int, threads: Optional[int] = None):
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(model_path)
+        self.confidence_threshold = confidence_threshold
+        self.imgsz = imgsz
+        # Let the model drop non-vehicle classes during NMS instead of filtering them afterwards
+        self.classes = VEHICLE_CLASS_IDS.tolist()
+
+    def predict(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        # Ultralytics runs a list of images as one batch and returns one Results per image
+        results = self.model(frames, verbose=False, conf=self.confidence_threshold, classes=self.classes,
+                             imgsz=self.imgsz)
+        return [self._parse_result(r) for r in results]
+
+    @staticmethod
+    def _parse_result(r) -> np.ndarray:
+        """Converts one Ultralytics result into a vehicle detections array."""
+        if r.boxes is None or len(r.boxes) == 0:
+            return empty_detections()
+
+        # One device-to-host copy of the (n, 6) [x1, y1, x2, y2, conf, cls] tensor, then column operations
+        data = r.boxes.data.cpu().numpy()
+        cls = data[:, -1].astype(np.int16)
+        # The model already drops other classes; this only matters for models with a different label set
+        vehicles = np.isin(cls, VEHICLE_CLASS_IDS)
+        data, cls = data[vehicles], cls[vehicles]
+        return make_detections(data[:, :4], data[:, -2], cls)
+
+
+class OnnxBackend:
+    """ONNX Runtime on the CPU."""
+
+    def __init__(self, model_path: str, confidence_threshold: float, imgsz: int, threads: Optional[int] = None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.confidence_threshold = confidence_threshold
+        self.imgsz = imgsz
+
+    def predict(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        blob, transforms = preprocess(frames, self.imgsz)
+        output = self.session.run(None, {self.input_name: blob})[0]
+        return postprocess(output, transforms, [frame.shape for frame in frames], self.confidence_threshold)
+
+
+class OpenVinoBackend:
+    """OpenVINO on the CPU, compiled for latency."""
+
+    def __init__(self, model_path: str, confidence_threshold: float, imgsz: int, threads: Optional[int] = None):
+        import openvino as ov
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.model = ov.Core().compile_model(model_path, "CPU", config)
+        self.output = self.model.output(0)
+        self.confidence_threshold = confidence_threshold
+        self.imgsz = imgsz
+
+    def predict(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        blob, transforms = preprocess(frames, self.imgsz)
+        output = self.model(blob)[self.output]
+        return postprocess(output, transforms, [frame.shape for frame in frames], self.confidence_threshold)
+
+
+def prepare_backend(model_path: str, backend: str, imgsz: int = 640, int8: bool = False,
+                    calibration_source: Optional[str] = None, calibration_frames: int = 200) -> Optional[str]:
+    """
+    Exports (and quantizes) the model for a backend unless a current export is cached, and returns its path
+    (None for 'torch'). Calibration frames are only sampled when a new INT8 export is needed.
+    """
+    if backend == "torch":
+        return None
+    export_path = _export_path(model_path, backend, imgsz, int8)
+    frames = None
+    if int8 and not _is_current(export_path, model_path):
+        if calibration_source is None:
+            raise ValueError("INT8 quantization needs calibration frames (--calibration-source).")
+        frames = read_sample_frames(calibration_source, calibration_frames)
+    return export_model(model_path, backend, imgsz, int8, frames)
+
+
+def create_backend(model_path: str, backend: str = "torch", confidence_threshold: float = 0.5, imgsz: int = 640,
+                   threads: Optional[int] = None, int8: bool = False, calibration_source: Optional[str] = None,
+                   calibration_frames: int = 200):
+    """
+    Creates an inference backend, exporting the model for it first if needed.
+    :param backend: 'torch', 'onnx' or 'openvino'.
+    :param int8: Use an INT8 model quantized on frames from calibration_source (onnx / openvino only).
+    :param calibration_frames: Number of frames sampled from calibration_source.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Expected one of {BACKENDS}.")
+    if backend == "torch":
+        if int8:
+            logger.warning("INT8 is only supported by the onnx and openvino backends; running the .pt model")
+        return TorchBackend(model_path, confidence_threshold, imgsz, threads)
+
+    export_path = prepare_backend(model_path, backend, imgsz, int8, calibration_source, calibration_frames)
+    backend_class = OnnxBackend if backend == "onnx" else OpenVinoBackend
+    return backend_class(export_path, confidence_threshold, imgsz, threads)
@@ -0,0 +1,101 @@
+import time
+import queue
+import logging
+import threading
+from typing import Iterable, Generator, List, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Marker put on the queue when the source iterator is exhausted
+_END = object()
+
+
+class FrameBatcher:
+    """
+    Groups items from an iterator into batches for Detector.detect_batch.
+
+    A batch is emitted as soon as it is full or max_wait_ms has passed since its first
+    item arrived, so latency stays bounded when frames arrive slower than the batch fills.
+    The source iterator is drained on a helper thread, which has finished with it once the
+    batches generator is exhausted or closed.
+    """
+
+    def __init__(self, max_batch_size: int = 8, max_wait_ms: float = 50.0):
+        """
+        :param max_batch_size: Maximum number of items per batch.
+        :param max_wait_ms: Maximum time to wait for more items after the first item of a batch.
+        """
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+
+    def batches(self, items: Iterable[T]) -> Generator[List[T], None, None]:
+        """
+        Yields lists of up to max_batch_size items.
+        :param items: Source iterator, e.g. frames from VideoStream.
+        """
+        pending: "queue.Queue" = queue.Queue(maxsize=2 * self.max_batch_size)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            # Block while the consumer is busy, but notice when it has gone away
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def feed():
+            iterator = iter(items)
+            try:
+                for item in iterator:
+                    if not put(item):
+                        return
+            except Exception as e:
+                logger.error(f"Frame source failed while batching: {e}")
+            finally:
+                # Close a generator source on the thread that runs it
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+            put(_END)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+        try:
+            finished = False
+            while not finished:
+                item = pending.get()
+                if item is _END:
+                    break
+
+                batch = [item]
+                deadline = time.monotonic() + self.max_wait_ms / 1000
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = pending.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        finished = True
+                        break
+                    batch.append(item)
+
+                yield batch
+        finally:
+            # Stop the feeder and wait until it has left the source, so the caller can release
+            # the source (e.g. the video capture) as soon as this generator is closed
+            stop.set()
+            while feeder.is_alive():
+                try:
+                    pending.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            feeder.join()
@@ -0,0 +1,112 @@
+import cv2
+import logging
+import numpy as np
+from typing import Dict, Tuple, Optional
+from smartparking.parking_lot import ParkingLot
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeDetector:
+    """
+    Cheap pre-stage that decides whether a frame needs a YOLO pass.
+
+    Keeps a downsampled grayscale reference of the frame that was last analysed and measures
+    the mean absolute pixel change inside every space polygon. Inference is only requested
+    when a space (or the scene as a whole) changed past its threshold, or when the last
+    analysed frame is older than max_stale_frames.
+    """
+
+    def __init__(self, parking_lot: ParkingLot, downscale: int = 4, space_threshold: float = 12.0,
+                 scene_threshold: float = 8.0, max_stale_frames: int = 50):
+        """
+        :param parking_lot: The lot whose space polygons are monitored.
+        :param downscale: Factor by which frames are shrunk before comparing.
+        :param space_threshold: Mean absolute gray-level change inside a space that triggers inference.
+        :param scene_threshold: Mean absolute gray-level change over the whole frame that triggers
+                                inference (camera moved, lights switched, ...).
+        :param max_stale_frames: Always run inference after this many skipped frames.
+        """
+        self.parking_lot = parking_lot
+        self.downscale = max(1, downscale)
+        self.space_threshold = space_threshold
+        self.scene_threshold = scene_threshold
+        self.max_stale_frames = max_stale_frames
+
+        self.reference: Optional[np.ndarray] = None
+        self.frames_since_inference = 0
+        # Spaces that changed past the threshold in the last checked frame
+        self.changed_spaces = np.zeros(len(parking_lot.spaces), dtype=bool)
+        self._geometry_version = parking_lot.geometry_version
+
+        # Counters
+        self.frames_checked = 0
+        self.frames_skipped = 0
+
+        self._labels: Dict[Tuple, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def _space_labels(self, small_shape: Tuple[int, int], scale: float):
+        """
+        Rasterizes the space polygons at the downsampled resolution (cached per frame size).
+        :return: (flat pixel indices inside a space, their space index, pixel count per space)
+        """
+        key = (small_shape, scale)
+        if key not in self._labels:
+            factor = scale * self.downscale
+            labels = np.full(small_shape, -1, dtype=np.int32)
+            for index, contour in enumerate(self.parking_lot.geometry.contours):
+                small_contour = np.round(contour / factor).astype(np.int32)
+                cv2.fillPoly(labels, [small_contour], index)
+
+            flat = labels.ravel()
+            pixels = np.flatnonzero(flat >= 0)
+            counts = np.bincount(flat[pixels], minlength=len(self.parking_lot.geometry))
+            self._labels[key] = (pixels, flat[pixels], np.maximum(counts, 1))
+        return self._labels[key]
+
+    def should_run(self, frame: cv2.Mat, scale: float = 1.0) -> bool:
+        """
+        Checks a frame and decides whether it needs inference. When it does, the frame becomes
+        the new reference (the caller is expected to analyse it).
+
+        :param frame: The BGR frame.
+        :param scale: Source width / frame width (VideoStream.scale), to map polygons onto the frame.
+        :return: True if the frame should go through the detector.
+        """
+        self.frames_checked += 1
+        if self._geometry_version != self.parking_lot.geometry_version:
+            # Zones were reloaded: drop the per-space rasters and analyse this frame against the new spaces
+            self._geometry_version = self.parking_lot.geometry_version
+            self._labels.clear()
+            self.changed_spaces = np.zeros(len(self.parking_lot.geometry), dtype=bool)
+            self.reference = None
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (max(1, gray.shape[1] // self.downscale), max(1, gray.shape[0] // self.downscale)),
+                           interpolation=cv2.INTER_AREA)
+        # Light blur so sensor noise and compression artefacts do not count as change
+        small = cv2.GaussianBlur(small, (3, 3), 0)
+
+        if self.reference is None or self.reference.shape != small.shape:
+            run = True
+        else:
+            diff = cv2.absdiff(small, self.reference)
+            pixels, space_indices, counts = self._space_labels(small.shape, scale)
+            space_change = np.bincount(space_indices, weights=diff.ravel()[pixels], minlength=len(counts)) / counts
+            self.changed_spaces = space_change > self.space_threshold
+
+            run = bool(self.changed_spaces.any() or diff.mean() > self.scene_threshold or
+                       self.frames_since_inference >= self.max_stale_frames)
+
+        if run:
+            self.reference = small
+            self.frames_since_inference = 0
+        else:
+            self.frames_since_inference += 1
+            self.frames_skipped += 1
+        return run
+
+    @property
+    def skip_rate(self) -> float:
+        """Fraction of checked frames for which inference was skipped."""
+        return self.frames_skipped / self.frames_checked if self.frames_checked else 0.0
@@ -0,0 +1,162 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from itertools import islice
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+import numpy as np
+from smartparking.parking_lot import ParkingLot, STATE_NAMES
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeEvent:
+    """One official state flip, serialized once for every subscriber."""
+
+    __slots__ = ("seq", "data", "sse")
+    kind = "change"
+
+    def __init__(self, seq: int, lot_id: str, space_id: str, old_state: str, new_state: str, timestamp: float):
+        self.seq = seq
+        self.data = json.dumps({"seq": seq, "lot": lot_id, "space": space_id, "old": old_state,
+                                "new": new_state, "ts": timestamp}, separators=(",", ":"))
+        self.sse = f"id: {seq}\nevent: change\ndata: {self.data}\n\n".encode("utf-8")
+
+
+class ReloadEvent:
+    """A zone reload of one lot: the spaces it added (with their initial states) and removed."""
+
+    __slots__ = ("seq", "data", "sse")
+    kind = "reload"
+
+    def __init__(self, seq: int, lot_id: str, added: Dict[str, str], removed: List[str], timestamp: float):
+        self.seq = seq
+        self.data = json.dumps({"type": "reload", "seq": seq, "lot": lot_id, "added": added, "removed": removed,
+                                "ts": timestamp}, separators=(",", ":"))
+        self.sse = f"id: {seq}\nevent: reload\ndata: {self.data}\n\n".encode("utf-8")
+
+
+class ChangeFeed:
+    """
+    Sequenced feed of space state changes for streaming clients (SSE / WebSocket).
+
+    All subscribers read from one bounded ring buffer through their own cursor (the last
+    sequence number they saw), so publishing costs the same no matter how many clients are
+    connected and a slow client can never hold up the processing loop. A client that falls
+    further behind than the buffer (or resumes from a sequence number that has been evicted)
+    receives a 'reset' and should re-read /status.
+    """
+
+    def __init__(self, buffer_size: int = 10000):
+        """
+        :param buffer_size: Number of most recent events kept for resuming subscribers.
+        """
+        self._events: deque = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def attach(self, lot_id: str, lot: ParkingLot):
+        """Publishes every state flip and zone reload of the lot to the feed."""
+        lot.add_change_listener(lambda changed_lot, changed: self.publish(lot_id, changed_lot, changed))
+        lot.add_reload_listener(lambda reloaded_lot, added, removed:
+                                self.publish_reload(lot_id, reloaded_lot, added, removed))
+
+    def publish(self, lot_id: str, lot: ParkingLot, changed: np.ndarray, timestamp: Optional[float] = None):
+        """
+        Appends one event per flipped space. Called on the processing thread; never blocks on subscribers.
+        :param changed: Indices of the spaces that flipped (new states are read from the lot).
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        new_states = lot.store.states[changed].tolist()
+        space_ids = lot.geometry.space_ids
+
+        with self._lock:
+            for index, new_state in zip(changed.tolist(), new_states):
+                self._seq += 1
+                # States are binary, so the old state is the other one
+                self._events.append(ChangeEvent(self._seq, lot_id, space_ids[index], STATE_NAMES[1 - new_state],
+                                                STATE_NAMES[new_state], timestamp))
+
+        self._notify()
+
+    def publish_reload(self, lot_id: str, lot: ParkingLot, added: List[str], removed: List[str],
+                       timestamp: Optional[float] = None):
+        """Appends one 'reload' event, so subscribers learn which spaces appeared or disappeared."""
+        timestamp = time.time() if timestamp is None else timestamp
+        states = lot.store.states
+        added_states = {space_id: STATE_NAMES[states[lot.spaces[space_id].index]] for space_id in added}
+        with self._lock:
+            self._seq += 1
+            self._events.append(ReloadEvent(self._seq, lot_id, added_states, removed, timestamp))
+        self._notify()
+
+    def _notify(self):
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wake_subscribers)
+            except RuntimeError:
+                # The API event loop has been closed; nobody is listening anymore
+                self._loop = None
+
+    def _wake_subscribers(self):
+        # Runs on the event loop: wake everyone waiting on the current event and start a new one
+        if self._wakeup is not None:
+            self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def read_since(self, since: int, limit: int = 500) -> Tuple[List[ChangeEvent], bool]:
+        """
+        :param since: Last sequence number the subscriber has seen.
+        :param limit: Maximum number of events to return.
+        :return: (events after since, reset) where reset means events between since and the
+                 returned ones were lost and the subscriber must resynchronize.
+        """
+        with self._lock:
+            if since >= self._seq or not self._events:
+                return [], since > self._seq
+            first_seq = self._events[0].seq
+            offset = since + 1 - first_seq
+            reset = offset < 0
+            return list(islice(self._events, max(offset, 0), max(offset, 0) + limit)), reset
+
+    async def subscribe(self, since: Optional[int] = None,
+                        keepalive: float = 15.0) -> AsyncGenerator[Tuple[str, Optional[ChangeEvent]], None]:
+        """
+        Async generator for one subscriber. Yields ("change", event), ("reload", event), ("reset", None)
+        or ("keepalive", None) when nothing happened for keepalive seconds.
+        :param since: Resume after this sequence number (None = only new events).
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Wakeups are delivered to the loop of the API server (bound on the first subscription)
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+
+        cursor = self._seq if since is None else since
+        while True:
+            # Grab the wakeup event before reading, so a publish in between is never missed
+            wakeup = self._wakeup
+            events, reset = self.read_since(cursor)
+            if reset:
+                # The subscriber re-reads the full status, so continue from the newest event
+                cursor = self._seq
+                yield "reset", None
+                continue
+            if events:
+                for event in events:
+                    yield event.kind, event
+                cursor = events[-1].seq
+                continue
+
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield "keepalive", None
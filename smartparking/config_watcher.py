@@ -0,0 +1,55 @@
+import os
+import logging
+import threading
+from typing import Optional
+from smartparking.parking_lot import ParkingLot
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigWatcher:
+    """
+    Polls the zone config of a lot and stages a reload when the file changes.
+
+    Compiling the new zones happens on the watcher thread; the processing loop only swaps
+    them in (ParkingLot.apply_pending_reload) at the start of its next frame.
+    """
+
+    def __init__(self, parking_lot: ParkingLot, interval: float = 2.0):
+        """
+        :param parking_lot: The lot to keep in sync with its config file.
+        :param interval: Seconds between checks of the file's modification time.
+        """
+        self.parking_lot = parking_lot
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ConfigWatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.parking_lot.config_path} for changes every {self.interval:g}s")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.parking_lot.config_path)
+        except OSError:
+            # Editors often replace the file; try again on the next check
+            return None
+
+    def _run(self):
+        last_mtime = self._mtime()
+        while not self._stop_event.wait(self.interval):
+            mtime = self._mtime()
+            if mtime is None or mtime == last_mtime:
+                continue
+            last_mtime = mtime
+            try:
+                # Unchanged contents (e.g. the file was only touched) are not reloaded
+                if self.parking_lot.stage_reload():
+                    logger.info(f"{self.parking_lot.config_path} changed; new zones apply from the next frame")
+            except Exception as e:
+                logger.error(f"Not reloading {self.parking_lot.config_path}: {e}")
@@ -0,0 +1,48 @@
+import numpy as np
+
+# List of COCO classes that represent a vehicle
+VEHICLE_CLASSES = {
+    2: 'car',
+    3: 'motorcycle',
+    5: 'bus',
+    7: 'truck',
+    67: 'cell phone',
+}
+VEHICLE_CLASS_IDS = np.array(sorted(VEHICLE_CLASSES), dtype=np.int16)
+
+# Detections of one frame are a structured array with one record per vehicle.
+# Aligned to 24 bytes per record, which is also the on-disk layout of detection recordings.
+DETECTION_DTYPE = np.dtype([
+    ('x1', '<i4'), ('y1', '<i4'), ('x2', '<i4'), ('y2', '<i4'),
+    ('conf', '<f4'),
+    ('cls', '<i2'),
+], align=True)
+
+
+def empty_detections() -> np.ndarray:
+    return np.zeros(0, dtype=DETECTION_DTYPE)
+
+
+def make_detections(boxes: np.ndarray, conf: np.ndarray, cls: np.ndarray) -> np.ndarray:
+    """
+    Builds a detections array from column data.
+    :param boxes: (n, 4) boxes (x1, y1, x2, y2); fractional coordinates are truncated.
+    :param conf: (n,) confidences.
+    :param cls: (n,) COCO class ids.
+    """
+    boxes = np.asarray(boxes).reshape((-1, 4))
+    detections = np.zeros(len(boxes), dtype=DETECTION_DTYPE)
+    detections['x1'], detections['y1'], detections['x2'], detections['y2'] = boxes.T
+    detections['conf'] = conf
+    detections['cls'] = cls
+    return detections
+
+
+def detection_boxes(detections: np.ndarray) -> np.ndarray:
+    """(n, 4) int64 boxes (x1, y1, x2, y2) of a detections array."""
+    return np.stack([detections['x1'], detections['y1'], detections['x2'], detections['y2']],
+                    axis=1).astype(np.int64)
+
+
+def class_name(class_id: int) -> str:
+    return VEHICLE_CLASSES.get(int(class_id), f"Class_{class_id}")
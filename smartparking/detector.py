@@ -1,77 +1,119 @@
 import cv2
+import time
 import logging
-from ultralytics import YOLO
-from ultralytics.engine.results import Results
-from typing import List, Dict, Any, Tuple
+import numpy as np
+from typing import List, Optional
+from smartparking.roi import merge_crop_detections
+from smartparking.detections import class_name
+from smartparking.backends import create_backend
 
 logger = logging.getLogger(__name__)
 
-# List of COCO classes that represent a vehicle
-VEHICLE_CLASSES = {
-    2: 'car',
-    3: 'motorcycle',
-    5: 'bus',
-    7: 'truck',
-    67: 'cell phone',
-}
-
 
 class Detector:
     """
     Loads and runs the YOLO model for vehicle detection.
     """
 
-    def __init__(self, model_path: str, confidence_threshold: float = 0.5):
+    def __init__(self, model_path: str, confidence_threshold: float = 0.5, max_batch_size: int = 8,
+                 log_detections: bool = False, backend: str = "torch", imgsz: int = 640,
+                 threads: Optional[int] = None, int8: bool = False, calibration_source: Optional[str] = None,
+                 calibration_frames: int = 200, warmup: bool = True):
         """
         :param model_path: Path to the trained YOLO model file (e.g., 'yolov8n.pt').
         :param confidence_threshold: Minimum confidence score for a detection to be considered.
+        :param max_batch_size: Maximum number of frames per forward pass in detect_batch().
+        :param log_detections: Log every detected vehicle (debugging; slow on busy frames).
+        :param backend: 'torch' (the .pt model), or 'onnx' / 'openvino' (exported and cached next to it).
+        :param imgsz: Inference image size.
+        :param threads: CPU threads used for inference (None = the backend's default).
+        :param int8: Use an INT8 quantized model (onnx / openvino).
+        :param calibration_source: Video to sample INT8 calibration frames from.
+        :param calibration_frames: Number of calibration frames.
+        :param warmup: Run one inference at startup, so the first real frame is not slowed down.
         """
         try:
-            # Load the model using Ultralytics
-            self.model = YOLO(model_path)
-            logger.info(f"YOLO model loaded successfully from {model_path}")
+            self.backend = create_backend(model_path, backend, confidence_threshold, imgsz, threads, int8,
+                                          calibration_source, calibration_frames)
+            logger.info(f"YOLO model loaded successfully from {model_path} ({backend} backend)")
         except Exception as e:
             logger.error(f"Failed to load YOLO model from {model_path}: {e}")
             raise
 
         self.confidence_threshold = confidence_threshold
+        self.max_batch_size = max(1, max_batch_size)
+        self.log_detections = log_detections
+        self.imgsz = imgsz
+
+        if warmup:
+            self.warmup()
 
-    def detect(self, frame: cv2.Mat) -> List[Dict[str, Any]]:
+    def warmup(self):
+        """Runs a dummy inference (lazy initialization, memory allocation, kernel selection)."""
+        start = time.perf_counter()
+        self.backend.predict([np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)])
+        logger.info(f"Detector warmup took {1000 * (time.perf_counter() - start):.0f}ms")
+
+    def detect(self, frame: cv2.Mat) -> np.ndarray:
         """
         Performs detection on a single frame and filters for vehicles.
 
         :param frame: The BGR image frame from OpenCV.
-        :return: A list of dictionaries, each representing a vehicle detection.
-                 [{'box': (x1, y1, x2, y2), 'class': 'car', 'conf': 0.95}, ...]
+        :return: Structured array (DETECTION_DTYPE) with one record (x1, y1, x2, y2, conf, cls) per vehicle.
         """
-        # Run inference on the frame
-        results: List[Results] = self.model(frame, verbose=False, conf=self.confidence_threshold)
+        detections = self.backend.predict([frame])[0]
+        self._log(detections)
+        return detections
 
-        detections: List[Dict[str, Any]] = []
+    def detect_batch(self, frames: List[cv2.Mat]) -> List[np.ndarray]:
+        """
+        Performs detection on several frames with batched forward passes.
 
-        if not results:
-            return detections
+        :param frames: BGR frames, e.g. from several cameras or consecutive sampled frames.
+        :return: One detections array per frame (same format as detect()), in input order.
+        """
+        batch_detections: List[np.ndarray] = []
 
-        for r in results:
-            if r.boxes is None:
-                continue
+        for start in range(0, len(frames), self.max_batch_size):
+            batch_detections.extend(self.backend.predict(frames[start:start + self.max_batch_size]))
 
-            for box in r.boxes:
-                class_id = int(box.cls.item())
-                confidence = box.conf.item()
-                x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
+        for detections in batch_detections:
+            self._log(detections)
+        return batch_detections
 
-                # --- Midlertidig debugging: Print ALLE detektioner ---
-                class_name = self.model.names[class_id] if self.model.names else f"Class_{class_id}"
-                logger.info(f"Detected: {class_name}, Conf: {confidence:.2f}, Box: {(x1, y1, x2, y2)}")
-                # --- Slut på midlertidig debugging ---
+    def detect_roi(self, frames: List[cv2.Mat], crops: np.ndarray) -> List[np.ndarray]:
+        """
+        Performs detection only inside the given crops of each frame.
 
-                # Filter by vehicle classes (denne linje er som før)
-                if class_id in VEHICLE_CLASSES:
-                    detections.append({
-                        'box': (x1, y1, x2, y2),
-                        'class': VEHICLE_CLASSES[class_id],
-                        'conf': confidence
-                    })
+        All crops of all frames go through detect_batch() together; the boxes are mapped back to
+        frame coordinates and duplicates from overlapping crops are removed.
 
-        return detections
\ No newline at end of file
+        :param frames: BGR frames of the same size.
+        :param crops: (k, 4) crops (x1, y1, x2, y2) from RoiPlanner, shared by all frames.
+        :return: One detections array per frame, in frame coordinates.
+        """
+        # Slicing creates views, so no pixels are copied until the model preprocesses the crops
+        patches = [frame[y1:y2, x1:x2] for frame in frames for x1, y1, x2, y2 in crops]
+        crop_detections = self.detect_batch(patches)
+
+        return [merge_crop_detections(crop_detections[i * len(crops):(i + 1) * len(crops)], crops)
+                for i in range(len(frames))]
+
+    def _log(self, detections: np.ndarray):
+        if self.log_detections:
+            for x1, y1, x2, y2, conf, class_id in detections.tolist():
+                logger.info(f"Detected: {class_name(class_id)}, Conf: {conf:.2f}, Box: {(x1, y1, x2, y2)}")
+
+
+def scale_detections(detections: np.ndarray, scale: float) -> np.ndarray:
+    """
+    Maps detections made on a downscaled frame back to source-frame coordinates.
+    :param detections: Detections from Detector.detect.
+    :param scale: Source width / analysed frame width (VideoStream.scale).
+    """
+    if scale == 1.0:
+        return detections
+    scaled = detections.copy()
+    for field in ('x1', 'y1', 'x2', 'y2'):
+        scaled[field] = (detections[field] * scale).astype(np.int32)
+    return scaled
@@ -0,0 +1,299 @@
+import cv2
+import numpy as np
+import logging
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Label values used in the rasterized space mask
+LABEL_NONE = -1  # Pixel is not covered by any parking space
+LABEL_AMBIGUOUS = -2  # Pixel is on/near a polygon edge or covered by several spaces
+
+# Half-width (in pixels) of the band around every polygon edge that is resolved exactly.
+# The rasterizer and cv2.pointPolygonTest can disagree by a pixel along edges, so
+# anchor points in this band are checked against the real polygons instead of the mask.
+EDGE_BAND = 1
+
+# Minimum cell size (in pixels) of the uniform grid index over spaces
+MIN_GRID_CELL = 16
+
+
+class LotGeometry:
+    """
+    Precomputed geometry for all parking spaces of a lot.
+
+    Built once when the lot is loaded, so the per-frame occupancy check can resolve
+    detection anchor points to space indices with a single NumPy lookup instead of
+    testing every (space, detection) pair.
+    """
+
+    def __init__(self, space_ids: List[str], polygons: List[List[Tuple[int, int]]]):
+        """
+        :param space_ids: Space ids in lot order. Index i in every array belongs to space_ids[i].
+        :param polygons: Integer polygon vertices for each space.
+        """
+        self.space_ids = list(space_ids)
+        # Compact polygon array cache: one (n, 1, 2) int32 contour per space, ready for OpenCV
+        self.contours: List[np.ndarray] = [np.array(p, dtype=np.int32).reshape((-1, 1, 2)) for p in polygons]
+
+        # Per-space bounding boxes (x1, y1, x2, y2), inclusive
+        if self.contours:
+            self.bboxes = np.array([[c[:, 0, 0].min(), c[:, 0, 1].min(), c[:, 0, 0].max(), c[:, 0, 1].max()]
+                                    for c in self.contours], dtype=np.int32)
+        else:
+            self.bboxes = np.zeros((0, 4), dtype=np.int32)
+
+        # Padded (N, max_vertices, 2) float vertex array for vectorized overlap math. Shorter polygons
+        # repeat their last vertex, which only adds zero-length edges.
+        max_vertices = max((len(c) for c in self.contours), default=1)
+        self.vertices = np.zeros((len(self.contours), max_vertices, 2), dtype=np.float64)
+        for index, contour in enumerate(self.contours):
+            self.vertices[index, :len(contour)] = contour[:, 0]
+            self.vertices[index, len(contour):] = contour[-1, 0]
+        self.areas = _polygon_areas(self.vertices)
+
+        self._build_label_mask()
+        self._build_grid_index()
+
+    def __len__(self) -> int:
+        return len(self.space_ids)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Everything computed at load time as plain arrays (see from_arrays), e.g. to cache it with np.savez."""
+        return {
+            "space_ids": np.array(self.space_ids, dtype=str),
+            "contour_points": np.concatenate(self.contours) if self.contours else np.zeros((0, 1, 2), dtype=np.int32),
+            "contour_offsets": np.cumsum([0] + [len(c) for c in self.contours]),
+            "bboxes": self.bboxes,
+            "vertices": self.vertices,
+            "areas": self.areas,
+            "origin": np.array(self.origin, dtype=np.int64),
+            "label_mask": self.label_mask,
+            "grid": np.array([self.grid_cell, *self.grid_shape], dtype=np.int64),
+            "grid_offsets": self.grid_offsets,
+            "grid_spaces": self.grid_spaces,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "LotGeometry":
+        """Restores a geometry saved with to_arrays() without rasterizing anything."""
+        geometry = cls.__new__(cls)
+        geometry.space_ids = arrays["space_ids"].tolist()
+        points, offsets = arrays["contour_points"], arrays["contour_offsets"]
+        geometry.contours = [points[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        geometry.bboxes = arrays["bboxes"]
+        geometry.vertices = arrays["vertices"]
+        geometry.areas = arrays["areas"]
+        geometry.origin = tuple(int(v) for v in arrays["origin"])
+        geometry.label_mask = arrays["label_mask"]
+        geometry.grid_cell = int(arrays["grid"][0])
+        geometry.grid_shape = (int(arrays["grid"][1]), int(arrays["grid"][2]))
+        geometry.grid_offsets = arrays["grid_offsets"]
+        geometry.grid_spaces = arrays["grid_spaces"]
+        return geometry
+
+    def _build_label_mask(self):
+        """Rasterizes all polygons into one integer label mask."""
+        if not self.contours:
+            self.origin = (0, 0)
+            self.label_mask = np.full((1, 1), LABEL_NONE, dtype=np.int16)
+            return
+
+        # The mask covers the union of all polygons plus the edge band; everything else is LABEL_NONE
+        pad = EDGE_BAND + 1
+        x0, y0 = self.bboxes[:, 0].min() - pad, self.bboxes[:, 1].min() - pad
+        x1, y1 = self.bboxes[:, 2].max() + pad, self.bboxes[:, 3].max() + pad
+        self.origin = (int(x0), int(y0))
+
+        dtype = np.int16 if len(self.contours) < np.iinfo(np.int16).max else np.int32
+        label_mask = np.full((y1 - y0 + 1, x1 - x0 + 1), LABEL_NONE, dtype=dtype)
+        edge_mask = np.zeros(label_mask.shape, dtype=np.uint8)
+
+        for index, contour in enumerate(self.contours):
+            # Fill each polygon inside its own bounding box to keep the load cost proportional to the lot
+            bx1, by1, bx2, by2 = self.bboxes[index] - (x0, y0, x0, y0)
+            local = np.zeros((by2 - by1 + 1, bx2 - bx1 + 1), dtype=np.uint8)
+            cv2.fillPoly(local, [contour - (x0 + bx1, y0 + by1)], 1)
+
+            region = label_mask[by1:by2 + 1, bx1:bx2 + 1]
+            inside = local.astype(bool)
+            # Pixels already claimed by another space are overlaps and need the exact test
+            region[inside & (region != LABEL_NONE)] = LABEL_AMBIGUOUS
+            region[inside & (region == LABEL_NONE)] = index
+
+            cv2.polylines(edge_mask, [contour - (x0, y0)], isClosed=True, color=1, thickness=2 * EDGE_BAND + 1)
+
+        label_mask[edge_mask.astype(bool)] = LABEL_AMBIGUOUS
+        self.label_mask = label_mask
+
+        logger.debug(f"Rasterized {len(self.contours)} spaces into a {label_mask.shape[1]}x{label_mask.shape[0]} label mask")
+
+    def _build_grid_index(self):
+        """Builds a uniform grid over the lot; each cell lists the spaces whose bounding box touches it."""
+        if not self.contours:
+            self.grid_cell = MIN_GRID_CELL
+            self.grid_shape = (1, 1)
+            self.grid_offsets = np.zeros(2, dtype=np.int64)
+            self.grid_spaces = np.zeros(0, dtype=np.int64)
+            return
+
+        # One cell per typical space keeps the candidate lists short without a huge grid
+        sizes = np.maximum(self.bboxes[:, 2] - self.bboxes[:, 0], self.bboxes[:, 3] - self.bboxes[:, 1])
+        self.grid_cell = max(MIN_GRID_CELL, int(np.median(sizes)))
+
+        cells_x1 = (self.bboxes[:, 0] - self.origin[0]) // self.grid_cell
+        cells_y1 = (self.bboxes[:, 1] - self.origin[1]) // self.grid_cell
+        cells_x2 = (self.bboxes[:, 2] - self.origin[0]) // self.grid_cell
+        cells_y2 = (self.bboxes[:, 3] - self.origin[1]) // self.grid_cell
+        self.grid_shape = (int(cells_y2.max()) + 1, int(cells_x2.max()) + 1)
+
+        cell_ids, space_ids = [], []
+        for index in range(len(self.contours)):
+            ys, xs = np.mgrid[cells_y1[index]:cells_y2[index] + 1, cells_x1[index]:cells_x2[index] + 1]
+            cell_ids.append((ys * self.grid_shape[1] + xs).ravel())
+            space_ids.append(np.full(ys.size, index, dtype=np.int64))
+
+        # Compressed (CSR) layout: spaces of cell c are grid_spaces[grid_offsets[c]:grid_offsets[c + 1]]
+        cell_ids = np.concatenate(cell_ids)
+        order = np.argsort(cell_ids, kind='stable')
+        self.grid_spaces = np.concatenate(space_ids)[order]
+        self.grid_offsets = np.searchsorted(cell_ids[order], np.arange(self.grid_shape[0] * self.grid_shape[1] + 1))
+
+    def candidate_pairs(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Uses the grid index to find the (box, space) pairs whose bounding boxes overlap.
+
+        :param boxes: (n, 4) array of (x1, y1, x2, y2) boxes.
+        :return: Tuple (box_indices, space_indices) of equal length.
+        """
+        boxes = np.asarray(boxes, dtype=np.int64).reshape((-1, 4))
+        box_indices, space_indices = [], []
+        rows, cols = self.grid_shape
+
+        for box_index, (x1, y1, x2, y2) in enumerate(boxes):
+            cx1 = max((x1 - self.origin[0]) // self.grid_cell, 0)
+            cy1 = max((y1 - self.origin[1]) // self.grid_cell, 0)
+            cx2 = min((x2 - self.origin[0]) // self.grid_cell, cols - 1)
+            cy2 = min((y2 - self.origin[1]) // self.grid_cell, rows - 1)
+            if cx1 > cx2 or cy1 > cy2:
+                continue
+
+            candidates = np.unique(np.concatenate(
+                [self.grid_spaces[self.grid_offsets[row * cols + cx1]:self.grid_offsets[row * cols + cx2 + 1]]
+                 for row in range(cy1, cy2 + 1)]))
+            bboxes = self.bboxes[candidates]
+            candidates = candidates[(bboxes[:, 0] < x2) & (bboxes[:, 2] > x1) &
+                                    (bboxes[:, 1] < y2) & (bboxes[:, 3] > y1)]
+
+            box_indices.append(np.full(len(candidates), box_index, dtype=np.int64))
+            space_indices.append(candidates)
+
+        if not box_indices:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(box_indices), np.concatenate(space_indices)
+
+    def overlap_areas(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Computes the exact intersection area between boxes and the spaces they can touch.
+
+        :param boxes: (n, 4) array of (x1, y1, x2, y2) boxes.
+        :return: Tuple (box_indices, space_indices, intersection_areas), one entry per candidate pair.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape((-1, 4))
+        box_indices, space_indices = self.candidate_pairs(boxes)
+        if len(box_indices) == 0:
+            return box_indices, space_indices, np.zeros(0, dtype=np.float64)
+
+        # Clip every candidate polygon against its box in one vectorized Sutherland-Hodgman pass
+        polygons = self.vertices[space_indices]
+        pair_boxes = boxes[box_indices]
+        polygons = _clip_half_plane(polygons, 0, pair_boxes[:, 0], 1.0)
+        polygons = _clip_half_plane(polygons, 0, pair_boxes[:, 2], -1.0)
+        polygons = _clip_half_plane(polygons, 1, pair_boxes[:, 1], 1.0)
+        polygons = _clip_half_plane(polygons, 1, pair_boxes[:, 3], -1.0)
+
+        return box_indices, space_indices, _polygon_areas(polygons)
+
+    def spaces_containing(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Resolves anchor points to the spaces that contain them (edges count as inside,
+        matching cv2.pointPolygonTest(...) >= 0).
+
+        :param points: (n, 2) integer array of (x, y) points.
+        :return: Tuple (point_indices, space_indices) of equal length, one entry per hit.
+        """
+        points = np.asarray(points, dtype=np.int64).reshape((-1, 2))
+        if len(points) == 0 or len(self.contours) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        # 1. One vectorized lookup in the label mask for all points
+        mx = points[:, 0] - self.origin[0]
+        my = points[:, 1] - self.origin[1]
+        in_bounds = (mx >= 0) & (my >= 0) & (mx < self.label_mask.shape[1]) & (my < self.label_mask.shape[0])
+
+        labels = np.full(len(points), LABEL_NONE, dtype=np.int64)
+        labels[in_bounds] = self.label_mask[my[in_bounds], mx[in_bounds]]
+
+        hit = labels >= 0
+        point_indices = [np.flatnonzero(hit)]
+        space_indices = [labels[hit]]
+
+        # 2. Exact fallback for the few points that landed on an edge band or an overlap
+        for point_index in np.flatnonzero(labels == LABEL_AMBIGUOUS):
+            x, y = points[point_index]
+            candidates = np.flatnonzero((self.bboxes[:, 0] <= x) & (self.bboxes[:, 2] >= x) &
+                                        (self.bboxes[:, 1] <= y) & (self.bboxes[:, 3] >= y))
+            for space_index in candidates:
+                if cv2.pointPolygonTest(self.contours[space_index], (int(x), int(y)), measureDist=False) >= 0:
+                    point_indices.append(np.array([point_index]))
+                    space_indices.append(np.array([space_index]))
+
+        return np.concatenate(point_indices).astype(np.int64), np.concatenate(space_indices).astype(np.int64)
+
+
+def _polygon_areas(polygons: np.ndarray) -> np.ndarray:
+    """Shoelace area of each polygon in a padded (N, V, 2) vertex array."""
+    if polygons.shape[0] == 0:
+        return np.zeros(0, dtype=np.float64)
+    x, y = polygons[..., 0], polygons[..., 1]
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1))
+
+
+def _clip_half_plane(polygons: np.ndarray, axis: int, bounds: np.ndarray, sign: float) -> np.ndarray:
+    """
+    Clips each polygon against the half-plane sign * (p[axis] - bound) >= 0 (one Sutherland-Hodgman step).
+
+    :param polygons: Padded (N, V, 2) vertex array.
+    :param axis: 0 to clip on x, 1 to clip on y.
+    :param bounds: (N,) clip coordinate per polygon.
+    :param sign: +1.0 keeps the side above the bound, -1.0 the side below it.
+    :return: Padded (N, V', 2) vertex array of the clipped polygons (all-zero rows when nothing is left).
+    """
+    starts = polygons
+    ends = np.roll(polygons, -1, axis=1)
+    start_inside = sign * (starts[..., axis] - bounds[:, None]) >= 0
+    end_inside = sign * (ends[..., axis] - bounds[:, None]) >= 0
+
+    # Intersection of each edge with the clip line (only used where the edge crosses it)
+    delta = ends[..., axis] - starts[..., axis]
+    t = (bounds[:, None] - starts[..., axis]) / np.where(delta == 0, 1.0, delta)
+    crossings = starts + t[..., None] * (ends - starts)
+
+    # Every edge emits up to two vertices: the crossing point, then its end point if inside
+    n, v = start_inside.shape
+    points = np.stack([crossings, ends], axis=2).reshape((n, 2 * v, 2))
+    valid = np.stack([start_inside != end_inside, end_inside], axis=2).reshape((n, 2 * v))
+
+    # Compact the valid vertices to the front (keeping their order) and pad with the last one
+    counts = valid.sum(axis=1)
+    order = np.argsort(~valid, axis=1, kind='stable')
+    width = max(int(counts.max()), 1)
+    points = np.take_along_axis(points, order[:, :width, None], axis=1)
+
+    padding = np.arange(width)[None, :] >= counts[:, None]
+    last = points[np.arange(n), np.maximum(counts - 1, 0)]
+    points = np.where(padding[..., None], last[:, None, :], points)
+    points[counts == 0] = 0.0
+    return points
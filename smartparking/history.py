@@ -0,0 +1,296 @@
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from smartparking.parking_lot import ParkingLot, STATE_NAMES
+
+logger = logging.getLogger(__name__)
+
+# Rollup tables and their bucket length in seconds
+ROLLUPS = {"minute": ("occupancy_minute", 60), "hour": ("occupancy_hour", 3600)}
+# Transition state that closes the last interval of a space removed by a zone reload
+STATE_REMOVED = -1
+# Groupings for aggregate queries (SQLite strftime formats over the hourly rollup, local time)
+AGGREGATE_GROUPS = {"hour_of_day": "%H", "weekday": "%w", "day": "%Y-%m-%d"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transitions (
+    lot TEXT NOT NULL,
+    space TEXT NOT NULL,
+    ts REAL NOT NULL,
+    state INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_lot_ts ON transitions (lot, ts);
+CREATE INDEX IF NOT EXISTS transitions_lot_space_ts ON transitions (lot, space, ts);
+"""
+
+_ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    lot TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    observed_seconds REAL NOT NULL,
+    occupied_seconds REAL NOT NULL,
+    space_seconds REAL NOT NULL,
+    min_occupied INTEGER NOT NULL,
+    max_occupied INTEGER NOT NULL,
+    PRIMARY KEY (lot, bucket)
+);
+"""
+
+_ROLLUP_UPSERT = """
+INSERT INTO {table} (lot, bucket, observed_seconds, occupied_seconds, space_seconds, min_occupied, max_occupied)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (lot, bucket) DO UPDATE SET
+    observed_seconds = observed_seconds + excluded.observed_seconds,
+    occupied_seconds = occupied_seconds + excluded.occupied_seconds,
+    space_seconds = space_seconds + excluded.space_seconds,
+    min_occupied = MIN(min_occupied, excluded.min_occupied),
+    max_occupied = MAX(max_occupied, excluded.max_occupied)
+"""
+
+
+class _LotTracker:
+    """Occupancy of one lot since the last accumulation, as seen by the writer thread."""
+
+    __slots__ = ("since", "occupied", "total")
+
+    def __init__(self, since: float, occupied: int, total: int):
+        self.since = since
+        self.occupied = occupied
+        self.total = total
+
+
+class HistoryStore:
+    """
+    Embedded SQLite history of space state transitions with per-minute and per-hour rollups.
+
+    The processing loop only enqueues the transitions reported by the lot's change listener;
+    a background thread writes them in batched transactions and maintains time-weighted
+    occupancy rollups, so range and aggregate queries never scan the raw transitions.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 5.0, max_queue: int = 100000):
+        """
+        :param db_path: Path of the SQLite database file (created if missing).
+        :param flush_interval: Seconds between write transactions.
+        :param max_queue: Maximum number of pending change batches; newer ones are dropped when full.
+        """
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._local = threading.local()
+
+        # Create the schema up front so queries work before the first flush
+        connection = self._connect()
+        with connection:
+            connection.executescript(_SCHEMA + "".join(_ROLLUP_SCHEMA.format(table=table)
+                                                       for table, _ in ROLLUPS.values()))
+        connection.close()
+
+        self._thread = threading.Thread(target=self._writer, name="HistoryWriter", daemon=True)
+        self._thread.start()
+        logger.info(f"Recording occupancy history to {db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30.0)
+        # WAL lets the API read while the writer thread commits
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def attach(self, lot_id: str, lot: ParkingLot):
+        """
+        Records the current states of the lot and every later transition. A zone reload records the
+        initial states of the added spaces and closes the removed ones with STATE_REMOVED.
+        """
+        lot.add_change_listener(lambda changed_lot, changed: self._enqueue(lot_id, changed_lot, changed))
+        lot.add_reload_listener(lambda reloaded_lot, added, removed:
+                                self._enqueue_reload(lot_id, reloaded_lot, added, removed))
+        self._enqueue(lot_id, lot, np.arange(len(lot.store.states)))
+
+    def _enqueue(self, lot_id: str, lot: ParkingLot, changed: np.ndarray):
+        space_ids = lot.geometry.space_ids
+        self._put(lot_id, lot, [(space_ids[index], state) for index, state in
+                                zip(changed.tolist(), lot.store.states[changed].tolist())])
+
+    def _enqueue_reload(self, lot_id: str, lot: ParkingLot, added: List[str], removed: List[str]):
+        if not added and not removed:
+            return
+        states = lot.store.states[[lot.spaces[space_id].index for space_id in added]].tolist()
+        self._put(lot_id, lot, list(zip(added, states)) + [(space_id, STATE_REMOVED) for space_id in removed])
+
+    def _put(self, lot_id: str, lot: ParkingLot, changes: List[Tuple[str, int]]):
+        # Runs on the processing thread: copy what the writer needs and never block
+        states = lot.store.states
+        item = (lot_id, time.time(), int(np.count_nonzero(states)), len(states), changes)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"History queue full, {self.dropped} change batch(es) dropped so far")
+
+    def _writer(self):
+        """Background thread: collects queued changes and writes them once per flush interval."""
+        connection = self._connect()
+        trackers: Dict[str, _LotTracker] = {}
+        minutes: Dict[Tuple[str, int], List[float]] = {}
+        pending: List[Tuple[str, str, float, int]] = []
+        next_flush = time.monotonic() + self.flush_interval
+
+        while True:
+            stopping = self._stop_event.is_set()
+            try:
+                # Wake up at least twice a second so close() does not wait for a whole flush interval
+                lot_id, ts, occupied, total, changes = self._queue.get(
+                    timeout=0 if stopping else min(max(next_flush - time.monotonic(), 0.0), 0.5))
+                tracker = trackers.get(lot_id)
+                if tracker is None:
+                    trackers[lot_id] = _LotTracker(ts, occupied, total)
+                else:
+                    self._accumulate(minutes, lot_id, tracker, ts)
+                    tracker.occupied, tracker.total = occupied, total
+                pending.extend((lot_id, space_id, ts, state) for space_id, state in changes)
+            except queue.Empty:
+                pass
+
+            if stopping:
+                # Drain the queue completely before the final flush
+                if not self._queue.empty():
+                    continue
+            elif time.monotonic() < next_flush:
+                continue
+
+            # Close the open intervals at the current time so the rollups are up to date
+            now = time.time()
+            for lot_id, tracker in trackers.items():
+                self._accumulate(minutes, lot_id, tracker, now)
+            try:
+                self._flush(connection, pending, minutes)
+            except sqlite3.Error as e:
+                logger.error(f"Writing occupancy history failed: {e}")
+            pending, minutes = [], {}
+            next_flush = time.monotonic() + self.flush_interval
+
+            if stopping:
+                break
+        connection.close()
+
+    @staticmethod
+    def _accumulate(minutes: Dict[Tuple[str, int], List[float]], lot_id: str, tracker: _LotTracker, until: float):
+        """Adds the lot's occupancy between tracker.since and until to the per-minute buckets."""
+        start = tracker.since
+        while start < until:
+            bucket = int(start // 60) * 60
+            end = min(bucket + 60, until)
+            duration = end - start
+            acc = minutes.get((lot_id, bucket))
+            if acc is None:
+                minutes[(lot_id, bucket)] = [duration, tracker.occupied * duration, tracker.total * duration,
+                                             tracker.occupied, tracker.occupied]
+            else:
+                acc[0] += duration
+                acc[1] += tracker.occupied * duration
+                acc[2] += tracker.total * duration
+                acc[3] = min(acc[3], tracker.occupied)
+                acc[4] = max(acc[4], tracker.occupied)
+            start = end
+        tracker.since = max(tracker.since, until)
+
+    @staticmethod
+    def _flush(connection: sqlite3.Connection, pending: List[Tuple[str, str, float, int]],
+               minutes: Dict[Tuple[str, int], List[float]]):
+        """Writes the pending transitions and rollup increments in one transaction."""
+        # Hourly increments are the sums of the minute increments
+        hours: Dict[Tuple[str, int], List[float]] = {}
+        for (lot_id, bucket), acc in minutes.items():
+            key = (lot_id, bucket // 3600 * 3600)
+            hour = hours.get(key)
+            if hour is None:
+                hours[key] = list(acc)
+            else:
+                hour[0] += acc[0]
+                hour[1] += acc[1]
+                hour[2] += acc[2]
+                hour[3] = min(hour[3], acc[3])
+                hour[4] = max(hour[4], acc[4])
+
+        with connection:
+            if pending:
+                connection.executemany("INSERT INTO transitions (lot, space, ts, state) VALUES (?, ?, ?, ?)", pending)
+            for resolution, increments in (("minute", minutes), ("hour", hours)):
+                connection.executemany(_ROLLUP_UPSERT.format(table=ROLLUPS[resolution][0]),
+                                       [(lot_id, bucket, *acc) for (lot_id, bucket), acc in increments.items()])
+
+    def close(self, timeout: float = 10.0):
+        """Writes everything still queued and stops the writer thread."""
+        self._stop_event.set()
+        self._thread.join(timeout=timeout)
+
+    # --- Queries (run on the caller's thread with its own read connection) ---
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30.0)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def occupancy(self, lot_id: str, start: float, end: float, resolution: str = "hour") -> List[Dict]:
+        """
+        Time-weighted occupancy per rollup bucket.
+        :param resolution: 'minute' or 'hour'.
+        :return: One entry per bucket in [start, end): bucket start time, average number of occupied
+                 spaces, average occupancy rate, and the minimum / maximum number of occupied spaces.
+        """
+        table, length = ROLLUPS[resolution]
+        rows = self._reader().execute(
+            f"SELECT bucket, observed_seconds, occupied_seconds, space_seconds, min_occupied, max_occupied "
+            f"FROM {table} WHERE lot = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            (lot_id, int(start // length) * length, end)).fetchall()
+        return [{"start": row["bucket"],
+                 "observed_seconds": round(row["observed_seconds"], 3),
+                 "avg_occupied": row["occupied_seconds"] / row["observed_seconds"] if row["observed_seconds"] else 0.0,
+                 "occupancy_rate": row["occupied_seconds"] / row["space_seconds"] if row["space_seconds"] else 0.0,
+                 "min_occupied": row["min_occupied"],
+                 "max_occupied": row["max_occupied"]} for row in rows]
+
+    def aggregate(self, lot_id: str, start: float, end: float, group_by: str = "hour_of_day") -> List[Dict]:
+        """
+        Time-weighted occupancy over [start, end) grouped by hour of day, weekday (0 = Sunday) or day,
+        computed from the hourly rollup (e.g. "average occupancy per hour last week").
+        """
+        pattern = AGGREGATE_GROUPS[group_by]
+        rows = self._reader().execute(
+            "SELECT strftime(?, bucket, 'unixepoch', 'localtime') AS grp, SUM(observed_seconds) AS observed, "
+            "SUM(occupied_seconds) AS occupied, SUM(space_seconds) AS space, MIN(min_occupied) AS min_occ, "
+            "MAX(max_occupied) AS max_occ FROM occupancy_hour WHERE lot = ? AND bucket >= ? AND bucket < ? "
+            "GROUP BY grp ORDER BY grp",
+            (pattern, lot_id, int(start // 3600) * 3600, end)).fetchall()
+        return [{group_by: row["grp"],
+                 "observed_seconds": round(row["observed"], 3),
+                 "avg_occupied": row["occupied"] / row["observed"] if row["observed"] else 0.0,
+                 "occupancy_rate": row["occupied"] / row["space"] if row["space"] else 0.0,
+                 "min_occupied": row["min_occ"],
+                 "max_occupied": row["max_occ"]} for row in rows]
+
+    def transitions(self, lot_id: str, start: float, end: float, space_id: Optional[str] = None,
+                    limit: int = 1000) -> List[Dict]:
+        """
+        Raw state transitions in [start, end), oldest first (optionally of one space). A space removed
+        by a zone reload ends with the state 'removed'.
+        """
+        query = "SELECT space, ts, state FROM transitions WHERE lot = ? AND ts >= ? AND ts < ?"
+        params: list = [lot_id, start, end]
+        if space_id is not None:
+            query += " AND space = ?"
+            params.append(space_id)
+        rows = self._reader().execute(query + " ORDER BY ts LIMIT ?", (*params, limit)).fetchall()
+        return [{"space": row["space"], "ts": row["ts"],
+                 "state": "removed" if row["state"] == STATE_REMOVED else STATE_NAMES[row["state"]]} for row in rows]
@@ -0,0 +1,244 @@
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency bucket upper bounds in seconds: 0.1ms .. ~18s in steps of sqrt(2)
+LATENCY_BUCKETS = tuple(0.0001 * 2 ** (i / 2) for i in range(36))
+# Bucket upper bounds for per-frame counts (e.g. detections per frame)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SUMMARY_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _quantile(bounds: Tuple[float, ...], counts: List[int], q: float) -> float:
+    """Estimates a quantile from bucket counts by interpolating linearly inside the bucket."""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if count and cumulative + count >= rank:
+            if index == len(bounds):  # Overflow bucket: the best we know is the largest bound
+                return bounds[-1]
+            lower = bounds[index - 1] if index > 0 else 0.0
+            return lower + (bounds[index] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return bounds[-1]
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class _Timer:
+    """Context manager that observes the elapsed wall time into a histogram."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    """Fixed-bucket histogram: observing is one bisect and a few increments."""
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last bucket collects values above the largest bound
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> _Timer:
+        """Returns a context manager that times its block: with histogram.time(): ..."""
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q: float, counts: Optional[List[int]] = None) -> float:
+        return _quantile(self.bounds, self.counts if counts is None else counts, q)
+
+
+class Counter:
+    """Monotonically increasing count."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+
+class RateMeter:
+    """Events per second over the last `window` events (e.g. the effective processing FPS)."""
+
+    def __init__(self, window: int = 120):
+        self._times: deque = deque(maxlen=window)
+
+    def tick(self):
+        self._times.append(time.monotonic())
+
+    def rate(self) -> float:
+        times = self._times
+        if len(times) < 2:
+            return 0.0
+        elapsed = times[-1] - times[0]
+        return (len(times) - 1) / elapsed if elapsed > 0 else 0.0
+
+
+class MetricsRegistry:
+    """
+    Process-wide collection of counters, histograms and callback gauges, rendered in the
+    Prometheus text exposition format.
+
+    Metrics are created on first use and cached, so hot paths should keep a reference to the
+    returned object (e.g. stage_time = metrics.stage("detect")) instead of looking it up per frame.
+    """
+
+    def __init__(self):
+        self._help: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._metrics: Dict[str, Dict[Tuple[Tuple[str, str], ...], object]] = {}
+        self._callbacks: Dict[str, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+        self._summary_thread: Optional[threading.Thread] = None
+
+    def _get(self, name: str, kind: str, help_text: str, factory: Callable[[], object], labels: Dict[str, str]):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        family = self._metrics.get(name)
+        metric = family.get(key) if family is not None else None
+        if metric is None:
+            with self._lock:
+                self._help.setdefault(name, (kind, help_text))
+                family = self._metrics.setdefault(name, {})
+                metric = family.get(key)
+                if metric is None:
+                    metric = family[key] = factory()
+        return metric
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._get(name, "counter", help_text, Counter, labels)
+
+    def histogram(self, name: str, help_text: str = "", buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+                  **labels) -> Histogram:
+        return self._get(name, "histogram", help_text, lambda: Histogram(buckets), labels)
+
+    def stage(self, stage: str) -> Histogram:
+        """Latency histogram (seconds) of one processing stage, e.g. 'capture', 'detect' or 'draw'."""
+        return self.histogram("smartparking_stage_seconds", "Time spent per processing stage.", stage=stage)
+
+    def gauge_function(self, name: str, help_text: str, function: Callable[[], float], kind: str = "gauge"):
+        """Registers a value that is read when the metrics are rendered (e.g. counters kept elsewhere)."""
+        with self._lock:
+            self._help[name] = (kind, help_text)
+            self._callbacks[name] = function
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            families = [(name, dict(children)) for name, children in self._metrics.items()]
+            callbacks = list(self._callbacks.items())
+
+        for name, children in families:
+            kind, help_text = self._help[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in children.items():
+                if isinstance(metric, Counter):
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                    continue
+                counts, total, count = metric.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(metric.bounds, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', f'{bound:.6g}'))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:.9g}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+            # Precomputed percentiles for dashboards without histogram_quantile()
+            if kind == "histogram":
+                lines.append(f"# TYPE {name}_quantile gauge")
+                for labels, metric in children.items():
+                    counts = metric.snapshot()[0]
+                    for q in SUMMARY_QUANTILES:
+                        lines.append(f"{name}_quantile{_format_labels(labels, ('quantile', str(q)))} "
+                                     f"{metric.quantile(q, counts):.6g}")
+
+        for name, function in callbacks:
+            kind, help_text = self._help[name]
+            try:
+                value = function()
+            except Exception as e:
+                logger.debug(f"Metric callback {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value:.6g}" if isinstance(value, float) else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def start_log_summary(self, interval: float):
+        """Logs the stage latencies (p50/p95/p99 over the last interval) and gauges every `interval` seconds."""
+        if self._summary_thread is not None or interval <= 0:
+            return
+
+        def report():
+            previous: Dict[Tuple[str, tuple], List[int]] = {}
+            while True:
+                time.sleep(interval)
+                parts = []
+                with self._lock:
+                    stages = list(self._metrics.get("smartparking_stage_seconds", {}).items())
+                for labels, histogram in stages:
+                    counts = histogram.snapshot()[0]
+                    last = previous.get(labels, [0] * len(counts))
+                    delta = [now - before for now, before in zip(counts, last)]
+                    previous[labels] = counts
+                    if sum(delta):
+                        p50, p95, p99 = (1000 * histogram.quantile(q, delta) for q in SUMMARY_QUANTILES)
+                        parts.append(f"{dict(labels)['stage']}: n={sum(delta)} p50={p50:.1f} p95={p95:.1f} "
+                                     f"p99={p99:.1f}ms")
+                with self._lock:
+                    gauges = [(name, function) for name, function in self._callbacks.items()
+                              if self._help[name][0] == "gauge"]
+                for name, function in gauges:
+                    try:
+                        parts.append(f"{name.replace('smartparking_', '')}={function():.1f}")
+                    except Exception:
+                        pass
+                if parts:
+                    logger.info("Metrics | " + " | ".join(parts))
+
+        self._summary_thread = threading.Thread(target=report, name="MetricsSummary", daemon=True)
+        self._summary_thread.start()
+
+
+# Process-wide registry used by the processing loop and the API
+metrics = MetricsRegistry()
@@ -1,7 +1,15 @@
-import cv2
 import numpy as np
-from typing import List, Dict, Any, Tuple
+from typing import Optional
 from smartparking.parking_lot import ParkingLot
+from smartparking.detections import detection_boxes
+from smartparking.patch_classifier import PatchClassifier, PatchSampler
+
+# Supported occupancy rules
+OCCUPANCY_MODES = ("center", "overlap", "classifier")
+# Supported overlap metrics for the 'overlap' mode:
+#   coverage - intersection area / space area (how much of the bay the vehicle box covers)
+#   iou      - intersection area / union area of the bay and the vehicle box
+OVERLAP_METRICS = ("coverage", "iou")
 
 
 class OccupancyLogic:
@@ -9,35 +17,134 @@ class OccupancyLogic:
     Component to determine parking space occupancy based on vehicle detections.
     """
 
-    def __init__(self, parking_lot: ParkingLot):
+    def __init__(self, parking_lot: ParkingLot, mode: str = "center", overlap_metric: str = "coverage",
+                 overlap_threshold: float = 0.5, classifier: Optional[PatchClassifier] = None):
+        """
+        :param parking_lot: The parking lot whose spaces are updated.
+        :param mode: 'center' marks a space occupied when a detection center lies inside it,
+                     'overlap' when a detection overlaps it by at least the space's threshold,
+                     'classifier' when the patch classifier scores its image patch as occupied (no detector).
+        :param overlap_metric: 'coverage' or 'iou' (only used in 'overlap' mode).
+        :param overlap_threshold: Default threshold for spaces without their own 'overlap_threshold'.
+        :param classifier: The patch classifier (required in 'classifier' mode).
+        """
+        if mode not in OCCUPANCY_MODES:
+            raise ValueError(f"Unknown occupancy mode '{mode}'. Expected one of {OCCUPANCY_MODES}.")
+        if overlap_metric not in OVERLAP_METRICS:
+            raise ValueError(f"Unknown overlap metric '{overlap_metric}'. Expected one of {OVERLAP_METRICS}.")
+        if mode == "classifier" and classifier is None:
+            raise ValueError("The 'classifier' occupancy mode needs a trained patch classifier.")
+
         self.parking_lot = parking_lot
+        self.mode = mode
+        self.overlap_metric = overlap_metric
+        self.overlap_threshold = overlap_threshold
+        self.classifier = classifier
+        self.sampler: Optional[PatchSampler] = None
 
-    def process_frame(self, detections: List[Dict[str, Any]]):
+        self._geometry_version = -1
+        self._sync_geometry()
+
+    def _sync_geometry(self):
+        """Resolves the per-space data again after the lot's zones were reloaded."""
+        lot = self.parking_lot
+        if lot.geometry_version == self._geometry_version:
+            return
+        self._geometry_version = lot.geometry_version
+        # Effective per-space thresholds, resolved once per geometry
+        thresholds = lot.overlap_thresholds
+        self.thresholds = np.where(np.isnan(thresholds), self.overlap_threshold, thresholds)
+        # Raw occupancy of the last analysed frame, reused for frames that skip detection
+        # (the reload carries each kept space's last raw state over)
+        self.last_occupied = lot.store.last_raw.astype(bool)
+        # Remap tables of the space patches, precomputed per geometry
+        if self.classifier is not None:
+            self.sampler = PatchSampler(lot.geometry, self.classifier.patch_size)
+
+    def process_frame(self, detections: np.ndarray) -> np.ndarray:
         """
         Checks for overlap between detections and parking polygons and updates state.
-        :param detections: List of vehicle detections (from Detector.detect).
-        """
-        for space_id, space in self.parking_lot.spaces.items():
-            is_occupied = False
-            parking_poly = np.array(space.polygon, dtype=np.int32)
-
-            # Simple heuristic: Check if the center of the detection box falls inside the parking polygon.
-            for det in detections:
-                x1, y1, x2, y2 = det['box']
-                # Calculate the center point of the detection box
-                center_x, center_y = (x1 + x2) // 2, (y1 + y2) // 2
-                center_point = (center_x, center_y)
-
-                # Use OpenCV's pointPolygonTest to check if the point is inside the polygon
-                # Returns +1 if inside, 0 if on edge, -1 if outside
-                # Since we pass True for measure_dist, it returns the distance.
-                # Distance > 0 means the point is strictly inside.
-                distance = cv2.pointPolygonTest(parking_poly, center_point, measureDist=False)
-
-                if distance >= 0:
-                    is_occupied = True
-                    # Optimization: once one vehicle is found, the spot is occupied
-                    break
-
-                    # Update the parking space state with temporal smoothing
-            space.update_state(is_occupied, self.parking_lot.smoothing_frames)
\ No newline at end of file
+        :param detections: Vehicle detections array (from Detector.detect).
+        :return: Indices of the spaces whose official state changed this frame.
+        """
+        occupied = self.raw_occupancy(detections)
+
+        # Update all parking space states at once with temporal smoothing
+        self.last_occupied = occupied
+        return self.parking_lot.update_states(occupied)
+
+    def raw_occupancy(self, detections: np.ndarray) -> np.ndarray:
+        """
+        Applies the occupancy rule to one frame without touching the lot's state.
+        :param detections: Vehicle detections array (from Detector.detect).
+        :return: Boolean array with the raw (unsmoothed) occupancy of each space.
+        """
+        self._sync_geometry()
+        occupied = np.zeros(len(self.parking_lot.geometry), dtype=bool)
+
+        if len(detections):
+            boxes = detection_boxes(detections)
+            if self.mode == "overlap":
+                self._mark_overlap(boxes, occupied)
+            else:
+                self._mark_center(boxes, occupied)
+        return occupied
+
+    def process_image(self, frame: np.ndarray, scale: float = 1.0) -> np.ndarray:
+        """
+        'classifier' mode: scores the patch of every space and updates state, without detections.
+        :param frame: The BGR frame (possibly downscaled, see scale).
+        :param scale: Source width / analysed frame width (VideoStream.scale).
+        :return: Indices of the spaces whose official state changed this frame.
+        """
+        occupied = self.classify(frame, scale)
+        self.last_occupied = occupied
+        return self.parking_lot.update_states(occupied)
+
+    def classify(self, frame: np.ndarray, scale: float = 1.0) -> np.ndarray:
+        """
+        Raw occupancy of every space from its image patch; all patches are scored in one batch.
+        :return: Boolean array with the raw (unsmoothed) occupancy of each space.
+        """
+        self._sync_geometry()
+        if not len(self.parking_lot.geometry):
+            return np.zeros(0, dtype=bool)
+        return self.classifier.predict(self.sampler.features(frame, scale))
+
+    def carry_forward(self) -> np.ndarray:
+        """
+        Advances smoothing for a frame that was not analysed (no scene change), reusing the raw
+        occupancy of the last analysed frame.
+        :return: Indices of the spaces whose official state changed this frame.
+        """
+        self._sync_geometry()
+        return self.parking_lot.update_states(self.last_occupied)
+
+    def _mark_center(self, boxes: np.ndarray, occupied: np.ndarray):
+        """
+        Simple heuristic: a space is occupied if the center of a detection box falls inside
+        its polygon (edges included). Centers are resolved through the precomputed label mask.
+        """
+        centers = np.stack([(boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2], axis=1)
+        _, space_indices = self.parking_lot.geometry.spaces_containing(centers)
+        occupied[space_indices] = True
+
+    def _mark_overlap(self, boxes: np.ndarray, occupied: np.ndarray):
+        """
+        Area rule: a space is occupied if any detection overlaps it by at least its threshold.
+        Only (box, space) pairs found through the grid index are evaluated.
+        """
+        geometry = self.parking_lot.geometry
+        box_indices, space_indices, intersections = geometry.overlap_areas(boxes)
+        if len(space_indices) == 0:
+            return
+
+        space_areas = geometry.areas[space_indices]
+        if self.overlap_metric == "iou":
+            box_areas = ((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))[box_indices]
+            denominators = space_areas + box_areas - intersections
+        else:
+            denominators = space_areas
+
+        scores = intersections / np.maximum(denominators, 1e-9)
+        occupied[space_indices[scores >= self.thresholds[space_indices]]] = True
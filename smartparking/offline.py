@@ -0,0 +1,242 @@
+import os
+import csv
+import time
+import logging
+from typing import Any, Dict, Generator, List, Optional, Tuple
+import cv2
+import numpy as np
+from smartparking.parking_lot import STATE_NAMES
+from smartparking.recording import smooth_states
+
+logger = logging.getLogger(__name__)
+
+# Seeking makes FFmpeg decode from the previous keyframe, so for short gaps grabbing
+# (demuxing without decoding) the frames in between is cheaper than a seek
+SEEK_MIN_GAP = 30
+
+TIMELINE_COLUMNS = ("space", "state", "start_frame", "end_frame", "start_time", "end_time", "duration")
+# Timeline state of every space over a segment that failed to process
+GAP_STATE = "unknown"
+
+# Per-process state of the pool workers (see init_worker)
+_worker: Dict[str, Any] = {}
+
+
+def video_info(path: str) -> Tuple[int, float]:
+    """:return: (frame count, frames per second) of a video file."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"Could not open video file: {path}")
+    try:
+        return int(capture.get(cv2.CAP_PROP_FRAME_COUNT)), capture.get(cv2.CAP_PROP_FPS) or 0.0
+    finally:
+        capture.release()
+
+
+def plan_segments(total_frames: int, step: int, frames_per_segment: int) -> List[Tuple[int, int]]:
+    """
+    Splits [0, total_frames) into segments whose boundaries are multiples of step, so every
+    segment samples the same frames a single pass over the file would.
+    """
+    frames_per_segment = max(step, frames_per_segment // step * step)
+    return [(start, min(start + frames_per_segment, total_frames))
+            for start in range(0, total_frames, frames_per_segment)]
+
+
+def iter_sampled_frames(capture: cv2.VideoCapture, start: int, end: int,
+                        step: int) -> Generator[Tuple[int, np.ndarray], None, None]:
+    """
+    Yields (frame index, frame) for every step-th frame in [start, end), seeking over long gaps and
+    grabbing through short ones. Stops early at the end of the file or on a read error.
+    """
+    position = None  # Index of the frame the next read() returns
+    for index in range(start, end, step):
+        if position is None or index < position or index - position >= SEEK_MIN_GAP:
+            if position != index:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        else:
+            for _ in range(index - position):
+                if not capture.grab():
+                    return
+        ret, frame = capture.read()
+        if not ret:
+            return
+        position = index + 1
+        yield index, frame
+
+
+def init_worker(options: Dict[str, Any]):
+    """Pool initializer: loads the zones and the model once per worker process."""
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    from smartparking.detector import Detector
+    from smartparking.parking_lot import ParkingLot
+    from smartparking.occupancy_logic import OccupancyLogic
+
+    parking_lot = ParkingLot(options['config'])
+    _worker['logic'] = OccupancyLogic(parking_lot, mode=options['occupancy_mode'],
+                                      overlap_metric=options['overlap_metric'],
+                                      overlap_threshold=options['overlap_threshold'])
+    _worker['detector'] = Detector(options['model'], max_batch_size=options['batch_size'],
+                                   backend=options['backend'], imgsz=options['imgsz'], threads=options['threads'])
+    _worker['options'] = options
+
+
+def process_segment(video_path: str, start: int, end: int, step: int) -> Tuple[int, np.ndarray, np.ndarray, int]:
+    """
+    Worker: detects every sampled frame of one segment and applies the occupancy rule.
+    Smoothing is left to the parent, which runs it over all segments in order.
+    :return: (segment start, sampled frame indices, raw occupancy as np.packbits rows, detection count)
+    """
+    from smartparking.detector import scale_detections
+    detector, logic, options = _worker['detector'], _worker['logic'], _worker['options']
+    max_width, batch_size = options['max_width'], options['batch_size']
+
+    indices: List[int] = []
+    rows: List[np.ndarray] = []
+    detection_count = 0
+    capture = cv2.VideoCapture(video_path)
+    try:
+        frames = iter_sampled_frames(capture, start, end, step)
+        while True:
+            batch = [item for _, item in zip(range(batch_size), frames)]
+            if not batch:
+                break
+            images, scale = [frame for _, frame in batch], 1.0
+            if max_width and images[0].shape[1] > max_width:
+                scale = images[0].shape[1] / max_width
+                images = [cv2.resize(image, (max_width, int(round(image.shape[0] / scale))),
+                                     interpolation=cv2.INTER_AREA) for image in images]
+            for (index, _), detections in zip(batch, detector.detect_batch(images)):
+                detection_count += len(detections)
+                indices.append(index)
+                rows.append(logic.raw_occupancy(scale_detections(detections, scale)))
+    finally:
+        capture.release()
+
+    occupied = np.array(rows, dtype=bool).reshape((len(rows), len(logic.parking_lot.geometry)))
+    return start, np.array(indices, dtype=np.int64), np.packbits(occupied, axis=1), detection_count
+
+
+def occupancy_intervals(frame_indices: np.ndarray, transitions: List[Tuple[int, int, int]], space_ids: List[str],
+                        end_frame: int, fps: float, start_time: float = 0.0,
+                        gaps: Optional[List[Tuple[int, int]]] = None) -> List[Tuple]:
+    """
+    Converts smoothed transitions into one row per space and state interval (TIMELINE_COLUMNS).
+    Every space starts free, like a live lot.
+    :param transitions: (sample index, space index, new state) from smooth_states().
+    :param end_frame: Frame at which the last interval of every space ends.
+    :param start_time: Time of frame 0 (e.g. the Unix time the recording started); times are in seconds.
+    :param gaps: Sorted (start, end) frame ranges without results (failed segments). Each is cut out of the
+                 intervals and becomes a GAP_STATE row of every space.
+    """
+    changes: List[List[Tuple[int, int]]] = [[] for _ in space_ids]
+    for sample, index, state in transitions:
+        changes[index].append((int(frame_indices[sample]), state))
+
+    rows = []
+    fps = fps if fps > 0 else 1.0
+
+    def add(space_id: str, state: str, start: int, end: int):
+        rows.append((space_id, state, start, end, start_time + start / fps, start_time + end / fps,
+                     (end - start) / fps))
+
+    for space_id, space_changes in zip(space_ids, changes):
+        boundaries = [(int(frame_indices[0]) if len(frame_indices) else 0, 0)] + space_changes
+        pending_gaps = list(gaps or [])
+        for (start, state), (end, _) in zip(boundaries, boundaries[1:] + [(end_frame, None)]):
+            # Gaps come before or inside the interval that follows them
+            while pending_gaps and pending_gaps[0][0] < end:
+                gap_start, gap_end = pending_gaps.pop(0)
+                if start < gap_start:
+                    add(space_id, STATE_NAMES[state], start, gap_start)
+                add(space_id, GAP_STATE, gap_start, gap_end)
+                start = max(start, gap_end)
+            if start < end:
+                add(space_id, STATE_NAMES[state], start, end)
+        for gap_start, gap_end in pending_gaps:
+            add(space_id, GAP_STATE, gap_start, gap_end)
+    return rows
+
+
+def write_timeline(path: str, rows: List[Tuple]):
+    """Writes timeline rows as Parquet (for a .parquet path, needs pyarrow) or CSV."""
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        columns = list(zip(*rows)) if rows else [[] for _ in TIMELINE_COLUMNS]
+        pq.write_table(pa.table(dict(zip(TIMELINE_COLUMNS, columns))), path)
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TIMELINE_COLUMNS)
+        writer.writerows(rows)
+
+
+class VideoJob:
+    """
+    Collects the segment results of one video and writes its timeline once every segment has
+    finished or failed. Failed segments become GAP_STATE intervals.
+    """
+
+    def __init__(self, path: str, segments: List[Tuple[int, int]], step: int, fps: float, output_path: str,
+                 start_time: float = 0.0):
+        self.path = path
+        self.segments = segments
+        self.step = step
+        self.fps = fps
+        self.output_path = output_path
+        self.start_time = start_time
+        self.results: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self.failed: Dict[int, int] = {}  # Start -> end frame of the segments that failed
+        self.detections = 0
+        self.started = time.perf_counter()
+
+    @property
+    def done(self) -> bool:
+        return len(self.results) + len(self.failed) == len(self.segments)
+
+    def add(self, start: int, frame_indices: np.ndarray, packed: np.ndarray, detections: int):
+        self.results[start] = (frame_indices, packed)
+        self.detections += detections
+
+    def fail(self, start: int, end: int):
+        self.failed[start] = end
+
+    def finish(self, space_ids: List[str], smoothing_frames: int) -> Dict[str, float]:
+        """
+        Stitches the segments together in frame order, smooths the whole sequence (so segment
+        boundaries behave exactly like a single pass) and writes the timeline. Smoothing runs on
+        across failed segments, as if their frames had not been sampled.
+        """
+        ordered = [self.results[start] for start, _ in self.segments if start in self.results]
+        frame_indices = np.concatenate([indices for indices, _ in ordered] or [np.zeros(0, dtype=np.int64)])
+        occupied = np.concatenate([np.unpackbits(packed, axis=1, count=len(space_ids)).astype(bool)
+                                   for _, packed in ordered] or [np.zeros((0, len(space_ids)), dtype=bool)])
+        flips, transitions = smooth_states(occupied.reshape((len(frame_indices), len(space_ids))), smoothing_frames)
+
+        # Adjacent failed segments form one gap
+        gaps: List[Tuple[int, int]] = []
+        for start, end in sorted(self.failed.items()):
+            if gaps and gaps[-1][1] == start:
+                gaps[-1] = (gaps[-1][0], end)
+            else:
+                gaps.append((start, end))
+
+        end_frame = self.segments[-1][1] if self.segments else 0
+        if len(frame_indices) and self.segments and self.segments[-1][0] not in self.failed:
+            end_frame = min(end_frame, int(frame_indices[-1]) + self.step)
+        rows = occupancy_intervals(frame_indices, transitions, space_ids, end_frame, self.fps, self.start_time, gaps)
+        write_timeline(self.output_path, rows)
+
+        elapsed = time.perf_counter() - self.started
+        video_seconds = end_frame / self.fps if self.fps > 0 else 0.0
+        return {"frames": len(frame_indices), "detections": self.detections, "flips": int(flips.sum()),
+                "intervals": len(rows), "elapsed": elapsed,
+                "speed": video_seconds / elapsed if elapsed > 0 else 0.0}
+
+
+def output_path_for(video_path: str, output_dir: Optional[str], extension: str) -> str:
+    directory = output_dir or os.path.dirname(os.path.abspath(video_path))
+    return os.path.join(directory, f"{os.path.splitext(os.path.basename(video_path))[0]}_occupancy.{extension}")
@@ -1,92 +1,309 @@
-import yaml
 import logging
-from typing import Dict, List, Tuple, Literal
+import threading
+import numpy as np
+from typing import Dict, List, Tuple, Literal, Optional, Callable
+from smartparking.zone_config import CompiledZones, compile_zones
 
 logger = logging.getLogger(__name__)
 
 # Define a type alias for the state
 ParkingState = Literal["occupied", "free"]
 
+# Encoded states used by the array-backed state store
+STATE_FREE = 0
+STATE_OCCUPIED = 1
+STATE_NAMES: Tuple[ParkingState, ParkingState] = ("free", "occupied")
+
+
+class SpaceStateStore:
+    """
+    Struct-of-arrays state for all spaces of a lot.
+
+    Temporal smoothing only needs to know how many consecutive frames agreed on the
+    current raw state, so each space keeps a run-length counter instead of a history list.
+    A space flips its official state once the run reaches smoothing_frames.
+    """
+
+    def __init__(self, size: int, smoothing_frames: int):
+        """
+        :param size: Number of spaces.
+        :param smoothing_frames: The number of consecutive frames required for a state change.
+        """
+        self.smoothing_frames = smoothing_frames
+        self.states = np.full(size, STATE_FREE, dtype=np.uint8)  # Official (smoothed) state
+        self.last_raw = np.full(size, STATE_FREE, dtype=np.uint8)  # Raw state of the previous frame
+        self.run_lengths = np.zeros(size, dtype=np.uint16)  # Consecutive frames with the same raw state
+        # Indices of the spaces that flipped during the last update() (sorted); update_one() adds or
+        # removes only its own space, so a pass over every space leaves the same result
+        self.changed = np.zeros(0, dtype=np.int64)
+        # Called with the indices of flipped spaces whenever an official state changes
+        self.on_change: Optional[Callable[[np.ndarray], None]] = None
+        # Runs never need to count past smoothing_frames, which also keeps them inside uint16
+        self._run_cap = min(max(smoothing_frames, 1), np.iinfo(np.uint16).max)
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def update(self, occupied: np.ndarray) -> np.ndarray:
+        """
+        Applies one frame of raw occupancy to every space at once.
+        :param occupied: Boolean array with the raw (unsmoothed) occupancy of each space.
+        :return: Indices of the spaces whose official state changed this frame.
+        """
+        raw = np.array(occupied, dtype=np.uint8)
+        same = raw == self.last_raw
+        self.run_lengths = np.where(same, np.minimum(self.run_lengths + 1, self._run_cap), 1).astype(np.uint16)
+        self.last_raw = raw
+
+        # Only change the official state once the raw state has been stable long enough
+        flips = (self.run_lengths >= self.smoothing_frames) & (self.states != raw)
+        self.changed = np.flatnonzero(flips)
+        self.states[self.changed] = raw[self.changed]
+        if len(self.changed) and self.on_change is not None:
+            self.on_change(self.changed)
+        return self.changed
+
+    def set_states(self, states: np.ndarray) -> np.ndarray:
+        """
+        Overwrites the official states (e.g. with states computed in another process).
+        :return: Indices of the spaces whose official state changed.
+        """
+        states = np.asarray(states, dtype=np.uint8)
+        self.changed = np.flatnonzero(states != self.states)
+        self.states[self.changed] = states[self.changed]
+        if len(self.changed) and self.on_change is not None:
+            self.on_change(self.changed)
+        return self.changed
+
+    def update_one(self, index: int, is_occupied: bool, smoothing_frames: int) -> bool:
+        """
+        Applies one frame of raw occupancy to a single space.
+        :return: True if the official state of the space changed.
+        """
+        raw = STATE_OCCUPIED if is_occupied else STATE_FREE
+        if raw == self.last_raw[index]:
+            self.run_lengths[index] = min(int(self.run_lengths[index]) + 1, np.iinfo(np.uint16).max)
+        else:
+            self.run_lengths[index] = 1
+        self.last_raw[index] = raw
+
+        if self.run_lengths[index] >= smoothing_frames and self.states[index] != raw:
+            self.states[index] = raw
+            if index not in self.changed:
+                self.changed = np.union1d(self.changed, [index]).astype(np.int64)
+            if self.on_change is not None:
+                self.on_change(np.array([index], dtype=np.int64))
+            return True
+        if index in self.changed:
+            self.changed = self.changed[self.changed != index]
+        return False
+
 
 class ParkingSpace:
     """Represents a single parking space with its ID, polygon, and current state."""
 
-    def __init__(self, space_id: str, polygon: List[Tuple[int, int]]):
+    # Spaces are lightweight views; their state lives in the lot's SpaceStateStore
+    __slots__ = ("id", "polygon", "overlap_threshold", "index", "_store")
+
+    def __init__(self, space_id: str, polygon: List[Tuple[int, int]], store: SpaceStateStore, index: int,
+                 overlap_threshold: Optional[float] = None):
         self.id = space_id
         # Ensure polygon coordinates are integers
         self.polygon = [tuple(map(int, p)) for p in polygon]
-        self.state: ParkingState = "free"
-        self.state_history: List[ParkingState] = []  # For temporal smoothing
+        # Per-space override for the overlap occupancy mode (None = use the global threshold)
+        self.overlap_threshold = overlap_threshold
+        self.index = index
+        self._store = store
+
+    @property
+    def state(self) -> ParkingState:
+        return STATE_NAMES[self._store.states[self.index]]
+
+    @state.setter
+    def state(self, value: ParkingState):
+        self._store.states[self.index] = STATE_OCCUPIED if value == "occupied" else STATE_FREE
 
-    def update_state(self, is_occupied_current_frame: bool, smoothing_frames: int):
+    def update_state(self, is_occupied_current_frame: bool, smoothing_frames: int) -> bool:
         """
         Updates the state using temporal smoothing.
         :param is_occupied_current_frame: Whether a vehicle was detected in the space this frame.
         :param smoothing_frames: The number of consecutive frames required for a state change.
+        :return: True if the official state changed.
         """
-        # Record current frame's raw state
-        raw_state = "occupied" if is_occupied_current_frame else "free"
-
-        # Keep a history of the last N frames' raw states
-        self.state_history.append(raw_state)
-        if len(self.state_history) > smoothing_frames:
-            self.state_history.pop(0)
-
-        # Only change the official state if the history is consistent
-        if len(self.state_history) == smoothing_frames:
-
-            # Check for a transition to 'occupied'
-            if raw_state == "occupied" and all(s == "occupied" for s in self.state_history):
-                self.state = "occupied"
-
-            # Check for a transition to 'free'
-            elif raw_state == "free" and all(s == "free" for s in self.state_history):
-                self.state = "free"
-
-            # Otherwise, the state remains unchanged (temporal smoothing in effect)
+        return self._store.update_one(self.index, is_occupied_current_frame, smoothing_frames)
 
 
 class ParkingLot:
     """Manages all parking spaces and their collective status."""
 
-    def __init__(self, config_path: str, smoothing_frames: int = 5):
+    def __init__(self, config_path: str, smoothing_frames: int = 5, use_cache: bool = True):
+        """
+        :param config_path: Zone config (YAML); its compiled form is cached next to it (see zone_config).
+        :param smoothing_frames: The number of consecutive frames required for a state change.
+        :param use_cache: Use the compiled zone cache.
+        """
+        self.config_path = config_path
+        self.use_cache = use_cache
         self.spaces: Dict[str, ParkingSpace] = {}
         self.smoothing_frames = smoothing_frames
-        self._load_config(config_path)
+        self.store = SpaceStateStore(0, smoothing_frames)
+        # Callbacks invoked as listener(lot, changed_indices) after official states flipped
+        self._change_listeners: List[Callable[["ParkingLot", np.ndarray], None]] = []
+        # Callbacks invoked as listener(lot, added_ids, removed_ids) after a reload replaced the geometry
+        self._reload_listeners: List[Callable[["ParkingLot", List[str], List[str]], None]] = []
+        # Incremented whenever a reload replaces the geometry; components that cache per-space data
+        # (OccupancyLogic, Visualizer, RoiPlanner, ChangeDetector) compare it to rebuild their caches
+        self.geometry_version = 0
+        # (config_path, zones) staged by stage_reload / stage_zones, swapped in by apply_pending_reload
+        self._pending: Optional[Tuple[str, CompiledZones]] = None
+        self._reload_lock = threading.Lock()
+        self._apply_zones(self._load_config(config_path))
 
-    def _load_config(self, config_path: str):
-        """Loads parking space definitions from the YAML file."""
+    def _load_config(self, config_path: str) -> CompiledZones:
+        """Loads parking space definitions from the YAML file (or its compiled cache)."""
         try:
-            with open(config_path, 'r') as f:
-                config = yaml.safe_load(f)
+            return compile_zones(config_path, use_cache=self.use_cache)
+        except Exception as e:
+            logger.error(f"Failed to load parking configuration from {config_path}: {e}")
+            raise
 
-            spaces_data = config.get('parking_spaces', {})
-            if not spaces_data:
-                logger.error(f"Configuration file {config_path} has no 'parking_spaces' defined.")
-                return
+    def _apply_zones(self, zones: CompiledZones):
+        """
+        Makes the compiled zones the lot's geometry. Spaces that keep their id keep their official
+        state and smoothing progress; new spaces start free.
+        """
+        store = SpaceStateStore(len(zones.space_ids), self.smoothing_frames)
+        old_indices = {space_id: space.index for space_id, space in self.spaces.items()}
+        kept = [(index, old_indices[space_id]) for index, space_id in enumerate(zones.space_ids)
+                if space_id in old_indices]
+        if kept:
+            new, old = np.array(kept, dtype=np.int64).T
+            store.states[new] = self.store.states[old]
+            store.last_raw[new] = self.store.last_raw[old]
+            store.run_lengths[new] = self.store.run_lengths[old]
 
-            for space_id, data in spaces_data.items():
-                polygon = data.get('polygon')
-                if polygon and len(polygon) >= 3:
-                    self.spaces[space_id] = ParkingSpace(space_id, polygon)
-                else:
-                    logger.warning(f"Skipping parking space {space_id}: Invalid polygon definition.")
+        self.spaces = {space_id: ParkingSpace(space_id, polygon, store, index,
+                                              None if np.isnan(threshold) else float(threshold))
+                       for index, (space_id, polygon, threshold) in
+                       enumerate(zip(zones.space_ids, zones.polygons, zones.overlap_thresholds.tolist()))}
+        store.on_change = self._notify_change
+        self.store = store
+        self.geometry = zones.geometry
+        self.overlap_thresholds = zones.overlap_thresholds
+        self.config_hash = zones.config_hash
+        self.zones = zones
+
+    def stage_reload(self, config_path: Optional[str] = None) -> bool:
+        """
+        Compiles the zone config again (on the calling thread, e.g. a file watcher or an API request)
+        and queues it to be swapped in by apply_pending_reload().
+        :param config_path: New config path (None = reload the current one).
+        :return: False if the config is unchanged.
+        """
+        config_path = config_path or self.config_path
+        return self.stage_zones(config_path, self._load_config(config_path))
 
-            logger.info(f"Loaded {len(self.spaces)} parking spaces from {config_path}")
+    def stage_zones(self, config_path: str, zones: CompiledZones) -> bool:
+        """
+        Queues already compiled zones to be swapped in by apply_pending_reload(), e.g. the zones
+        another process applied to the lot this one mirrors.
+        :param config_path: The config the zones were compiled from.
+        :return: False if they are the current zones.
+        """
+        if not zones.space_ids:
+            raise ValueError(f"{config_path} defines no valid parking spaces; keeping the current zones")
+        with self._reload_lock:
+            # Compare with the newest zones, including ones staged but not applied yet
+            current = self._pending if self._pending is not None else (self.config_path, self.zones)
+            if zones.config_hash == current[1].config_hash and config_path == current[0]:
+                return False
+            self._pending = (config_path, zones)
+        return True
 
-        except Exception as e:
-            logger.error(f"Failed to load parking configuration from {config_path}: {e}")
-            raise
+    def apply_pending_reload(self) -> bool:
+        """
+        Swaps in a staged config. Called by the processing loop at the start of a frame, so a frame
+        is always evaluated against a single geometry.
+        :return: True if the geometry was replaced.
+        """
+        if self._pending is None:
+            return False
+        with self._reload_lock:
+            (config_path, zones), self._pending = self._pending, None
+        old_spaces = self.spaces
+        self._apply_zones(zones)
+        self.config_path = config_path
+        self.geometry_version += 1
+        added = [space_id for space_id in self.spaces if space_id not in old_spaces]
+        removed = [space_id for space_id in old_spaces if space_id not in self.spaces]
+        logger.info(f"Reloaded {self.config_path}: {len(self.spaces)} spaces "
+                    f"({len(self.spaces) - len(added)} kept, {len(added)} added, {len(removed)} removed)")
+        for listener in self._reload_listeners:
+            try:
+                listener(self, added, removed)
+            except Exception as e:
+                logger.error(f"Reload listener failed: {e}", exc_info=True)
+        return True
+
+    def update_states(self, occupied: np.ndarray) -> np.ndarray:
+        """
+        Applies one frame of raw occupancy (in space order) with temporal smoothing.
+        :param occupied: Boolean array, one entry per space.
+        :return: Indices of the spaces whose official state changed this frame.
+        """
+        return self.store.update(occupied)
+
+    def apply_states(self, states: np.ndarray) -> np.ndarray:
+        """
+        Sets the official states directly, bypassing smoothing. Used to mirror a lot that is
+        processed elsewhere (e.g. in a camera worker process).
+        :param states: uint8 array of STATE_FREE / STATE_OCCUPIED, one entry per space.
+        :return: Indices of the spaces whose official state changed.
+        """
+        return self.store.set_states(states)
+
+    def add_change_listener(self, listener: Callable[["ParkingLot", np.ndarray], None]):
+        """
+        Registers a callback for state flips. It runs on the thread that updates the states
+        (the processing loop), so it must be quick and must not block.
+        :param listener: Called as listener(lot, changed_indices); the new states are in lot.store.states.
+        """
+        self._change_listeners.append(listener)
+
+    def add_reload_listener(self, listener: Callable[["ParkingLot", List[str], List[str]], None]):
+        """
+        Registers a callback for zone reloads, run by apply_pending_reload() after the new geometry
+        was swapped in (on the processing thread, like the change listeners).
+        :param listener: Called as listener(lot, added_ids, removed_ids); added spaces start free.
+        """
+        self._reload_listeners.append(listener)
+
+    def _notify_change(self, changed: np.ndarray):
+        for listener in self._change_listeners:
+            try:
+                listener(self, changed)
+            except Exception as e:
+                logger.error(f"State change listener failed: {e}", exc_info=True)
+
+    def changed_space_ids(self) -> List[str]:
+        """Returns the ids of the spaces that changed state during the last update_states() call."""
+        return [self.geometry.space_ids[index] for index in self.store.changed]
+
+    @property
+    def occupied_count(self) -> int:
+        return int(np.count_nonzero(self.store.states))
 
     def get_status(self) -> Dict:
         """Returns the current occupancy status summary."""
-        occupied_count = sum(1 for space in self.spaces.values() if space.state == "occupied")
-        total_count = len(self.spaces)
+        states = self.store.states.copy()
+        occupied_count = int(np.count_nonzero(states))
+        total_count = len(states)
         free_count = total_count - occupied_count
 
         return {
             "total": total_count,
             "occupied": occupied_count,
             "free": free_count,
-            "spaces": [{"id": space.id, "state": space.state} for space in self.spaces.values()]
-        }
\ No newline at end of file
+            "spaces": [{"id": space_id, "state": STATE_NAMES[state]}
+                       for space_id, state in zip(self.geometry.space_ids, states.tolist())]
+        }
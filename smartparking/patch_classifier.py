@@ -0,0 +1,250 @@
+import math
+import logging
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+import cv2
+import numpy as np
+from smartparking.geometry import LotGeometry
+
+logger = logging.getLogger(__name__)
+
+# Size (width, height) of the normalized patch every space is warped to
+PATCH_SIZE = (32, 32)
+# Patches are pooled into CELLS x CELLS cells for the features
+CELLS = 4
+# Unsigned gradient orientation bins per cell
+ORIENTATION_BINS = 8
+# Length of the feature vector: intensity and orientation histogram per cell, plus 4 global statistics
+FEATURE_COUNT = CELLS * CELLS * (1 + ORIENTATION_BINS) + 4
+# Bump when the features change, so classifiers trained on the old ones are rejected
+FEATURE_VERSION = 1
+
+
+class PatchSampler:
+    """
+    Extracts a normalized patch for every parking space of a fixed camera.
+
+    Each space polygon is mapped to a PATCH_SIZE rectangle by a perspective transform. The
+    transforms are turned into one pair of remap tables at load time, laid out as a mosaic of
+    all patches, so a single cv2.remap call samples every space of a frame.
+    """
+
+    def __init__(self, geometry: LotGeometry, patch_size: Tuple[int, int] = PATCH_SIZE):
+        """
+        :param geometry: The lot geometry (polygons in source-frame coordinates).
+        :param patch_size: (width, height) of a patch.
+        """
+        self.patch_size = patch_size
+        self.count = len(geometry)
+        width, height = patch_size
+        # Mosaic of columns x rows patches (cv2.remap limits each map side to 32767 pixels)
+        self.columns = max(1, math.ceil(math.sqrt(self.count)))
+        self.rows = max(1, math.ceil(self.count / self.columns))
+
+        # 1. Patch -> image homography of every space
+        corners = np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32)
+        homographies = np.stack([cv2.getPerspectiveTransform(corners, _quad(contour))
+                                 for contour in geometry.contours]) if self.count else np.zeros((0, 3, 3))
+
+        # 2. Image coordinates of every patch pixel center, all spaces at once
+        xs, ys = np.meshgrid(np.arange(width) + 0.5, np.arange(height) + 0.5)
+        points = np.stack([xs.ravel(), ys.ravel(), np.ones(xs.size)], axis=1)
+        mapped = np.einsum('nij,pj->npi', homographies, points)
+        mapped = mapped[..., :2] / mapped[..., 2:]
+
+        # 3. Lay the per-space maps out as a mosaic; unused cells sample outside the frame
+        mosaic = np.full((self.rows * self.columns, height, width, 2), -1.0, dtype=np.float32)
+        mosaic[:self.count] = mapped.reshape((self.count, height, width, 2))
+        mosaic = mosaic.reshape((self.rows, self.columns, height, width, 2)).transpose(0, 2, 1, 3, 4)
+        self._maps = np.ascontiguousarray(mosaic.reshape((self.rows * height, self.columns * width, 2)))
+        self._scaled_maps: Dict[float, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _maps_for(self, scale: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Fixed-point remap tables for frames downscaled by scale (source width / frame width)."""
+        maps = self._scaled_maps.get(scale)
+        if maps is None:
+            maps = cv2.convertMaps(self._maps / np.float32(scale), None, cv2.CV_16SC2)
+            self._scaled_maps = {scale: maps}
+        return maps
+
+    def patches(self, frame: np.ndarray, scale: float = 1.0) -> np.ndarray:
+        """
+        :param frame: BGR frame (possibly downscaled, see scale).
+        :param scale: Source width / frame width (VideoStream.scale).
+        :return: (n, height, width, 3) uint8 patches in geometry order.
+        """
+        mosaic = self._remap(frame, scale)
+        width, height = self.patch_size
+        patches = mosaic.reshape((self.rows, height, self.columns, width, 3)).transpose(0, 2, 1, 3, 4)
+        return patches.reshape((-1, height, width, 3))[:self.count]
+
+    def features(self, frame: np.ndarray, scale: float = 1.0) -> np.ndarray:
+        """:return: (n, feature_count) float32 features of every space (see patch_features)."""
+        return patch_features(self._remap(frame, scale), self.patch_size, self.columns)[:self.count]
+
+    def _remap(self, frame: np.ndarray, scale: float) -> np.ndarray:
+        map1, map2 = self._maps_for(scale)
+        return cv2.remap(frame, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+
+def patch_features(mosaic: np.ndarray, patch_size: Tuple[int, int] = PATCH_SIZE, columns: int = 1) -> np.ndarray:
+    """
+    Classic appearance features, computed for all patches of a mosaic at once:
+    contrast-normalized intensity per cell, a gradient orientation histogram per cell (HOG-like,
+    L2-normalized per patch) and global contrast, edge and saturation statistics.
+    :param mosaic: BGR mosaic of rows x columns patches (PatchSampler), or patches stacked vertically.
+    :return: (rows * columns, feature_count) float32 features, in mosaic row-major order.
+    """
+    width, height = patch_size
+    rows = mosaic.shape[0] // height
+    count, cell_count, pixels = rows * columns, CELLS * CELLS, width * height
+    gray = cv2.cvtColor(mosaic, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    saturation = cv2.cvtColor(mosaic, cv2.COLOR_BGR2HSV)[..., 1].astype(np.float32)
+
+    def means(image: np.ndarray, cells: int) -> np.ndarray:
+        """(count, cells * cells) means of each patch's cells (area resampling, exact for divisible sizes)."""
+        pooled = cv2.resize(image, (columns * cells, rows * cells), interpolation=cv2.INTER_AREA)
+        return pooled.reshape((rows, cells, columns, cells)).transpose(0, 2, 1, 3).reshape((count, -1))
+
+    def mean_std(image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        mean, square = means(image, 1)[:, 0], means(image * image, 1)[:, 0]
+        return mean, np.sqrt(np.maximum(square - mean * mean, 0.0))
+
+    # Central-difference gradients over the whole mosaic, then zeroed on the patch borders,
+    # so no gradient crosses from one patch into the next
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=1)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=1)
+    gx[:, 0::width] = 0.0
+    gx[:, width - 1::width] = 0.0
+    gy[0::height] = 0.0
+    gy[height - 1::height] = 0.0
+    magnitude, orientation = cv2.cartToPolar(gx, gy, angleInDegrees=True)
+    # Unsigned orientation: angles 180 degrees apart share a bin
+    bins = (orientation * (ORIENTATION_BINS / 180.0)).astype(np.int32).ravel() % ORIENTATION_BINS
+
+    # 1. Contrast-normalized mean intensity per cell
+    mean, std = mean_std(gray)
+    intensity = (means(gray, CELLS) - mean[:, None]) / (std[:, None] + 1.0)
+
+    # 2. Magnitude-weighted orientation histogram per cell, accumulated with one bincount
+    histogram = np.bincount(_histogram_index(rows, columns, width, height) + bins, weights=magnitude.ravel(),
+                            minlength=count * cell_count * ORIENTATION_BINS).reshape((count, -1))
+    edges = histogram.sum(axis=1) / pixels
+    histogram /= np.linalg.norm(histogram, axis=1, keepdims=True) + 1e-6
+
+    # 3. Global statistics (scaled to roughly unit range)
+    saturation_mean, saturation_std = mean_std(saturation)
+    statistics = np.stack([std / 64.0, edges / 64.0, saturation_mean / 255.0, saturation_std / 255.0], axis=1)
+
+    return np.concatenate([intensity, histogram, statistics], axis=1).astype(np.float32)
+
+
+class PatchClassifier:
+    """
+    Logistic regression on patch_features(): scores every space of a frame in one matrix product.
+    Saved as a small .npz file (see train_classifier.py).
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float, mean: np.ndarray, scale: np.ndarray,
+                 patch_size: Tuple[int, int] = PATCH_SIZE, threshold: float = 0.5):
+        """
+        :param weights: Weights of the standardized features.
+        :param bias: Intercept.
+        :param mean: Feature means of the training set (standardization).
+        :param scale: Feature standard deviations of the training set.
+        :param patch_size: (width, height) of the patches the classifier was trained on.
+        :param threshold: Probability at or above which a space counts as occupied.
+        """
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.patch_size = tuple(int(v) for v in patch_size)
+        self.threshold = threshold
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "PatchClassifier":
+        """
+        :param threshold: Overrides the decision threshold stored with the classifier.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["feature_version"]) != FEATURE_VERSION:
+                raise ValueError(f"Classifier {path} was trained on feature version {int(data['feature_version'])}, "
+                                 f"expected {FEATURE_VERSION}. Retrain it with train_classifier.py.")
+            classifier = cls(data["weights"], float(data["bias"]), data["mean"], data["scale"],
+                             tuple(data["patch_size"]), float(data["threshold"]) if threshold is None else threshold)
+        logger.info(f"Loaded occupancy classifier from {path}")
+        return classifier
+
+    def save(self, path: str):
+        np.savez(path, weights=self.weights, bias=np.float32(self.bias), mean=self.mean, scale=self.scale,
+                 patch_size=np.array(self.patch_size), threshold=np.float32(self.threshold),
+                 feature_version=np.int64(FEATURE_VERSION))
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """:return: Occupancy probability of every row of features."""
+        logits = ((features - self.mean) / self.scale) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-np.clip(logits, -30.0, 30.0)))
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """:return: Boolean occupancy of every row of features."""
+        return self.predict_proba(features) >= self.threshold
+
+    @classmethod
+    def train(cls, features: np.ndarray, labels: np.ndarray, epochs: int = 300, learning_rate: float = 0.5,
+              l2: float = 1e-3, patch_size: Tuple[int, int] = PATCH_SIZE) -> "PatchClassifier":
+        """
+        Fits the logistic regression with full-batch gradient descent on standardized features.
+        Both classes are weighted equally, as most bays are usually in one state.
+        :param features: (n, feature_count) features from PatchSampler.features.
+        :param labels: (n,) boolean occupancy labels.
+        :param l2: L2 regularization strength.
+        """
+        labels = np.asarray(labels, dtype=np.float32)
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0) + 1e-6
+        x = (features - mean) / scale
+
+        positives = max(float(labels.sum()), 1.0)
+        negatives = max(float(len(labels) - labels.sum()), 1.0)
+        sample_weights = np.where(labels > 0, 0.5 / positives, 0.5 / negatives).astype(np.float32)
+
+        weights = np.zeros(x.shape[1], dtype=np.float32)
+        bias = 0.0
+        for _ in range(epochs):
+            probabilities = 1.0 / (1.0 + np.exp(-np.clip(x @ weights + bias, -30.0, 30.0)))
+            error = (probabilities - labels) * sample_weights
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * float(error.sum())
+        return cls(weights, bias, mean, scale, patch_size)
+
+
+@lru_cache(maxsize=8)
+def _histogram_index(rows: int, columns: int, width: int, height: int) -> np.ndarray:
+    """
+    Flat histogram index (patch, cell, orientation bin 0) of every pixel of a rows x columns mosaic;
+    shared by every frame of a lot.
+    """
+    y, x = np.arange(rows * height), np.arange(columns * width)
+    patch_index = (y // height)[:, None] * columns + (x // width)[None, :]
+    cell_rows = np.minimum(np.arange(height) // max(height // CELLS, 1), CELLS - 1)
+    cell_columns = np.minimum(np.arange(width) // max(width // CELLS, 1), CELLS - 1)
+    cell = np.tile(cell_rows[:, None] * CELLS + cell_columns[None, :], (rows, columns))
+    return ((patch_index * (CELLS * CELLS) + cell) * ORIENTATION_BINS).ravel()
+
+
+def _quad(contour: np.ndarray) -> np.ndarray:
+    """
+    Four corners of a space (top-left, top-right, bottom-right, bottom-left): the polygon itself
+    for quadrilaterals, otherwise its minimum-area rectangle.
+    """
+    points = contour[:, 0].astype(np.float32)
+    if len(points) != 4:
+        points = cv2.boxPoints(cv2.minAreaRect(points)).astype(np.float32)
+    sums, differences = points.sum(axis=1), points[:, 1] - points[:, 0]
+    quad = np.array([points[np.argmin(sums)], points[np.argmin(differences)],
+                     points[np.argmax(sums)], points[np.argmax(differences)]], dtype=np.float32)
+    # Degenerate orderings (e.g. diamond-shaped bays) fall back to the polygon order
+    if len({tuple(p) for p in quad.tolist()}) < 4:
+        quad = points
+    return quad
@@ -0,0 +1,458 @@
+import time
+import queue
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from collections import deque
+from typing import Any, Deque, Dict, Generator, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# What a stage does when the next stage is behind:
+#   block - wait, so every decoded frame is analysed (and rendered); backpressure reaches the decoder
+#   drop  - shed the frame instead (no free ring slot: not admitted; renderer busy: not drawn)
+PIPELINE_POLICIES = ("block", "drop")
+
+# Shared counters, indexed by these positions
+COUNTERS = ("decoded", "detected", "rendered", "dropped_decode", "dropped_render")
+_DECODED, _DETECTED, _RENDERED, _DROPPED_DECODE, _DROPPED_RENDER = range(len(COUNTERS))
+
+# Seconds a stage waits on a queue before checking the stop event again
+POLL_INTERVAL = 0.2
+
+
+class FrameRing:
+    """
+    Fixed-size frames in one shared memory block, addressed by slot index.
+
+    Frames never travel through a queue: the decoder writes into a free slot and the later
+    stages read it through NumPy views of the same memory. Only slot indices are passed on.
+    """
+
+    def __init__(self, slots: int, shape: Tuple[int, ...], name: Optional[str] = None):
+        """
+        :param slots: Number of frames in the ring.
+        :param shape: Shape of one uint8 frame, e.g. (height, width, 3).
+        :param name: Name of an existing ring to attach to (None = create a new one).
+        """
+        self.slots = slots
+        self.shape = tuple(shape)
+        frame_bytes = int(np.prod(self.shape))
+        self._memory = shared_memory.SharedMemory(name=name, create=name is None, size=slots * frame_bytes)
+        self._frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self._memory.buf)
+
+    @property
+    def spec(self) -> Tuple[int, Tuple[int, ...], str]:
+        """(slots, shape, name): everything another process needs to attach."""
+        return self.slots, self.shape, self._memory.name
+
+    @classmethod
+    def attach(cls, spec: Tuple[int, Tuple[int, ...], str]) -> "FrameRing":
+        slots, shape, name = spec
+        return cls(slots, shape, name)
+
+    def frame(self, slot: int) -> np.ndarray:
+        """View (no copy) of the frame in a slot."""
+        return self._frames[slot]
+
+    def close(self):
+        # Views must be gone before the buffer can be released
+        self._frames = None
+        self._memory.close()
+
+    def unlink(self):
+        """Frees the shared memory (once, by its owner, after every process has closed it)."""
+        try:
+            self._memory.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _setup_worker_logging():
+    # Spawned processes start without the parent's logging setup
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+
+def _get(source: "mp.Queue", stop: "mp.Event") -> Any:
+    """Blocking get that gives up (returns None) once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            return source.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return None
+
+
+def decode_worker(source: str, stream_options: Dict[str, Any], slots: int, policy: str, free_slots: "mp.Queue",
+                  detect_queue: "mp.Queue", status_queue: "mp.Queue", counters: "mp.Array", stop: "mp.Event"):
+    """
+    Decode process: reads the video, creates the ring for its frame size and fills free slots.
+    Reports ("ready", ring spec, fps, scale) or ("error", message) on the status queue.
+    """
+    _setup_worker_logging()
+    from smartparking.video_stream import VideoStream
+
+    ring = None
+    try:
+        with VideoStream(source, **stream_options) as stream:
+            frames = stream.frame_generator()
+            first = next(frames, None)
+            if first is None:
+                status_queue.put(("error", f"No frames from {source}"))
+                return
+
+            # 1. Size the ring for the delivered (possibly downscaled) frames
+            ring = FrameRing(slots, first[1].shape)
+            for slot in range(slots):
+                free_slots.put(slot)
+            status_queue.put(("ready", ring.spec, stream.get_fps(), stream.scale))
+
+            # 2. Copy each frame into a free slot and hand the slot index on
+            frame_number, pending = 0, first
+            while pending is not None and not stop.is_set():
+                _, frame = pending
+                if policy == "drop":
+                    try:
+                        slot = free_slots.get_nowait()
+                    except queue.Empty:
+                        slot = None
+                        with counters.get_lock():
+                            counters[_DROPPED_DECODE] += 1
+                else:
+                    slot = _get(free_slots, stop)
+
+                if slot is not None:
+                    if frame.shape == ring.shape:
+                        np.copyto(ring.frame(slot), frame)
+                        with counters.get_lock():
+                            counters[_DECODED] += 1
+                        detect_queue.put((slot, frame_number, time.monotonic()))
+                    else:
+                        logger.warning(f"Skipping frame {frame_number}: size changed to {frame.shape}")
+                        free_slots.put(slot)
+                frame_number += 1
+                pending = next(frames, None)
+    except Exception as e:
+        logger.error(f"Decoder failed: {e}")
+        status_queue.put(("error", str(e)))
+    finally:
+        # End of stream marker for the next stage
+        detect_queue.put(None)
+        if ring is not None:
+            ring.close()
+
+
+def detect_worker(ring_spec: Tuple, detector_options: Dict[str, Any], batch_size: int, scale: float,
+                  detect_queue: "mp.Queue", result_queue: "mp.Queue", status_queue: "mp.Queue",
+                  counters: "mp.Array", stop: "mp.Event"):
+    """
+    Detection process: runs the model on ring slots (batching whatever is queued, up to batch_size)
+    and passes (slot, frame number, capture time, detections) on.
+    Reports ("error", message) on the status queue if the model fails to load or run.
+    """
+    _setup_worker_logging()
+    # Imported here so only this process loads the model stack
+    from smartparking.detector import Detector, scale_detections
+
+    ring = FrameRing.attach(ring_spec)
+    try:
+        detector = Detector(max_batch_size=batch_size, **detector_options)
+        finished = False
+        while not finished:
+            item = _get(detect_queue, stop)
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < batch_size:
+                try:
+                    item = detect_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+
+            # The model reads the frames straight from shared memory
+            results = detector.detect_batch([ring.frame(slot) for slot, _, _ in batch])
+            for (slot, frame_number, capture_time), result in zip(batch, results):
+                result_queue.put((slot, frame_number, capture_time, scale_detections(result, scale)))
+            with counters.get_lock():
+                counters[_DETECTED] += len(batch)
+    except Exception as e:
+        logger.error(f"Detector failed: {e}", exc_info=True)
+        # Before the end marker, so the main process sees the error when the results end
+        status_queue.put(("error", f"Detector failed: {e}"))
+    finally:
+        result_queue.put(None)
+        ring.close()
+
+
+def render_worker(ring_spec: Tuple, config_path: str, scale: float, preview_fps: float, free_slots: "mp.Queue",
+                  render_queue: "mp.Queue", counters: "mp.Array", stop: "mp.Event"):
+    """
+    Render process: draws the overlay onto ring slots and shows them, then frees the slots.
+    It keeps a mirror of the lot (the zones applied in the main process and the states are sent
+    along with the frames) and stops the pipeline when 'q' is pressed.
+    """
+    _setup_worker_logging()
+    import cv2
+    from smartparking.parking_lot import ParkingLot
+    from smartparking.visualizer import Visualizer
+
+    ring = FrameRing.attach(ring_spec)
+    parking_lot = ParkingLot(config_path)
+    visualizer = Visualizer(parking_lot)
+    preview_interval = 1.0 / preview_fps if preview_fps > 0 else 0.0
+    last_preview, shown = 0.0, False
+    try:
+        while True:
+            item = _get(render_queue, stop)
+            if item is None:
+                break
+            slot, detections, states, zones = item
+            try:
+                if visualizer is None:
+                    continue
+                # The zones the main process applied (sent after a reload), not the config file's current ones
+                if zones is not None:
+                    parking_lot.stage_zones(*zones)
+                    parking_lot.apply_pending_reload()
+                if len(states) == len(parking_lot.geometry):
+                    parking_lot.apply_states(np.frombuffer(states, dtype=np.uint8))
+
+                now = time.monotonic()
+                if now - last_preview >= preview_interval:
+                    last_preview = now
+                    frame = ring.frame(slot)
+                    if scale != 1.0:
+                        frame = cv2.resize(frame, None, fx=scale, fy=scale)
+                    visualizer.show_frame(visualizer.draw(frame, detections))
+                    shown = True
+                if shown and visualizer.wait_for_key(delay=1):
+                    stop.set()
+            except Exception as e:
+                # Keep freeing slots, so a broken preview (or zone reload) never stalls the analysis
+                logger.error(f"Rendering failed, continuing without preview: {e}")
+                visualizer = None
+            finally:
+                # Slots are freed in the order they were received (FramePipeline relies on it)
+                free_slots.put(slot)
+                with counters.get_lock():
+                    counters[_RENDERED] += 1
+    finally:
+        if shown:
+            try:
+                cv2.destroyAllWindows()
+            except Exception:
+                pass
+        ring.close()
+
+
+class FramePipeline:
+    """
+    Runs decoding, detection and rendering in separate processes over a shared memory frame ring.
+
+    The calling process consumes the detections (occupancy, API, history) with results() and hands
+    every frame back with release(), which passes it on to the renderer or frees its slot. The
+    ring's slot count bounds the frames in flight; what happens when it runs full is the policy.
+    """
+
+    def __init__(self, source: str, detector_options: Dict[str, Any], config_path: str, slots: int = 8,
+                 policy: str = "block", batch_size: int = 1, render: bool = True, preview_fps: float = 0.0,
+                 stream_options: Optional[Dict[str, Any]] = None):
+        """
+        :param source: Video source (camera index, file or URL).
+        :param detector_options: Keyword arguments of Detector (model_path, backend, imgsz, ...).
+        :param config_path: Zone config, loaded by the render process.
+        :param slots: Frames in the ring.
+        :param policy: 'block' or 'drop' (see PIPELINE_POLICIES).
+        :param batch_size: Maximum frames per forward pass; queued frames are batched as they arrive.
+        :param render: Start the render process (False = headless).
+        :param preview_fps: Maximum preview redraw rate (0 = every frame).
+        :param stream_options: Keyword arguments of VideoStream (low_latency, frame_interval, max_width).
+        """
+        if policy not in PIPELINE_POLICIES:
+            raise ValueError(f"Unknown pipeline policy '{policy}'. Expected one of {PIPELINE_POLICIES}.")
+        self.source = source
+        self.detector_options = detector_options
+        self.config_path = config_path
+        self.slots = max(2, slots)
+        self.policy = policy
+        self.batch_size = max(1, batch_size)
+        self.render = render
+        self.preview_fps = preview_fps
+        self.stream_options = stream_options or {}
+
+        self.fps = 0.0
+        self.scale = 1.0
+        self.frames_to_render = 0
+        # Slots handed to the renderer and not yet freed by it, oldest first
+        self._render_slots: Deque[int] = deque()
+        self._render_freed = 0
+        # Geometry version of the lot whose zones the renderer has (set by start())
+        self._render_version: Optional[int] = None
+        self._ring: Optional[FrameRing] = None
+        self._processes: Dict[str, mp.Process] = {}
+
+        # Spawned workers start from a clean interpreter (no inherited threads or OpenCV state)
+        self._context = mp.get_context("spawn")
+        self.stop_event = self._context.Event()
+        self.counters = self._context.Array('q', len(COUNTERS))
+        self.free_slots = self._context.Queue()
+        self.detect_queue = self._context.Queue()
+        self.result_queue = self._context.Queue()
+        self.render_queue = self._context.Queue()
+        self._status_queue = self._context.Queue()
+
+    def start(self, parking_lot=None, timeout: float = 60.0):
+        """
+        Starts the processes once the decoder has opened the source. Raises IOError if it cannot.
+        :param parking_lot: The lot passed to release(). The renderer loads the same config itself, so its
+                            zones are only sent to the renderer once the lot reloads (None = with the first frame).
+        """
+        if parking_lot is not None:
+            self._render_version = parking_lot.geometry_version
+        self._start("decode", decode_worker, self.source, self.stream_options, self.slots, self.policy,
+                    self.free_slots, self.detect_queue, self._status_queue, self.counters, self.stop_event)
+        try:
+            status = self._status_queue.get(timeout=timeout)
+        except queue.Empty:
+            status = ("error", f"Timed out opening {self.source}")
+        if status[0] != "ready":
+            self.stop()
+            raise IOError(status[1])
+
+        _, ring_spec, self.fps, self.scale = status
+        # The decoder created the ring; this process frees it in stop()
+        self._ring = FrameRing.attach(ring_spec)
+        self._start("detect", detect_worker, ring_spec, self.detector_options, self.batch_size, self.scale,
+                    self.detect_queue, self.result_queue, self._status_queue, self.counters, self.stop_event)
+        if self.render:
+            self._start("render", render_worker, ring_spec, self.config_path, self.scale, self.preview_fps,
+                        self.free_slots, self.render_queue, self.counters, self.stop_event)
+        slots, shape, _ = ring_spec
+        logger.info(f"Pipeline started: {slots} slots of {shape[1]}x{shape[0]}, policy '{self.policy}', "
+                    f"batch size {self.batch_size}, {'with' if self.render else 'without'} rendering")
+
+    def _start(self, stage: str, target, *args):
+        process = self._context.Process(target=target, name=f"pipeline-{stage}", args=args, daemon=True)
+        process.start()
+        self._processes[stage] = process
+
+    def results(self) -> Generator[Tuple[int, int, float, np.ndarray], None, None]:
+        """
+        Yields (slot, frame number, capture time, detections) in frame order until the stream ends
+        or the pipeline is stopped. Every slot must be handed back with release().
+        Raises RuntimeError if the decoder or the detector failed, instead of ending like the stream.
+        """
+        while not self.stop_event.is_set():
+            try:
+                item = self.result_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # A dead renderer holds slots the decoder may be waiting for
+                self._check_renderer()
+                self._check_detector()
+                continue
+            if item is None:
+                self._check_errors()
+                return
+            yield item
+
+    def _check_detector(self):
+        """Raises if the detect process died without its end marker (e.g. it was killed)."""
+        process = self._processes.get("detect")
+        if process is not None and process.exitcode not in (None, 0):
+            self._check_errors()
+            raise RuntimeError(f"Detect process exited (code {process.exitcode})")
+
+    def _check_errors(self):
+        """Raises the first error a stage reported on the status queue."""
+        try:
+            # The error is queued before the end marker, but on another pipe, so give it a moment
+            status = self._status_queue.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            return
+        if status[0] == "error":
+            raise RuntimeError(status[1])
+
+    def _check_renderer(self):
+        """Stops routing frames to a render process that died and frees the slots it still held."""
+        if not self.render:
+            return
+        rendered = self.counters[_RENDERED]
+        while self._render_freed < rendered and self._render_slots:
+            self._render_slots.popleft()
+            self._render_freed += 1
+        process = self._processes.get("render")
+        if process is None or process.is_alive():
+            return
+
+        logger.error(f"Render process exited (code {process.exitcode}); continuing without preview")
+        self.render = False
+        while self._render_slots:
+            self.free_slots.put(self._render_slots.popleft())
+
+    def release(self, slot: int, detections: np.ndarray, parking_lot):
+        """
+        Passes an analysed frame to the renderer, or frees its slot (headless, or the renderer is
+        behind under the drop policy).
+        :param parking_lot: The lot after this frame; the renderer draws its official states and gets
+                            its zones whenever they were reloaded.
+        """
+        self._check_renderer()
+        if self.render and (self.policy == "block" or self.render_depth == 0):
+            zones = None
+            if parking_lot.geometry_version != self._render_version:
+                zones = (parking_lot.config_path, parking_lot.zones)
+                self._render_version = parking_lot.geometry_version
+            self.frames_to_render += 1
+            self._render_slots.append(slot)
+            self.render_queue.put((slot, detections, parking_lot.store.states.tobytes(), zones))
+            return
+        if self.render:
+            with self.counters.get_lock():
+                self.counters[_DROPPED_RENDER] += 1
+        self.free_slots.put(slot)
+
+    @property
+    def render_depth(self) -> int:
+        return self.frames_to_render - self.counters[_RENDERED]
+
+    def queue_depths(self, processed: int) -> Dict[str, int]:
+        """
+        Frames waiting in (or being worked on by) each stage.
+        :param processed: Frames the calling process has taken from results() so far.
+        """
+        counters = self.counters[:]
+        return {"detect": counters[_DECODED] - counters[_DETECTED],
+                "occupancy": counters[_DETECTED] - processed,
+                "render": self.render_depth if self.render else 0}
+
+    def stats(self) -> Dict[str, int]:
+        """Cumulative stage counters (see COUNTERS)."""
+        return dict(zip(COUNTERS, self.counters[:]))
+
+    @property
+    def stopped(self) -> bool:
+        """True once a stage asked to stop (e.g. 'q' in the preview window)."""
+        return self.stop_event.is_set()
+
+    def stop(self, timeout: float = 5.0):
+        """Stops every process and frees the ring."""
+        self.stop_event.set()
+        if self.render and "render" in self._processes:
+            self.render_queue.put(None)
+        for stage, process in self._processes.items():
+            process.join(timeout=timeout)
+            if process.is_alive():
+                logger.warning(f"Pipeline {stage} process did not stop; terminating it")
+                process.terminate()
+                process.join(timeout=timeout)
+        if self._ring is not None:
+            self._ring.close()
+            self._ring.unlink()
+            self._ring = None
@@ -0,0 +1,169 @@
+import json
+import struct
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from smartparking.detections import DETECTION_DTYPE
+from smartparking.parking_lot import SpaceStateStore
+from smartparking.occupancy_logic import OccupancyLogic
+
+logger = logging.getLogger(__name__)
+
+# File layout (all little-endian):
+#   header   16 bytes: magic, format version, size of one detection record
+#   records  DETECTION_DTYPE records of all frames, back to back
+#   index    FRAME_DTYPE entry per frame (first record and record count)
+#   metadata UTF-8 JSON (source, model, frame size, ...)
+#   footer   offsets of the index and metadata, so the file is written in a single pass
+MAGIC = b"SPDETREC"
+VERSION = 1
+_HEADER = struct.Struct("<8sII")
+_FOOTER = struct.Struct("<8sQQQQQ")
+
+FRAME_DTYPE = np.dtype([
+    ('frame', '<u8'),
+    ('timestamp', '<f8'),
+    ('start', '<u8'),
+    ('count', '<u4'),
+    ('flags', '<u4'),
+])
+# Frame was not analysed (e.g. static scene skipped); replay carries the last result forward
+FLAG_CARRIED = 1
+
+
+class DetectionRecorder:
+    """
+    Streams the detections of every processed frame to a compact binary file that
+    DetectionRecording can memory-map, so occupancy rules and smoothing can be re-evaluated
+    offline without the video or the model.
+    """
+
+    def __init__(self, path: str, metadata: Optional[Dict[str, Any]] = None):
+        """
+        :param path: Output file (overwritten).
+        :param metadata: JSON-serializable information stored with the recording.
+        """
+        self.path = path
+        self.metadata = dict(metadata or {})
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, DETECTION_DTYPE.itemsize))
+        self._index: List[Tuple[int, float, int, int, int]] = []
+        self._num_records = 0
+        logger.info(f"Recording detections to {path}")
+
+    def write(self, frame_number: int, timestamp: float, detections: Optional[np.ndarray]):
+        """
+        Appends one frame.
+        :param detections: Detections array of the frame, or None when the frame was not analysed.
+        """
+        if detections is None:
+            self._index.append((frame_number, timestamp, self._num_records, 0, FLAG_CARRIED))
+            return
+        # Detections arrays already have the on-disk record layout
+        self._file.write(np.ascontiguousarray(detections, dtype=DETECTION_DTYPE).tobytes())
+        self._index.append((frame_number, timestamp, self._num_records, len(detections), 0))
+        self._num_records += len(detections)
+
+    def close(self):
+        """Writes the frame index, metadata and footer. The file is only readable after closing."""
+        if self._file.closed:
+            return
+        index = np.array(self._index, dtype=FRAME_DTYPE)
+        index_offset = self._file.tell()
+        self._file.write(index.tobytes())
+        metadata = json.dumps(self.metadata).encode("utf-8")
+        meta_offset = self._file.tell()
+        self._file.write(metadata)
+        self._file.write(_FOOTER.pack(MAGIC, index_offset, len(index), self._num_records, meta_offset,
+                                      len(metadata)))
+        self._file.close()
+        logger.info(f"Recorded {len(index)} frames with {self._num_records} detections to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class DetectionRecording:
+    """Read-only, memory-mapped view of a file written by DetectionRecorder."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, itemsize = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a detection recording.")
+            if version != VERSION or itemsize != DETECTION_DTYPE.itemsize:
+                raise ValueError(f"Unsupported detection recording version {version} in {path}.")
+            f.seek(-_FOOTER.size, 2)
+            magic, index_offset, num_frames, num_records, meta_offset, meta_length = \
+                _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is incomplete (the recorder was not closed).")
+            f.seek(meta_offset)
+            self.metadata: Dict[str, Any] = json.loads(f.read(meta_length).decode("utf-8"))
+
+        # np.memmap cannot map zero-length arrays
+        self.records = np.memmap(path, dtype=DETECTION_DTYPE, mode="r", offset=_HEADER.size, shape=(num_records,)) \
+            if num_records else np.zeros(0, dtype=DETECTION_DTYPE)
+        self.index = np.memmap(path, dtype=FRAME_DTYPE, mode="r", offset=index_offset, shape=(num_frames,)) \
+            if num_frames else np.zeros(0, dtype=FRAME_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def detections(self, i: int) -> Optional[np.ndarray]:
+        """
+        Detections of the i-th frame in the Detector.detect format (a read-only view into the file),
+        or None when the frame was not analysed.
+        """
+        entry = self.index[i]
+        if entry['flags'] & FLAG_CARRIED:
+            return None
+        start = int(entry['start'])
+        return self.records[start:start + int(entry['count'])]
+
+
+def replay(recording: DetectionRecording, occupancy_logic: OccupancyLogic) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Feeds a recording through the occupancy logic frame by frame, exactly like the live loop.
+    :return: Generator of (frame index, indices of the spaces that flipped).
+    """
+    for i in range(len(recording)):
+        detections = recording.detections(i)
+        if detections is None:
+            yield i, occupancy_logic.carry_forward()
+        else:
+            yield i, occupancy_logic.process_frame(detections)
+
+
+def raw_occupancy(recording: DetectionRecording, occupancy_logic: OccupancyLogic) -> np.ndarray:
+    """
+    Per-frame raw (unsmoothed) occupancy of every space, as a (frames, spaces) bool array.
+    Smoothing does not influence it, so it is computed once per occupancy rule and reused for
+    every smoothing setting of a sweep.
+    """
+    occupied = np.zeros((len(recording), len(occupancy_logic.parking_lot.geometry)), dtype=bool)
+    for i, _ in replay(recording, occupancy_logic):
+        occupied[i] = occupancy_logic.last_occupied
+    return occupied
+
+
+def smooth_states(occupied: np.ndarray, smoothing_frames: int) -> Tuple[np.ndarray, List[Tuple[int, int, int]]]:
+    """
+    Runs temporal smoothing over a raw occupancy sequence (from raw_occupancy).
+    :return: (number of flips per space, transitions as (frame index, space index, new state)).
+    """
+    store = SpaceStateStore(occupied.shape[1], smoothing_frames)
+    flips = np.zeros(occupied.shape[1], dtype=np.int64)
+    transitions = []
+    for i, frame in enumerate(occupied):
+        changed = store.update(frame)
+        if len(changed):
+            flips[changed] += 1
+            transitions.extend((i, index, state) for index, state in zip(changed.tolist(),
+                                                                         store.states[changed].tolist()))
+    return flips, transitions
@@ -0,0 +1,169 @@
+import cv2
+import logging
+import numpy as np
+from typing import List, Dict, Tuple, Optional
+from smartparking.parking_lot import ParkingLot
+from smartparking.detections import empty_detections, detection_boxes
+
+logger = logging.getLogger(__name__)
+
+# Resolution (in pixels) of the coverage grid used to merge space regions into crops
+COVERAGE_CELL = 8
+
+
+def plan_crops(space_bboxes: np.ndarray, frame_shape: Tuple[int, ...], margin: float = 0.25,
+               tile_size: Optional[int] = None, tile_overlap: float = 0.2) -> np.ndarray:
+    """
+    Computes a small set of crops (x1, y1, x2, y2) that together cover every parking space.
+
+    Each space bounding box is grown by a margin (vehicles stick out of their bay), the grown
+    boxes are rasterized onto a coarse coverage grid and every connected region becomes one crop.
+    Crops larger than tile_size are split into overlapping tiles.
+
+    :param space_bboxes: (n, 4) space bounding boxes in frame coordinates.
+    :param frame_shape: Shape of the frame the crops are cut from.
+    :param margin: Growth of each space box on every side, as a fraction of its width/height.
+    :param tile_size: Maximum crop side in pixels (None = no tiling).
+    :param tile_overlap: Overlap between neighbouring tiles as a fraction of tile_size.
+    :return: (k, 4) int array of crops, exclusive x2/y2, clipped to the frame.
+    """
+    height, width = frame_shape[:2]
+    if len(space_bboxes) == 0:
+        return np.array([[0, 0, width, height]], dtype=np.int32)
+
+    boxes = np.asarray(space_bboxes, dtype=np.float64)
+    grow = np.stack([boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]], axis=1) * margin
+    grown = np.concatenate([boxes[:, :2] - grow, boxes[:, 2:] + grow + 1], axis=1)
+    grown[:, [0, 2]] = np.clip(grown[:, [0, 2]], 0, width)
+    grown[:, [1, 3]] = np.clip(grown[:, [1, 3]], 0, height)
+
+    # 1. Rasterize the grown boxes on a coarse grid and take connected regions as crops
+    grid = np.zeros((-(-height // COVERAGE_CELL), -(-width // COVERAGE_CELL)), dtype=np.uint8)
+    cells = np.concatenate([np.floor(grown[:, :2] / COVERAGE_CELL), np.ceil(grown[:, 2:] / COVERAGE_CELL)],
+                           axis=1).astype(np.int64)
+    for cx1, cy1, cx2, cy2 in cells:
+        grid[cy1:cy2, cx1:cx2] = 1
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(grid, connectivity=8)
+    crops = []
+    for x, y, w, h, _ in stats[1:count]:
+        crops.append([x * COVERAGE_CELL, y * COVERAGE_CELL,
+                      min((x + w) * COVERAGE_CELL, width), min((y + h) * COVERAGE_CELL, height)])
+
+    if not crops:
+        # No space is inside the frame; fall back to full-frame inference
+        return np.array([[0, 0, width, height]], dtype=np.int32)
+
+    # 2. Optionally split large crops into overlapping tiles
+    if tile_size:
+        crops = [tile for crop in crops for tile in _tile(crop, tile_size, tile_overlap)]
+
+    return np.array(crops, dtype=np.int32)
+
+
+def _tile(crop: List[int], tile_size: int, overlap: float) -> List[List[int]]:
+    """Splits one crop into tiles of at most tile_size, overlapping by the given fraction."""
+    x1, y1, x2, y2 = crop
+    xs = _tile_starts(x1, x2, tile_size, overlap)
+    ys = _tile_starts(y1, y2, tile_size, overlap)
+    return [[x, y, min(x + tile_size, x2), min(y + tile_size, y2)] for y in ys for x in xs]
+
+
+def _tile_starts(start: int, end: int, tile_size: int, overlap: float) -> List[int]:
+    length = end - start
+    if length <= tile_size:
+        return [start]
+    stride = max(1, int(tile_size * (1 - overlap)))
+    count = -(-(length - tile_size) // stride) + 1
+    # Spread the tiles evenly so the last one ends exactly at the crop border
+    return [start + int(round(i * (length - tile_size) / (count - 1))) for i in range(count)]
+
+
+def merge_crop_detections(crop_detections: List[np.ndarray], crops: np.ndarray,
+                          iou_threshold: float = 0.5, containment_threshold: float = 0.8) -> np.ndarray:
+    """
+    Maps detections made on crops back to frame coordinates and removes duplicates from overlapping crops.
+
+    A box is suppressed when a higher-confidence box of the same class overlaps it with IoU above
+    iou_threshold, or covers more than containment_threshold of the smaller of the two boxes
+    (a vehicle cut in half by a tile border next to the full detection from the neighbouring tile).
+
+    :param crop_detections: One detections array per crop (from Detector.detect_batch).
+    :param crops: The (k, 4) crops the detections were made on.
+    :return: Detections array in frame coordinates.
+    """
+    if not len(crop_detections):
+        return empty_detections()
+    detections = np.concatenate(crop_detections)
+    # Offset of each detection's crop
+    counts = [len(dets) for dets in crop_detections]
+    offsets = np.repeat(np.asarray(crops, dtype=np.int32)[:len(counts), :2], counts, axis=0)
+    detections['x1'] += offsets[:, 0]
+    detections['x2'] += offsets[:, 0]
+    detections['y1'] += offsets[:, 1]
+    detections['y2'] += offsets[:, 1]
+    if len(crops) <= 1 or len(detections) <= 1:
+        return detections
+
+    boxes = detection_boxes(detections).astype(np.float64)
+    confidences = detections['conf'].astype(np.float64)
+    classes = detections['cls']
+    areas = np.maximum(boxes[:, 2] - boxes[:, 0], 0) * np.maximum(boxes[:, 3] - boxes[:, 1], 0)
+
+    # Pairwise overlap of all boxes in the frame (a frame holds at most a few hundred detections)
+    ix1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    iy1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    ix2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    iy2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    intersections = np.maximum(ix2 - ix1, 0) * np.maximum(iy2 - iy1, 0)
+    ious = intersections / np.maximum(areas[:, None] + areas[None, :] - intersections, 1e-9)
+    containment = intersections / np.maximum(np.minimum(areas[:, None], areas[None, :]), 1e-9)
+    duplicates = ((ious > iou_threshold) | (containment > containment_threshold)) & (classes[:, None] == classes[None, :])
+
+    keep = np.ones(len(detections), dtype=bool)
+    for index in np.argsort(-confidences, kind='stable'):
+        if keep[index]:
+            suppressed = duplicates[index].copy()
+            suppressed[index] = False
+            keep[suppressed] = False
+
+    return detections[keep]
+
+
+class RoiPlanner:
+    """
+    Caches the crop plan of a parking lot per frame size, so it is only computed once per stream.
+    """
+
+    def __init__(self, parking_lot: ParkingLot, margin: float = 0.25, tile_size: Optional[int] = None,
+                 tile_overlap: float = 0.2):
+        """
+        :param parking_lot: The lot whose spaces define the regions of interest.
+        :param margin: Growth of each space box on every side, as a fraction of its size.
+        :param tile_size: Maximum crop side in pixels (None = no tiling).
+        :param tile_overlap: Overlap between neighbouring tiles as a fraction of tile_size.
+        """
+        self.parking_lot = parking_lot
+        self.margin = margin
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self._cache: Dict[Tuple, np.ndarray] = {}
+
+    def crops_for(self, frame_shape: Tuple[int, ...], scale: float = 1.0) -> np.ndarray:
+        """
+        :param frame_shape: Shape of the analysed frame.
+        :param scale: Source width / analysed frame width (VideoStream.scale).
+        :return: (k, 4) crops in analysed-frame coordinates.
+        """
+        key = (frame_shape[:2], scale, self.parking_lot.geometry_version)
+        crops = self._cache.get(key)
+        if crops is None:
+            bboxes = self.parking_lot.geometry.bboxes / scale
+            crops = plan_crops(bboxes, frame_shape, self.margin, self.tile_size, self.tile_overlap)
+            covered = np.sum((crops[:, 2] - crops[:, 0]) * (crops[:, 3] - crops[:, 1]))
+            logger.info(f"ROI plan for {frame_shape[1]}x{frame_shape[0]} frames: {len(crops)} crop(s) covering "
+                        f"{100 * covered / (frame_shape[0] * frame_shape[1]):.0f}% of the frame")
+            # Plans of replaced zone geometries are never used again
+            self._cache = {k: v for k, v in self._cache.items() if k[2] == key[2]}
+            self._cache[key] = crops
+        return crops
@@ -0,0 +1,128 @@
+import json
+import time
+import uuid
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from smartparking.parking_lot import ParkingLot, STATE_NAMES
+
+
+def _dumps(payload) -> bytes:
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+class StatusSnapshot:
+    """
+    Immutable, versioned view of the occupancy status of one lot (or the aggregate of all lots).
+
+    The JSON body is serialized once when the snapshot is created; filtered and per-space views
+    are derived from the same data and cached on the snapshot the first time they are requested.
+    """
+
+    __slots__ = ("version", "timestamp", "etag", "body", "summary", "spaces", "_index", "_views")
+
+    def __init__(self, version: int, etag: str, summary: Dict[str, int], spaces: List[Dict[str, str]],
+                 extra: Optional[Dict] = None):
+        """
+        :param version: Publisher-wide version number of this snapshot.
+        :param etag: Entity tag of the full body.
+        :param summary: {"total", "occupied", "free"} counts.
+        :param spaces: One {"id", "state"} entry per space (plus "lot" in the aggregate).
+        :param extra: Additional top-level fields of the body (e.g. "lots" in the aggregate).
+        """
+        self.version = version
+        self.timestamp = time.time()
+        self.etag = etag
+        self.summary = summary
+        self.spaces = tuple(spaces)
+        self.body = _dumps({**summary, **(extra or {}), "spaces": spaces})
+        self._index: Dict[str, Dict[str, str]] = {space["id"]: space for space in spaces}
+        self._views: Dict[str, Tuple[bytes, str]] = {}
+
+    def filtered(self, state: str) -> Tuple[bytes, str]:
+        """
+        Returns the body restricted to spaces in the given state, and its ETag.
+        The counts still describe the whole lot.
+        """
+        view = self._views.get(state)
+        if view is None:
+            spaces = [space for space in self.spaces if space["state"] == state]
+            view = (_dumps({**self.summary, "spaces": spaces}), f'{self.etag[:-1]}-{state}"')
+            self._views[state] = view
+        return view
+
+    def space(self, space_id: str) -> Optional[Tuple[bytes, str]]:
+        """Returns the body and ETag of a single space, or None if the id is unknown."""
+        key = "space:" + space_id
+        view = self._views.get(key)
+        if view is None:
+            space = self._index.get(space_id)
+            if space is None:
+                return None
+            view = (_dumps(space), f'{self.etag[:-1]}-{key}"')
+            self._views[key] = view
+        return view
+
+
+class StatusPublisher:
+    """
+    Holds the current StatusSnapshot of every lot and of the aggregate.
+
+    The processing loop calls publish() after a state change; API handlers only read the latest
+    snapshot reference and never touch the live ParkingLot state.
+    """
+
+    def __init__(self):
+        self.lots: Dict[str, ParkingLot] = {}
+        self._snapshots: Dict[str, StatusSnapshot] = {}
+        self._aggregate: Optional[StatusSnapshot] = None
+        self._version = 0
+        self._lock = threading.Lock()
+        # Distinguishes ETags across restarts, when versions start over
+        self._instance = uuid.uuid4().hex[:8]
+
+    def register(self, lot_id: str, lot: ParkingLot):
+        """Adds a lot and publishes its initial snapshot."""
+        self.lots[lot_id] = lot
+        self.publish(lot_id)
+
+    def publish(self, lot_id: str):
+        """Creates a new snapshot of the lot from its current state."""
+        lot = self.lots[lot_id]
+        states = lot.store.states.copy()
+
+        with self._lock:
+            self._version += 1
+            occupied = int(np.count_nonzero(states))
+            summary = {"total": len(states), "occupied": occupied, "free": len(states) - occupied}
+            spaces = [{"id": space_id, "state": STATE_NAMES[state]}
+                      for space_id, state in zip(lot.geometry.space_ids, states.tolist())]
+            self._snapshots[lot_id] = StatusSnapshot(self._version, self._etag(lot_id), summary, spaces)
+            self._aggregate = self._build_aggregate() if len(self.lots) > 1 else None
+
+    def _etag(self, name: str) -> str:
+        return f'"{self._instance}-{name}-{self._version}"'
+
+    def _build_aggregate(self) -> StatusSnapshot:
+        lots, spaces = [], []
+        for lot_id, snapshot in self._snapshots.items():
+            lots.append({"id": lot_id, **snapshot.summary})
+            spaces.extend({"lot": lot_id, **space} for space in snapshot.spaces)
+
+        summary = {key: sum(lot[key] for lot in lots) for key in ("total", "occupied", "free")}
+        return StatusSnapshot(self._version, self._etag("all"), summary, spaces, extra={"lots": lots})
+
+    def snapshot(self, lot_id: Optional[str] = None) -> Optional[StatusSnapshot]:
+        """
+        :param lot_id: A lot id, or None for the whole system (the aggregate when several lots are registered).
+        :return: The latest snapshot, or None if there is nothing to report.
+        """
+        if lot_id is not None:
+            return self._snapshots.get(lot_id)
+        if self._aggregate is not None:
+            return self._aggregate
+        return next(iter(self._snapshots.values()), None)
+
+    def snapshots(self) -> Dict[str, StatusSnapshot]:
+        """Returns the latest snapshot of every lot."""
+        return dict(self._snapshots)
@@ -0,0 +1,236 @@
+import os
+import time
+import queue
+import logging
+import contextlib
+import multiprocessing as mp
+from typing import Dict, List, Any, Optional, Callable
+
+import yaml
+import numpy as np
+
+from smartparking.parking_lot import ParkingLot
+
+logger = logging.getLogger(__name__)
+
+# Seconds between heartbeats sent by a camera worker
+HEARTBEAT_INTERVAL = 1.0
+# Minimum seconds between two restarts of the same worker
+RESTART_BACKOFF = 5.0
+
+
+def load_manifest(manifest_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads the camera manifest.
+
+    Expected format::
+
+        cameras:
+          north_lot:
+            source: rtsp://camera-1/stream
+            config: config/north_lot.yaml
+            smoothing_frames: 5   # optional
+
+    :return: Mapping of camera id to its settings.
+    """
+    with open(manifest_path, 'r') as f:
+        manifest = yaml.safe_load(f) or {}
+
+    cameras = manifest.get('cameras', {})
+    if not cameras:
+        raise ValueError(f"Manifest {manifest_path} has no 'cameras' defined.")
+
+    for camera_id, camera in cameras.items():
+        if 'source' not in camera or 'config' not in camera:
+            raise ValueError(f"Camera '{camera_id}' in {manifest_path} needs both 'source' and 'config'.")
+        camera['source'] = str(camera['source'])
+
+    return cameras
+
+
+def camera_worker(worker_id: int, cameras: Dict[str, Dict[str, Any]], options: Dict[str, Any],
+                  messages: "mp.Queue"):
+    """
+    Worker process entry point: processes one or more cameras with a single shared model.
+
+    Each cycle takes the newest frame of every camera, runs one batched detection over all
+    of them and reports lot states back to the supervisor through the messages queue.
+    """
+    # Spawned processes start without the parent's logging setup
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    # Imported here so the supervisor process never loads the model stack
+    from smartparking.detector import Detector, scale_detections
+    from smartparking.occupancy_logic import OccupancyLogic
+    from smartparking.video_stream import VideoStream
+
+    messages.put(("heartbeat", worker_id, time.time()))
+    detector = Detector(model_path=options['model'], max_batch_size=max(1, len(cameras)),
+                        backend=options.get('backend', 'torch'), imgsz=options.get('imgsz', 640),
+                        threads=options.get('threads'), int8=options.get('int8', False),
+                        calibration_source=options.get('calibration_source'))
+
+    lots = {camera_id: ParkingLot(camera['config'], camera.get('smoothing_frames', options['smoothing_frames']))
+            for camera_id, camera in cameras.items()}
+    logics = {camera_id: OccupancyLogic(lot, mode=options['occupancy_mode'], overlap_metric=options['overlap_metric'],
+                                        overlap_threshold=options['overlap_threshold'])
+              for camera_id, lot in lots.items()}
+
+    with contextlib.ExitStack() as stack:
+        streams = {camera_id: stack.enter_context(VideoStream(camera['source'], low_latency=True,
+                                                              frame_interval=options['frame_interval'],
+                                                              max_width=options['max_width']))
+                   for camera_id, camera in cameras.items()}
+        logger.info(f"Worker {worker_id} processing cameras: {', '.join(cameras)}")
+
+        last_heartbeat = 0.0
+        last_sent: Dict[str, float] = {camera_id: 0.0 for camera_id in cameras}
+        while streams:
+            # 1. Collect the newest frame of every camera (short wait so one slow camera cannot stall the rest)
+            frames, frame_ids = [], []
+            for camera_id, stream in list(streams.items()):
+                frame = stream.read_latest(timeout=0.05)
+                if frame is not None:
+                    frames.append(frame)
+                    frame_ids.append(camera_id)
+                elif stream.ended:
+                    logger.warning(f"Camera '{camera_id}' ended")
+                    del streams[camera_id]
+
+            # 2. One batched forward pass over all cameras, then per-lot occupancy
+            if frames:
+                for camera_id, detections in zip(frame_ids, detector.detect_batch(frames)):
+                    logics[camera_id].process_frame(scale_detections(detections, streams[camera_id].scale))
+
+            # 3. Report changed lots right away and every lot at least once per heartbeat
+            now = time.time()
+            for camera_id in frame_ids:
+                lot = lots[camera_id]
+                if len(lot.store.changed) or now - last_sent[camera_id] >= HEARTBEAT_INTERVAL:
+                    messages.put(("state", worker_id, camera_id, lot.store.states.tobytes(), now))
+                    last_sent[camera_id] = now
+            if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                messages.put(("heartbeat", worker_id, now))
+                last_heartbeat = now
+
+
+class CameraSupervisor:
+    """
+    Runs the cameras of a manifest across a pool of worker processes.
+
+    Cameras are spread round-robin over at most one worker per CPU core, and every worker
+    loads the model once for all of its cameras. The supervisor keeps a mirror ParkingLot
+    per camera (geometry only, no model) that the API serves, and restarts workers that
+    crash or stop sending heartbeats.
+    """
+
+    def __init__(self, cameras: Dict[str, Dict[str, Any]], options: Dict[str, Any],
+                 processes: Optional[int] = None, stall_timeout: float = 60.0,
+                 on_state_change: Optional[Callable[[str], None]] = None):
+        """
+        :param cameras: Camera settings from load_manifest().
+        :param options: Worker options (model, smoothing_frames, occupancy_mode, overlap_metric,
+                        overlap_threshold, frame_interval, max_width).
+        :param processes: Number of worker processes (default: number of CPU cores).
+        :param stall_timeout: Seconds without a heartbeat before a worker is considered stalled.
+        :param on_state_change: Called with the camera id whenever a mirrored lot changed state.
+        """
+        self.cameras = cameras
+        self.on_state_change = on_state_change
+        self.options = options
+        self.stall_timeout = stall_timeout
+
+        self.lots: Dict[str, ParkingLot] = {
+            camera_id: ParkingLot(camera['config'], camera.get('smoothing_frames', options['smoothing_frames']))
+            for camera_id, camera in cameras.items()}
+
+        worker_count = max(1, min(len(cameras), processes or os.cpu_count() or 1))
+        self.assignments: List[Dict[str, Dict[str, Any]]] = [{} for _ in range(worker_count)]
+        for position, (camera_id, camera) in enumerate(cameras.items()):
+            self.assignments[position % worker_count][camera_id] = camera
+
+        # Spawned workers start from a clean interpreter (no inherited threads or OpenCV state)
+        self._context = mp.get_context("spawn")
+        self.messages = self._context.Queue()
+        self.workers: List[Optional[mp.Process]] = [None] * worker_count
+        self.last_heartbeat: List[float] = [0.0] * worker_count
+        self.last_start: List[float] = [0.0] * worker_count
+        self.restarts: List[int] = [0] * worker_count
+
+    def start(self):
+        """Starts every worker process."""
+        for worker_id in range(len(self.workers)):
+            self._start_worker(worker_id)
+
+    def _start_worker(self, worker_id: int):
+        process = self._context.Process(target=camera_worker, name=f"camera-worker-{worker_id}",
+                                        args=(worker_id, self.assignments[worker_id], self.options, self.messages),
+                                        daemon=True)
+        process.start()
+        self.workers[worker_id] = process
+        self.last_heartbeat[worker_id] = self.last_start[worker_id] = time.time()
+        logger.info(f"Started worker {worker_id} (pid {process.pid}) for cameras: "
+                    f"{', '.join(self.assignments[worker_id])}")
+
+    def run(self):
+        """Supervision loop: applies worker state updates and restarts failed workers. Runs until all workers finish."""
+        while any(worker is not None for worker in self.workers):
+            self._drain_messages(timeout=1.0)
+            self._check_workers()
+
+    def _drain_messages(self, timeout: float):
+        try:
+            message = self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return
+
+        while True:
+            kind, worker_id = message[0], message[1]
+            self.last_heartbeat[worker_id] = time.time()
+            if kind == "state":
+                _, _, camera_id, states, _ = message
+                changed = self.lots[camera_id].apply_states(np.frombuffer(states, dtype=np.uint8))
+                if len(changed) and self.on_state_change is not None:
+                    self.on_state_change(camera_id)
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                return
+
+    def _check_workers(self):
+        now = time.time()
+        for worker_id, process in enumerate(self.workers):
+            if process is None:
+                continue
+
+            if process.exitcode is not None:
+                if process.exitcode == 0:
+                    logger.info(f"Worker {worker_id} finished (all of its streams ended)")
+                    self.workers[worker_id] = None
+                    continue
+                reason = f"exited with code {process.exitcode}"
+            elif now - self.last_heartbeat[worker_id] > self.stall_timeout:
+                reason = f"sent no heartbeat for {now - self.last_heartbeat[worker_id]:.0f}s"
+            else:
+                continue
+
+            if now - self.last_start[worker_id] < RESTART_BACKOFF:
+                continue
+
+            logger.warning(f"Worker {worker_id} {reason}; restarting")
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=5.0)
+            self.restarts[worker_id] += 1
+            self._start_worker(worker_id)
+
+    def stop(self):
+        """Terminates all worker processes."""
+        for process in self.workers:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.workers:
+            if process is not None:
+                process.join(timeout=5.0)
@@ -1,6 +1,8 @@
 import cv2
+import time
 import logging
-from typing import Union, Generator
+import threading
+from typing import Union, Generator, Optional, Dict
 
 logger = logging.getLogger(__name__)
 
@@ -8,12 +10,23 @@ logger = logging.getLogger(__name__)
 class VideoStream:
     """
     Handles capturing frames from a webcam, video file, or RTSP stream.
+
+    In low-latency mode a background thread keeps draining the capture device and only
+    the newest decoded frame is kept ("latest frame wins"), so a slow consumer never
+    falls behind a live camera. Frames that will not be analysed are only grab()'ed,
+    never decoded.
     """
 
-    def __init__(self, source: Union[int, str]):
+    def __init__(self, source: Union[int, str], low_latency: bool = False, frame_interval: int = 1,
+                 max_width: Optional[int] = None):
         """
         Initializes the video capture.
         :param source: Camera index (int) or file/URL path (str).
+        :param low_latency: Read frames on a background thread and always deliver the newest one.
+                            Intended for live cameras; on video files frames are dropped whenever
+                            processing is slower than decoding.
+        :param frame_interval: Only decode every Nth frame; the others are skipped with grab().
+        :param max_width: Downscale decoded frames wider than this (None = keep full resolution).
         """
         self.source = source
         # Convert index '0' string to int 0, otherwise keep as string
@@ -21,6 +34,29 @@ class VideoStream:
             self.source = int(self.source)
 
         self.cap = None
+        self.low_latency = low_latency
+        self.frame_interval = max(1, frame_interval)
+        self.max_width = max_width
+        # Factor that maps coordinates in delivered frames back to the source resolution
+        self.scale = 1.0
+
+        # Counters
+        self.frames_grabbed = 0  # Frames read from the device
+        self.frames_skipped = 0  # Frames grabbed but never decoded (frame_interval)
+        self.frames_dropped = 0  # Frames decoded but replaced by a newer frame before being consumed
+        self.frames_delivered = 0  # Frames handed to the consumer
+        self.last_latency_ms = 0.0  # Capture-to-processed latency of the last consumed frame
+        self.max_latency_ms = 0.0
+        self._total_latency_ms = 0.0
+        self._latency_samples = 0
+
+        # Latest-frame slot shared with the reader thread
+        self._slot = None
+        self._slot_cond = threading.Condition()
+        self._end_of_stream = False
+        self._stop = threading.Event()
+        self._reader_thread: Optional[threading.Thread] = None
+        self._release_lock = threading.Lock()
 
     def __enter__(self):
         """Opens the video source."""
@@ -31,27 +67,157 @@ class VideoStream:
             # Raise an exception to be handled by the main loop
             raise IOError(error_msg)
 
+        width = self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+        if self.max_width and width > self.max_width:
+            self.scale = width / self.max_width
+
+        if self.low_latency:
+            # Keep the backend's own buffer as small as possible; not every backend honours this
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            self._reader_thread = threading.Thread(target=self._reader, daemon=True)
+            self._reader_thread.start()
+
         logger.info(f"Successfully opened video source: {self.source}")
         return self
 
+    def _read_next(self):
+        """
+        Grabs frames until the next one that should be analysed and decodes only that one.
+        :return: (frame, capture_time) or None at the end of the stream.
+        """
+        while True:
+            if not self.cap.grab():
+                return None
+            self.frames_grabbed += 1
+            if (self.frames_grabbed - 1) % self.frame_interval:
+                self.frames_skipped += 1
+                continue
+
+            capture_time = time.monotonic()
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                return None
+            if self.scale != 1.0:
+                height = int(round(frame.shape[0] / self.scale))
+                frame = cv2.resize(frame, (self.max_width, height), interpolation=cv2.INTER_AREA)
+            return frame, capture_time
+
+    def _reader(self):
+        """Background thread: keeps only the newest decoded frame in the slot."""
+        try:
+            while not self._stop.is_set():
+                item = self._read_next()
+                if item is None:
+                    break
+                with self._slot_cond:
+                    if self._slot is not None:
+                        self.frames_dropped += 1
+                    self._slot = item
+                    self._slot_cond.notify()
+        finally:
+            with self._slot_cond:
+                self._end_of_stream = True
+                self._slot_cond.notify()
+            # A read that outlasted __exit__'s wait leaves the release to this thread
+            if self._stop.is_set():
+                self._release()
+
+    def _next_frame(self, timeout: Optional[float] = None):
+        """
+        Returns the next frame to deliver as (frame, capture_time).
+        :param timeout: In low-latency mode, give up after this many seconds (None = wait until a frame arrives).
+        :return: None at the end of the stream or when the timeout expired.
+        """
+        if not self.low_latency:
+            return self._read_next()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._slot_cond:
+            while self._slot is None and not self._end_of_stream:
+                remaining = 1.0 if deadline is None else deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._slot_cond.wait(timeout=min(remaining, 1.0))
+            item, self._slot = self._slot, None
+        return item
+
+    @property
+    def ended(self) -> bool:
+        """True once the reader thread has reached the end of the stream (low-latency mode)."""
+        return self._end_of_stream and self._slot is None
+
+    def read_latest(self, timeout: float = 0.0) -> Optional[cv2.Mat]:
+        """
+        Returns the newest frame without blocking longer than timeout, for callers that poll
+        several streams. Without low-latency mode this reads the next frame synchronously.
+        :return: The frame, or None if no new frame arrived in time or the stream ended (see ended).
+        """
+        item = self._next_frame(timeout)
+        if item is None:
+            if not self.low_latency:
+                self._end_of_stream = True
+            return None
+
+        frame, capture_time = item
+        self.frames_delivered += 1
+        self._record_latency((time.monotonic() - capture_time) * 1000)
+        return frame
+
     def frame_generator(self) -> Generator[tuple[bool, cv2.Mat], None, None]:
         """
         Generates frames one by one from the video stream.
         :return: Generator yielding (ret, frame) tuples.
         """
         while self.cap.isOpened():
-            ret, frame = self.cap.read()
-            if not ret:
+            item = self._next_frame()
+            if item is None:
                 logger.warning(f"End of stream or read error from source {self.source}")
                 break
-            yield ret, frame
+
+            frame, capture_time = item
+            self.frames_delivered += 1
+            yield True, frame
+
+            # The consumer asks for the next frame once it is done with this one
+            self._record_latency((time.monotonic() - capture_time) * 1000)
+
+    def _record_latency(self, latency_ms: float):
+        self.last_latency_ms = latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self._total_latency_ms += latency_ms
+        self._latency_samples += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Returns frame counters and capture-to-processing latency (ms)."""
+        return {
+            "grabbed": self.frames_grabbed,
+            "skipped": self.frames_skipped,
+            "dropped": self.frames_dropped,
+            "delivered": self.frames_delivered,
+            "last_latency_ms": self.last_latency_ms,
+            "avg_latency_ms": self._total_latency_ms / self._latency_samples if self._latency_samples else 0.0,
+            "max_latency_ms": self.max_latency_ms,
+        }
 
     def get_fps(self) -> float:
         """Returns the frame rate of the stream."""
         return self.cap.get(cv2.CAP_PROP_FPS)
 
+    def _release(self):
+        """Releases the capture once, from whichever thread is the last to use it."""
+        with self._release_lock:
+            if self.cap is not None and self.cap.isOpened():
+                self.cap.release()
+                logger.info(f"Released video source: {self.source}")
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Releases the video capture when exiting the context."""
-        if self.cap:
-            self.cap.release()
-            logger.info(f"Released video source: {self.source}")
\ No newline at end of file
+        self._stop.set()
+        if self._reader_thread is not None:
+            self._reader_thread.join(timeout=2.0)
+            if self._reader_thread.is_alive():
+                # Releasing the capture under a blocked read is unsafe; the reader releases it when the read returns
+                logger.warning(f"Reader of {self.source} is still blocked in a read; "
+                               f"the capture is released when it returns")
+                return
+        self._release()
@@ -1,12 +1,22 @@
 import cv2
 import numpy as np
-from smartparking.parking_lot import ParkingLot
-from typing import List, Dict, Any
+from smartparking.parking_lot import ParkingLot, STATE_FREE, STATE_OCCUPIED
+from typing import List, Optional
+
+# Colors per encoded state (BGR)
+STATE_COLORS = {
+    STATE_FREE: (0, 255, 0),  # free: GREEN
+    STATE_OCCUPIED: (0, 0, 255),  # occupied: RED
+}
 
 
 class Visualizer:
     """
     Handles drawing the visualization overlays on the video frame.
+
+    Space outlines, labels and the status bar are drawn once into a cached overlay layer.
+    Only spaces whose state changed since the last draw are repainted, and the overlay is
+    composited onto each frame in a single masked copy.
     """
 
     def __init__(self, parking_lot: ParkingLot):
@@ -15,54 +25,102 @@ class Visualizer:
         self.FONT_SCALE = 0.7
         self.FONT_THICKNESS = 1
 
-    def draw(self, frame: cv2.Mat, detections: List[Dict[str, Any]]) -> cv2.Mat:
-        """
-        Draws parking spaces, detections, and status text on the frame.
-        :param frame: The frame to draw on.
-        :param detections: The list of vehicle detections.
-        :return: The frame with visualizations applied.
-        """
-        # 1. Draw Parking Spaces
-        for space_id, space in self.parking_lot.spaces.items():
-
-            # Define color based on state
-            if space.state == "occupied":
-                color = (0, 0, 255)  # RED (BGR)
-            else:
-                color = (0, 255, 0)  # GREEN (BGR)
-
-            # Convert polygon to NumPy array for cv2.polylines
-            pts = np.array(space.polygon, np.int32)
-            # Reshape for polylines (must be a list of contours)
-            pts = pts.reshape((-1, 1, 2))
-
-            # Draw the polygon boundary
-            cv2.polylines(frame, [pts], isClosed=True, color=color, thickness=2)
-
-            # Add text label to the center of the space
-            # Find approximate center for text
-            M = cv2.moments(pts)
+        # Cached overlay layer (built for the first frame size) and the states it currently shows
+        self._overlay: Optional[np.ndarray] = None
+        self._overlay_mask: Optional[np.ndarray] = None
+        self._drawn_states: Optional[np.ndarray] = None
+        self._status_height = 0
+        self._load_geometry()
+
+    def _load_geometry(self):
+        """Precomputes contours and label positions (approximate polygon centers) of the current zones."""
+        self._geometry_version = self.parking_lot.geometry_version
+        self.contours = self.parking_lot.geometry.contours
+        self.label_positions: List[Optional[tuple]] = []
+        for contour in self.contours:
+            M = cv2.moments(contour)
             if M['m00'] != 0:
                 cx = int(M['m10'] / M['m00'])
                 cy = int(M['m01'] / M['m00'])
-                cv2.putText(frame, space_id, (cx - 20, cy + 10), self.FONT, 0.6, color, self.FONT_THICKNESS)
-
-        # 2. Draw Vehicle Detections (Optional but helpful)
-        for det in detections:
-            x1, y1, x2, y2 = det['box']
-            # Draw bounding box (e.g., in yellow)
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
-
-            # 3. Draw Global Status Text
-        status = self.parking_lot.get_status()
-        text = f"OCCUPIED: {status['occupied']} | FREE: {status['free']} | TOTAL: {status['total']}"
+                self.label_positions.append((cx - 20, cy + 10))
+            else:
+                self.label_positions.append(None)
+        # Reloaded zones need a full overlay rebuild
+        self._overlay = None
+
+    def _build_overlay(self, shape: tuple):
+        """Draws every space and the status bar into a fresh overlay layer."""
+        self._overlay = np.zeros(shape, dtype=np.uint8)
+        self._overlay_mask = np.zeros(shape[:2], dtype=np.uint8)
+        self._drawn_states = self.parking_lot.store.states.copy()
+        for index in range(len(self.contours)):
+            self._draw_space(index, self._drawn_states[index])
+        self._draw_status_bar()
+
+    def _draw_space(self, index: int, state: int):
+        """Draws (or repaints) one space outline and its label on the overlay."""
+        color = STATE_COLORS[int(state)]
+        contour = self.contours[index]
+
+        # Draw the polygon boundary
+        cv2.polylines(self._overlay, [contour], isClosed=True, color=color, thickness=2)
+        cv2.polylines(self._overlay_mask, [contour], isClosed=True, color=255, thickness=2)
+
+        # Add text label to the center of the space
+        position = self.label_positions[index]
+        if position is not None:
+            space_id = self.parking_lot.geometry.space_ids[index]
+            cv2.putText(self._overlay, space_id, position, self.FONT, 0.6, color, self.FONT_THICKNESS)
+            cv2.putText(self._overlay_mask, space_id, position, self.FONT, 0.6, 255, self.FONT_THICKNESS)
+
+    def _draw_status_bar(self):
+        """Draws the global status text on the overlay."""
+        total = len(self._drawn_states)
+        occupied = int(np.count_nonzero(self._drawn_states))
+        text = f"OCCUPIED: {occupied} | FREE: {total - occupied} | TOTAL: {total}"
 
         # Draw background rectangle for status bar
         (text_w, text_h), baseline = cv2.getTextSize(text, self.FONT, self.FONT_SCALE, self.FONT_THICKNESS)
-        cv2.rectangle(frame, (0, 0), (frame.shape[1], text_h + baseline + 10), (0, 0, 0), -1)
+        self._status_height = min(text_h + baseline + 10, self._overlay.shape[0])
+        cv2.rectangle(self._overlay, (0, 0), (self._overlay.shape[1], self._status_height), (0, 0, 0), -1)
+        cv2.rectangle(self._overlay_mask, (0, 0), (self._overlay.shape[1], self._status_height), 255, -1)
 
         # Draw the status text
-        cv2.putText(frame, text, (10, text_h + 5), self.FONT, self.FONT_SCALE, (255, 255, 255), self.FONT_THICKNESS)
+        cv2.putText(self._overlay, text, (10, text_h + 5), self.FONT, self.FONT_SCALE, (255, 255, 255),
+                    self.FONT_THICKNESS)
+
+    def draw(self, frame: cv2.Mat, detections: np.ndarray) -> cv2.Mat:
+        """
+        Draws parking spaces, detections, and status text on the frame.
+        :param frame: The frame to draw on.
+        :param detections: Vehicle detections array (from Detector.detect).
+        :return: The frame with visualizations applied.
+        """
+        # 1. Bring the cached overlay up to date (full rebuild only for a new frame size or reloaded zones)
+        if self._geometry_version != self.parking_lot.geometry_version:
+            self._load_geometry()
+        if self._overlay is None or self._overlay.shape != frame.shape:
+            self._build_overlay(frame.shape)
+        else:
+            states = self.parking_lot.store.states.copy()
+            changed = np.flatnonzero(states != self._drawn_states)
+            if len(changed):
+                self._drawn_states = states
+                for index in changed:
+                    self._draw_space(index, states[index])
+                self._draw_status_bar()
+
+        # 2. Composite the parking spaces in one masked copy
+        cv2.copyTo(self._overlay, self._overlay_mask, frame)
+
+        # 3. Draw Vehicle Detections (Optional but helpful)
+        for x1, y1, x2, y2 in zip(detections['x1'].tolist(), detections['y1'].tolist(),
+                                  detections['x2'].tolist(), detections['y2'].tolist()):
+            # Draw bounding box (e.g., in yellow)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
+
+        # 4. Keep the status bar on top of the detection boxes
+        frame[:self._status_height] = self._overlay[:self._status_height]
 
         return frame
 
@@ -81,4 +139,4 @@ class Visualizer:
 
     def close_window(self, window_name: str = "SmartParking"):
         """Destroys all OpenCV windows."""
-        cv2.destroyWindow(window_name)
\ No newline at end of file
+        cv2.destroyWindow(window_name)
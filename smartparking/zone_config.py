@@ -0,0 +1,111 @@
+import os
+import hashlib
+import logging
+from typing import List, Tuple
+import numpy as np
+from smartparking.geometry import LotGeometry
+
+logger = logging.getLogger(__name__)
+
+# Bump when the compiled layout changes, so old cache files are rebuilt
+CACHE_VERSION = 1
+CACHE_DIR = ".cache"
+
+
+class CompiledZones:
+    """A parsed and rasterized zone config: space ids, polygons, per-space thresholds and the geometry."""
+
+    def __init__(self, config_hash: str, geometry: LotGeometry, overlap_thresholds: np.ndarray):
+        self.config_hash = config_hash
+        self.geometry = geometry
+        # Per-space overlap thresholds in geometry order, NaN where the global threshold applies
+        self.overlap_thresholds = overlap_thresholds
+
+    @property
+    def space_ids(self) -> List[str]:
+        return self.geometry.space_ids
+
+    @property
+    def polygons(self) -> List[List[Tuple[int, int]]]:
+        return [[tuple(point) for point in contour[:, 0].tolist()] for contour in self.geometry.contours]
+
+
+def config_hash(config_path: str) -> str:
+    """Hash of the config file contents (and the cache layout version)."""
+    digest = hashlib.sha256(f"v{CACHE_VERSION}:".encode("utf-8"))
+    with open(config_path, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def cache_path(config_path: str) -> str:
+    """The compiled form of config/parking_zones.yaml is cached as config/.cache/parking_zones.yaml.npz."""
+    directory, name = os.path.split(os.path.abspath(config_path))
+    return os.path.join(directory, CACHE_DIR, name + ".npz")
+
+
+def compile_zones(config_path: str, use_cache: bool = True) -> CompiledZones:
+    """
+    Loads a zone config, from its compiled cache when the file is unchanged.
+    On a cache miss the YAML is parsed, the geometry rasterized and the result cached for the next start.
+    :param use_cache: Read and write the compiled cache.
+    """
+    digest = config_hash(config_path)
+    path = cache_path(config_path)
+
+    if use_cache and os.path.exists(path):
+        try:
+            with np.load(path, allow_pickle=False) as cached:
+                if str(cached["config_hash"]) == digest:
+                    arrays = {key: cached[key] for key in cached.files}
+                    zones = CompiledZones(digest, LotGeometry.from_arrays(arrays), arrays["overlap_thresholds"])
+                    logger.info(f"Loaded {len(zones.space_ids)} parking spaces from the compiled cache of {config_path}")
+                    return zones
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable zone cache {path}: {e}")
+
+    zones = _parse_config(config_path, digest)
+    if use_cache:
+        _write_cache(path, zones)
+    return zones
+
+
+def _parse_config(config_path: str, digest: str) -> CompiledZones:
+    """Parses the YAML zone definitions and rasterizes the geometry."""
+    # Only needed on a cache miss; the C loader is many times faster on large configs
+    import yaml
+    with open(config_path, 'r') as f:
+        config = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)) or {}
+
+    spaces_data = config.get('parking_spaces', {})
+    if not spaces_data:
+        logger.error(f"Configuration file {config_path} has no 'parking_spaces' defined.")
+
+    space_ids, polygons, thresholds = [], [], []
+    for space_id, data in (spaces_data or {}).items():
+        polygon = data.get('polygon')
+        if polygon and len(polygon) >= 3:
+            overlap_threshold = data.get('overlap_threshold')
+            space_ids.append(str(space_id))
+            polygons.append([tuple(map(int, p)) for p in polygon])
+            thresholds.append(np.nan if overlap_threshold is None else float(overlap_threshold))
+        else:
+            logger.warning(f"Skipping parking space {space_id}: Invalid polygon definition.")
+
+    # Rasterize all polygons once so per-frame occupancy checks are a lookup, not a polygon test
+    geometry = LotGeometry(space_ids, polygons)
+    logger.info(f"Loaded {len(space_ids)} parking spaces from {config_path}")
+    return CompiledZones(digest, geometry, np.array(thresholds, dtype=np.float64))
+
+
+def _write_cache(path: str, zones: CompiledZones):
+    """Writes the compiled zones atomically; a read-only config directory only costs the next startup."""
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(tmp_path, config_hash=np.array(zones.config_hash), overlap_thresholds=zones.overlap_thresholds,
+                 **zones.geometry.to_arrays())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write the zone cache {path}: {e}")
+
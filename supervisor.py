@@ -0,0 +1,138 @@
+import argparse
+import logging
+import sys
+import os
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger('SmartParking')
+
+# --- Dynamic imports from the smartparking package ---
+try:
+    from smartparking.supervisor import CameraSupervisor, load_manifest
+    from smartparking.backends import prepare_backend
+    from smartparking.history import HistoryStore
+    from smartparking.api import run_api_server, register_lot, init_history, publish_status
+except ImportError as e:
+    logger.error(
+        "Failed to import SmartParking modules. Ensure you are running from the project root and requirements are installed.")
+    logger.error(f"Import Error: {e}")
+    sys.exit(1)
+
+
+def parse_args():
+    """Parses command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="SmartParking supervisor: runs every camera of a manifest across worker processes behind one API.")
+
+    parser.add_argument("--manifest", type=str, default="config/cameras.yaml",
+                        help="Path to the YAML manifest listing the cameras (source + zone config each).")
+
+    parser.add_argument("--model", type=str, default="models/yolov8n.pt",
+                        help="Path to the trained YOLO model file (e.g., yolov8n.pt).")
+
+    parser.add_argument("--backend", type=str, default="torch", choices=["torch", "onnx", "openvino"],
+                        help="Inference backend. onnx/openvino export the model next to the .pt file on first use.")
+
+    parser.add_argument("--imgsz", type=int, default=640,
+                        help="Inference image size.")
+
+    parser.add_argument("--threads", type=int, default=None,
+                        help="CPU threads used for inference per worker process.")
+
+    parser.add_argument("--int8", action="store_true",
+                        help="Use an INT8 model quantized on frames of --calibration-source (onnx/openvino).")
+
+    parser.add_argument("--calibration-source", type=str, default=None,
+                        help="Video to sample INT8 calibration frames from (default: the first camera).")
+
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of worker processes (default: one per CPU core, at most one per camera).")
+
+    parser.add_argument("--stall-timeout", type=float, default=60.0,
+                        help="Restart a worker that sends no heartbeat for this many seconds.")
+
+    parser.add_argument("--api-port", type=int, default=8000,
+                        help="Port for the FastAPI status API.")
+
+    parser.add_argument("--smoothing-frames", type=int, default=5,
+                        help="Default temporal smoothing (cameras can override it with 'smoothing_frames').")
+
+    parser.add_argument("--frame-interval", type=int, default=1,
+                        help="Analyse every Nth frame of each camera.")
+
+    parser.add_argument("--max-width", type=int, default=None,
+                        help="Downscale frames wider than this before detection.")
+
+    parser.add_argument("--occupancy-mode", type=str, default="center", choices=["center", "overlap"],
+                        help="'center': detection center inside the space. 'overlap': area overlap above a threshold.")
+
+    parser.add_argument("--overlap-metric", type=str, default="coverage", choices=["coverage", "iou"],
+                        help="Overlap metric for --occupancy-mode overlap.")
+
+    parser.add_argument("--overlap-threshold", type=float, default=0.5,
+                        help="Default overlap threshold for --occupancy-mode overlap.")
+
+    parser.add_argument("--history-db", type=str, default=None,
+                        help="Record state transitions and occupancy rollups of all cameras to this SQLite file.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    logger.info("--- SmartParking Supervisor Starting ---")
+
+    if not os.path.exists(args.model):
+        logger.error(f"YOLO model not found at: {args.model}.")
+        sys.exit(1)
+
+    try:
+        cameras = load_manifest(args.manifest)
+        calibration_source = args.calibration_source or next(iter(cameras.values()))['source']
+        # Export (and quantize) the model once here, so the workers all load the cached export
+        prepare_backend(args.model, args.backend, args.imgsz, args.int8, calibration_source)
+        supervisor = CameraSupervisor(cameras, options={
+            'model': args.model,
+            'smoothing_frames': args.smoothing_frames,
+            'occupancy_mode': args.occupancy_mode,
+            'overlap_metric': args.overlap_metric,
+            'overlap_threshold': args.overlap_threshold,
+            'frame_interval': args.frame_interval,
+            'max_width': args.max_width,
+            'backend': args.backend,
+            'imgsz': args.imgsz,
+            'threads': args.threads,
+            'int8': args.int8,
+            'calibration_source': calibration_source,
+        }, processes=args.processes, stall_timeout=args.stall_timeout, on_state_change=publish_status)
+        history = HistoryStore(args.history_db) if args.history_db else None
+    except Exception as e:
+        logger.error(f"Supervisor setup failed: {e}")
+        sys.exit(1)
+
+    if history is not None:
+        init_history(history)
+
+    # One API for every camera: per-lot endpoints under /lots, aggregate on /status
+    for camera_id, lot in supervisor.lots.items():
+        register_lot(camera_id, lot)
+    run_api_server(port=args.api_port)
+
+    logger.info(f"Running {len(cameras)} camera(s) on {len(supervisor.workers)} worker process(es)")
+    try:
+        supervisor.start()
+        supervisor.run()
+    except KeyboardInterrupt:
+        logger.info("Interrupted, stopping workers.")
+    finally:
+        supervisor.stop()
+        if history is not None:
+            history.close()
+        logger.info("--- SmartParking Supervisor Shut Down ---")
+
+
+if __name__ == "__main__":
+    main()
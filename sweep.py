@@ -0,0 +1,154 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger('SmartParking.sweep')
+
+# --- Dynamic imports from the smartparking package ---
+try:
+    import numpy as np
+    from smartparking.parking_lot import ParkingLot
+    from smartparking.occupancy_logic import OccupancyLogic
+    from smartparking.recording import DetectionRecording, raw_occupancy, smooth_states
+except ImportError as e:
+    logger.error(
+        "Failed to import SmartParking modules. Ensure you are running from the project root and requirements are installed.")
+    logger.error(f"Import Error: {e}")
+    sys.exit(1)
+
+
+def parse_args():
+    """Parses command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="SmartParking sweep: replays recorded detections (main.py --record) under many parameter sets.")
+
+    parser.add_argument("--recording", type=str, required=True,
+                        help="Detection recording written by main.py --record.")
+
+    parser.add_argument("--config", type=str, default="config/parking_zones.yaml",
+                        help="Path to the YAML configuration file defining parking zones.")
+
+    parser.add_argument("--smoothing-frames", type=int, nargs="+", default=[5],
+                        help="Temporal smoothing values to evaluate.")
+
+    parser.add_argument("--occupancy-mode", type=str, nargs="+", default=["center"], choices=["center", "overlap"],
+                        help="Occupancy rules to evaluate.")
+
+    parser.add_argument("--overlap-metric", type=str, nargs="+", default=["coverage"], choices=["coverage", "iou"],
+                        help="Overlap metrics to evaluate (overlap mode only).")
+
+    parser.add_argument("--overlap-threshold", type=float, nargs="+", default=[0.5],
+                        help="Overlap thresholds to evaluate (overlap mode only).")
+
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of worker processes (default: one per CPU core).")
+
+    parser.add_argument("--timelines", action="store_true",
+                        help="Include every state transition of every space in the report.")
+
+    parser.add_argument("--output", type=str, default="sweep_results.json",
+                        help="Where to write the JSON report.")
+    return parser.parse_args()
+
+
+def occupancy_rules(args) -> List[Tuple[str, str, float]]:
+    """(mode, metric, threshold) combinations; metric and threshold do not apply to the center mode."""
+    rules = []
+    for mode in args.occupancy_mode:
+        if mode == "center":
+            rules.append(("center", "coverage", 0.5))
+        else:
+            rules.extend(("overlap", metric, threshold)
+                         for metric, threshold in itertools.product(args.overlap_metric, args.overlap_threshold))
+    return rules
+
+
+def evaluate_rule(recording_path: str, config_path: str, rule: Tuple[str, str, float], smoothing_values: List[int],
+                  timelines: bool) -> List[Dict]:
+    """
+    Worker: replays the recording once under one occupancy rule, then applies every smoothing value
+    to the resulting raw occupancy.
+    """
+    mode, metric, threshold = rule
+    recording = DetectionRecording(recording_path)
+    parking_lot = ParkingLot(config_path)
+    occupancy_logic = OccupancyLogic(parking_lot, mode=mode, overlap_metric=metric, overlap_threshold=threshold)
+    occupied = raw_occupancy(recording, occupancy_logic)
+
+    space_ids = parking_lot.geometry.space_ids
+    frames = recording.index['frame']
+    timestamps = recording.index['timestamp']
+    results = []
+    for smoothing_frames in smoothing_values:
+        flips, transitions = smooth_states(occupied, smoothing_frames)
+        result = {
+            "params": {"occupancy_mode": mode, "overlap_metric": metric if mode == "overlap" else None,
+                       "overlap_threshold": threshold if mode == "overlap" else None,
+                       "smoothing_frames": smoothing_frames},
+            "frames": len(recording),
+            "total_flips": int(flips.sum()),
+            "flips_per_space": dict(zip(space_ids, flips.tolist())),
+            # Share of frames on which each space was raw-occupied (independent of smoothing)
+            "raw_occupied_fraction": dict(zip(space_ids, np.round(occupied.mean(axis=0), 4).tolist()))
+            if len(occupied) else {},
+        }
+        if timelines:
+            timeline: Dict[str, List] = {space_id: [] for space_id in space_ids}
+            for i, index, state in transitions:
+                timeline[space_ids[index]].append([int(frames[i]), float(timestamps[i]), state])
+            result["timelines"] = timeline
+        results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+
+    for path in (args.recording, args.config):
+        if not os.path.exists(path):
+            logger.error(f"File not found: {path}")
+            sys.exit(1)
+
+    rules = occupancy_rules(args)
+    smoothing_values = sorted(set(args.smoothing_frames))
+    logger.info(f"Evaluating {len(rules) * len(smoothing_values)} parameter sets "
+                f"({len(rules)} occupancy rules x {len(smoothing_values)} smoothing values)")
+
+    # One worker per occupancy rule: the replay is the expensive part, smoothing is cheap
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.processes) as executor:
+        futures = {executor.submit(evaluate_rule, args.recording, args.config, rule, smoothing_values,
+                                   args.timelines): rule for rule in rules}
+        for future in as_completed(futures):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                logger.error(f"Evaluating {futures[future]} failed: {e}")
+    logger.info(f"Sweep finished in {time.perf_counter() - start:.1f}s")
+
+    results.sort(key=lambda result: result["total_flips"])
+    for result in results:
+        params = result["params"]
+        logger.info(f"  flips {result['total_flips']:6d} | mode={params['occupancy_mode']} "
+                    f"metric={params['overlap_metric']} threshold={params['overlap_threshold']} "
+                    f"smoothing={params['smoothing_frames']}")
+
+    with open(args.output, 'w') as f:
+        json.dump({"recording": args.recording, "metadata": DetectionRecording(args.recording).metadata,
+                   "config": args.config, "results": results}, f, indent=2)
+    logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
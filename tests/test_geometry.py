@@ -0,0 +1,102 @@
+import cv2
+import numpy as np
+import pytest
+from smartparking.geometry import LotGeometry
+
+
+def random_lot(rng: np.random.Generator, count: int = 40, extent: int = 400):
+    """Star-shaped (often concave) integer polygons scattered over the lot; some of them overlap."""
+    polygons = []
+    for _ in range(count):
+        cx, cy = rng.integers(20, extent - 20, size=2)
+        vertices = int(rng.integers(3, 9))
+        angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+        radii = rng.uniform(5, 40, vertices)
+        points = np.stack([cx + radii * np.cos(angles), cy + radii * np.sin(angles)], axis=1).round().astype(int)
+        polygons.append([tuple(p) for p in points.tolist()])
+    return [f"S{i}" for i in range(count)], polygons
+
+
+def random_boxes(rng: np.random.Generator, count: int, extent: int = 400) -> np.ndarray:
+    x1, y1 = rng.integers(-20, extent, size=(2, count))
+    w, h = rng.integers(1, 120, size=(2, count))
+    return np.stack([x1, y1, x1 + w, y1 + h], axis=1)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_spaces_containing_matches_point_polygon_test(seed):
+    rng = np.random.default_rng(seed)
+    space_ids, polygons = random_lot(rng)
+    geometry = LotGeometry(space_ids, polygons)
+
+    # Random points plus every vertex and edge midpoint, where the label mask and OpenCV can disagree
+    points = [rng.integers(-10, 410, size=(2000, 2))]
+    for polygon in polygons:
+        vertices = np.array(polygon)
+        points += [vertices, (vertices + np.roll(vertices, -1, axis=0)) // 2]
+    points = np.concatenate(points)
+
+    point_indices, space_indices = geometry.spaces_containing(points)
+    found = set(zip(point_indices.tolist(), space_indices.tolist()))
+    expected = {(point_index, space_index)
+                for space_index, contour in enumerate(geometry.contours)
+                for point_index, (x, y) in enumerate(points.tolist())
+                if cv2.pointPolygonTest(contour, (x, y), measureDist=False) >= 0}
+    assert found == expected
+    assert len(found) == len(point_indices)  # No pair is reported twice
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_candidate_pairs_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    geometry = LotGeometry(*random_lot(rng))
+    boxes = random_boxes(rng, 300)
+
+    box_indices, space_indices = geometry.candidate_pairs(boxes)
+    bboxes = geometry.bboxes
+    expected = {(b, s) for b, (x1, y1, x2, y2) in enumerate(boxes.tolist()) for s in range(len(bboxes))
+                if bboxes[s, 0] < x2 and bboxes[s, 2] > x1 and bboxes[s, 1] < y2 and bboxes[s, 3] > y1}
+    assert set(zip(box_indices.tolist(), space_indices.tolist())) == expected
+    assert len(box_indices) == len(expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_overlap_areas_match_convex_intersection(seed):
+    rng = np.random.default_rng(seed)
+    space_ids, polygons = random_lot(rng)
+    # Convex spaces, so cv2.intersectConvexConvex can serve as the reference
+    polygons = [cv2.convexHull(np.array(p, dtype=np.int32))[:, 0].tolist() for p in polygons]
+    geometry = LotGeometry(space_ids, polygons)
+    boxes = random_boxes(rng, 200)
+
+    box_indices, space_indices, areas = geometry.overlap_areas(boxes)
+    assert len(areas) > 0
+    for box_index, space_index, area in zip(box_indices, space_indices, areas):
+        x1, y1, x2, y2 = boxes[box_index].astype(np.float32)
+        box = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+        expected, _ = cv2.intersectConvexConvex(box, np.array(polygons[space_index], dtype=np.float32))
+        assert area == pytest.approx(expected, abs=1e-3)
+
+
+def test_overlap_area_of_concave_space():
+    # L-shaped space: the 20x20 square minus its top-right 10x10 quadrant (area 300)
+    geometry = LotGeometry(["L"], [[(0, 0), (10, 0), (10, 10), (20, 10), (20, 20), (0, 20)]])
+    cases = {(0, 0, 20, 20): 300.0,  # The whole space
+             (10, 0, 20, 10): 0.0,  # Only the missing quadrant (touching the edges)
+             (5, 5, 15, 15): 75.0,  # Three quarters of a 10x10 box
+             (-5, 15, 25, 30): 100.0}  # A band across the bottom, wider than the space
+    for box, expected in cases.items():
+        _, _, areas = geometry.overlap_areas(np.array([box]))
+        assert (areas.sum() if len(areas) else 0.0) == pytest.approx(expected)
+
+
+def test_round_trip_through_arrays():
+    rng = np.random.default_rng(7)
+    geometry = LotGeometry(*random_lot(rng))
+    restored = LotGeometry.from_arrays(geometry.to_arrays())
+    points = rng.integers(-10, 410, size=(500, 2))
+    for a, b in zip(geometry.spaces_containing(points), restored.spaces_containing(points)):
+        np.testing.assert_array_equal(a, b)
+    boxes = random_boxes(rng, 100)
+    for a, b in zip(geometry.overlap_areas(boxes), restored.overlap_areas(boxes)):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,96 @@
+import csv
+import numpy as np
+import pytest
+from smartparking.offline import GAP_STATE, VideoJob, occupancy_intervals, plan_segments
+from smartparking.recording import smooth_states
+
+SPACE_IDS = ["A", "B", "C", "D"]
+
+
+@pytest.mark.parametrize("total_frames", [1, 7, 100, 1001, 36_000])
+@pytest.mark.parametrize("step", [1, 3, 25])
+@pytest.mark.parametrize("frames_per_segment", [1, 10, 250, 100_000])
+def test_plan_segments_sample_the_single_pass_frames(total_frames, step, frames_per_segment):
+    segments = plan_segments(total_frames, step, frames_per_segment)
+    assert segments[0][0] == 0 and segments[-1][1] == total_frames
+    assert all(end == next_start for (_, end), (next_start, _) in zip(segments, segments[1:]))
+    assert all(start % step == 0 and start < end for start, end in segments)
+    sampled = [index for start, end in segments for index in range(start, end, step)]
+    assert sampled == list(range(0, total_frames, step))
+
+
+def raw_occupancy(frame_indices: np.ndarray) -> np.ndarray:
+    """Deterministic raw occupancy per frame index, so every split of the video sees the same input."""
+    rng = np.random.default_rng(0)
+    table = np.cumsum(rng.random((int(frame_indices.max(initial=0)) + 1, len(SPACE_IDS))) < 0.15, axis=0) % 2 == 1
+    return table[frame_indices]
+
+
+def run_job(tmp_path, segments, step, smoothing_frames, order=None, failed=(), name="timeline.csv"):
+    job = VideoJob("video.mp4", segments, step, fps=25.0, output_path=str(tmp_path / name), start_time=1000.0)
+    for position in (order if order is not None else range(len(segments))):
+        start, end = segments[position]
+        if position in failed:
+            job.fail(start, end)
+            continue
+        indices = np.arange(start, end, step, dtype=np.int64)
+        job.add(start, indices, np.packbits(raw_occupancy(indices), axis=1), detections=0)
+    assert job.done
+    stats = job.finish(SPACE_IDS, smoothing_frames)
+    with open(job.output_path, newline='') as f:
+        return stats, list(csv.reader(f))
+
+
+@pytest.mark.parametrize("smoothing_frames", [1, 3, 6])
+@pytest.mark.parametrize("frames_per_segment", [10, 75, 400])
+def test_stitched_segments_equal_a_single_pass(tmp_path, smoothing_frames, frames_per_segment):
+    total_frames, step = 1000, 4
+    single_stats, single_rows = run_job(tmp_path, plan_segments(total_frames, step, total_frames), step,
+                                        smoothing_frames, name="single.csv")
+
+    segments = plan_segments(total_frames, step, frames_per_segment)
+    # Segments finish in any order
+    order = np.random.default_rng(frames_per_segment).permutation(len(segments)).tolist()
+    stats, rows = run_job(tmp_path, segments, step, smoothing_frames, order=order)
+
+    assert rows == single_rows
+    assert stats["flips"] == single_stats["flips"] and stats["frames"] == single_stats["frames"]
+
+
+def test_occupancy_intervals():
+    frame_indices = np.arange(0, 100, 10)
+    occupied = np.zeros((10, 2), dtype=bool)
+    occupied[3:7, 0] = True  # Space A: occupied on frames 30-60
+    flips, transitions = smooth_states(occupied, 2)
+    rows = occupancy_intervals(frame_indices, transitions, ["A", "B"], end_frame=100, fps=10.0, start_time=50.0)
+
+    assert flips.tolist() == [2, 0]
+    # Smoothing confirms each change on the second agreeing frame
+    assert [row[:4] for row in rows] == [("A", "free", 0, 40), ("A", "occupied", 40, 80), ("A", "free", 80, 100),
+                                         ("B", "free", 0, 100)]
+    assert rows[1][4:] == (54.0, 58.0, 4.0)
+
+
+def test_intervals_cover_the_video_without_holes(tmp_path):
+    total_frames, step = 600, 3
+    segments = plan_segments(total_frames, step, 90)
+    _, rows = run_job(tmp_path, segments, step, 3)
+    for space_id in SPACE_IDS:
+        intervals = [row for row in rows[1:] if row[0] == space_id]
+        assert int(intervals[0][2]) == 0 and int(intervals[-1][3]) == total_frames
+        assert all(a[3] == b[2] and a[1] != b[1] for a, b in zip(intervals, intervals[1:]))
+
+
+@pytest.mark.parametrize("failed", [(0,), (2, 3), (6,), (1, 4)])
+def test_failed_segments_become_gaps(tmp_path, failed):
+    total_frames, step = 700, 5
+    segments = plan_segments(total_frames, step, 100)
+    _, rows = run_job(tmp_path, segments, step, 2, failed=failed)
+
+    for space_id in SPACE_IDS:
+        intervals = [(row[1], int(row[2]), int(row[3])) for row in rows[1:] if row[0] == space_id]
+        assert intervals[0][1] == 0 and intervals[-1][2] == total_frames
+        assert all(a[2] == b[1] for a, b in zip(intervals, intervals[1:]))
+        gaps = [(start, end) for state, start, end in intervals if state == GAP_STATE]
+        covered = {index for start, end in gaps for index in range(start, end)}
+        assert covered == {index for position in failed for index in range(*segments[position])}
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from smartparking.parking_lot import STATE_FREE, STATE_OCCUPIED, SpaceStateStore
+
+
+class HistorySmoothing:
+    """The original per-space smoothing: a history of the last N raw states must agree to flip."""
+
+    def __init__(self, smoothing_frames: int):
+        self.smoothing_frames = smoothing_frames
+        self.state = STATE_FREE
+        self.history = []
+
+    def update(self, occupied: bool):
+        raw = STATE_OCCUPIED if occupied else STATE_FREE
+        self.history = (self.history + [raw])[-self.smoothing_frames:]
+        if len(self.history) == self.smoothing_frames and all(state == raw for state in self.history):
+            self.state = raw
+
+
+@pytest.mark.parametrize("smoothing_frames", [1, 2, 3, 5, 8])
+@pytest.mark.parametrize("churn", [0.05, 0.3, 0.7])
+def test_update_matches_history_smoothing(smoothing_frames, churn):
+    rng = np.random.default_rng(smoothing_frames)
+    spaces, frames = 25, 300
+    # Runs of random length, so some reach the smoothing threshold and some do not
+    raw = np.cumsum(rng.random((frames, spaces)) < churn, axis=0) % 2 == 1
+
+    store = SpaceStateStore(spaces, smoothing_frames)
+    references = [HistorySmoothing(smoothing_frames) for _ in range(spaces)]
+    for frame in raw:
+        before = store.states.copy()
+        changed = store.update(frame)
+        for reference, occupied in zip(references, frame):
+            reference.update(bool(occupied))
+        np.testing.assert_array_equal(store.states, [reference.state for reference in references])
+        np.testing.assert_array_equal(changed, np.flatnonzero(store.states != before))
+        np.testing.assert_array_equal(store.changed, changed)
+
+
+def test_run_lengths_saturate():
+    store = SpaceStateStore(1, 3)
+    for _ in range(100_000):
+        store.update(np.array([True]))
+    assert store.run_lengths[0] == 3
+    assert store.states[0] == STATE_OCCUPIED
+    # A single free frame restarts the run
+    store.update(np.array([False]))
+    assert store.run_lengths[0] == 1 and store.states[0] == STATE_OCCUPIED
+
+
+@pytest.mark.parametrize("smoothing_frames", [1, 3, 5])
+def test_update_one_pass_matches_update(smoothing_frames):
+    rng = np.random.default_rng(smoothing_frames)
+    spaces = 6
+    batch, single = SpaceStateStore(spaces, smoothing_frames), SpaceStateStore(spaces, smoothing_frames)
+    notified = []
+    single.on_change = lambda changed: notified.extend(changed.tolist())
+    for frame in rng.random((300, spaces)) < 0.5:
+        changed = batch.update(frame)
+        notified.clear()
+        flipped = [index for index in range(spaces) if single.update_one(index, bool(frame[index]), smoothing_frames)]
+        np.testing.assert_array_equal(single.states, batch.states)
+        np.testing.assert_array_equal(single.changed, changed)
+        assert single.changed.dtype == np.int64
+        assert flipped == notified == changed.tolist()
+
+
+def test_update_one_clears_its_own_entry_only():
+    store = SpaceStateStore(3, 1)
+    store.update(np.array([True, True, False]))
+    np.testing.assert_array_equal(store.changed, [0, 1])
+    # Space 0 stays occupied: its entry is cleared, space 1 keeps its flip from the last update
+    assert not store.update_one(0, True, 1)
+    np.testing.assert_array_equal(store.changed, [1])
+    assert store.update_one(2, True, 1)
+    np.testing.assert_array_equal(store.changed, [1, 2])
+
+
+def test_set_states_reports_differences():
+    store = SpaceStateStore(4, 5)
+    notified = []
+    store.on_change = lambda changed: notified.append(changed.tolist())
+    changed = store.set_states(np.array([1, 0, 1, 0], dtype=np.uint8))
+    np.testing.assert_array_equal(changed, [0, 2])
+    assert store.set_states(np.array([1, 0, 1, 0], dtype=np.uint8)).size == 0
+    assert notified == [[0, 2]]
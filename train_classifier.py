@@ -0,0 +1,216 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger('SmartParking.train_classifier')
+
+# --- Dynamic imports from the smartparking package ---
+try:
+    import cv2
+    import numpy as np
+    from smartparking.detector import Detector
+    from smartparking.parking_lot import ParkingLot
+    from smartparking.occupancy_logic import OccupancyLogic
+    from smartparking.offline import iter_sampled_frames, video_info
+    from smartparking.patch_classifier import PATCH_SIZE, PatchClassifier, PatchSampler
+except ImportError as e:
+    logger.error(
+        "Failed to import SmartParking modules. Ensure you are running from the project root and requirements are installed.")
+    logger.error(f"Import Error: {e}")
+    sys.exit(1)
+
+
+def parse_args():
+    """Parses command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="SmartParking patch classifier training: labels every space patch with the YOLO-based "
+                    "occupancy rule and fits the classifier used by --occupancy-mode classifier.")
+
+    parser.add_argument("--sources", type=str, nargs="+", required=True,
+                        help="Videos of the camera the classifier is trained for.")
+
+    parser.add_argument("--config", type=str, default="config/parking_zones.yaml",
+                        help="Path to the parking zones YAML configuration file.")
+
+    parser.add_argument("--model", type=str, default="models/yolov8n.pt",
+                        help="YOLO model that provides the labels.")
+
+    parser.add_argument("--backend", type=str, default="torch", choices=["torch", "onnx", "openvino"],
+                        help="Inference backend of the labelling model.")
+
+    parser.add_argument("--imgsz", type=int, default=640,
+                        help="Inference image size.")
+
+    parser.add_argument("--threads", type=int, default=None,
+                        help="CPU threads used for inference.")
+
+    parser.add_argument("--interval", type=float, default=2.0,
+                        help="Seconds of video between sampled frames.")
+
+    parser.add_argument("--max-frames", type=int, default=1000,
+                        help="Maximum sampled frames per source.")
+
+    parser.add_argument("--label-mode", type=str, default="overlap", choices=["center", "overlap"],
+                        help="Occupancy rule that turns the detections into labels.")
+
+    parser.add_argument("--overlap-metric", type=str, default="coverage", choices=["coverage", "iou"],
+                        help="Overlap metric for --label-mode overlap.")
+
+    parser.add_argument("--overlap-threshold", type=float, default=0.5,
+                        help="Default overlap threshold for --label-mode overlap.")
+
+    parser.add_argument("--patch-size", type=int, nargs=2, default=list(PATCH_SIZE), metavar=("WIDTH", "HEIGHT"),
+                        help="Size of the normalized space patches.")
+
+    parser.add_argument("--validation", type=float, default=0.2,
+                        help="Fraction of each source (its last frames) held out for validation.")
+
+    parser.add_argument("--epochs", type=int, default=300,
+                        help="Gradient descent iterations.")
+
+    parser.add_argument("--learning-rate", type=float, default=0.5,
+                        help="Gradient descent step size.")
+
+    parser.add_argument("--l2", type=float, default=1e-3,
+                        help="L2 regularization strength.")
+
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="Occupancy probability threshold saved with the classifier.")
+
+    parser.add_argument("--dataset", type=str, default=None,
+                        help="Also save the labelled patches, features and labels to this .npz file.")
+
+    parser.add_argument("--output", type=str, default="models/space_classifier.npz",
+                        help="Where to save the trained classifier.")
+    return parser.parse_args()
+
+
+def scores(predicted: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+    """Accuracy / precision / recall / F1 of the predictions against the YOLO labels."""
+    true_positives = float(np.sum(predicted & labels))
+    precision = true_positives / max(float(predicted.sum()), 1.0)
+    recall = true_positives / max(float(labels.sum()), 1.0)
+    return {"accuracy": float(np.mean(predicted == labels)) if len(labels) else 0.0,
+            "precision": precision, "recall": recall,
+            "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0}
+
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.model):
+        logger.error(f"YOLO model not found at: {args.model}.")
+        sys.exit(1)
+
+    # 1. Load the zones, the labelling model and the patch sampler
+    try:
+        parking_lot = ParkingLot(args.config)
+        if not parking_lot.spaces:
+            logger.error("No valid parking spaces defined. Exiting.")
+            sys.exit(1)
+        detector = Detector(args.model, backend=args.backend, imgsz=args.imgsz, threads=args.threads)
+        logic = OccupancyLogic(parking_lot, mode=args.label_mode, overlap_metric=args.overlap_metric,
+                               overlap_threshold=args.overlap_threshold)
+        sampler = PatchSampler(parking_lot.geometry, tuple(args.patch_size))
+    except Exception as e:
+        logger.error(f"Setup failed: {e}")
+        sys.exit(1)
+
+    # 2. Label the patches of the sampled frames with the detector
+    train_features: List[np.ndarray] = []
+    train_labels: List[np.ndarray] = []
+    validation_features: List[np.ndarray] = []
+    validation_labels: List[np.ndarray] = []
+    # Everything in source order, for --dataset
+    patches: List[np.ndarray] = []
+    all_features: List[np.ndarray] = []
+    all_labels: List[np.ndarray] = []
+    detect_seconds, classify_seconds, frame_count = 0.0, 0.0, 0
+
+    for source in args.sources:
+        try:
+            total_frames, fps = video_info(source)
+        except IOError as e:
+            logger.error(f"Skipping {source}: {e}")
+            continue
+        step = max(1, int(round(args.interval * fps)) if fps > 0 else 1,
+                   total_frames // max(args.max_frames, 1))
+        capture = cv2.VideoCapture(source)
+        features, labels = [], []
+        try:
+            for _, frame in iter_sampled_frames(capture, 0, total_frames, step):
+                start = time.perf_counter()
+                labels.append(logic.raw_occupancy(detector.detect(frame)))
+                detect_seconds += time.perf_counter() - start
+
+                start = time.perf_counter()
+                features.append(sampler.features(frame))
+                classify_seconds += time.perf_counter() - start
+
+                if args.dataset:
+                    patches.append(sampler.patches(frame))
+                frame_count += 1
+        finally:
+            capture.release()
+
+        if not features:
+            logger.warning(f"No frames read from {source}")
+            continue
+        # Hold out the end of each source, so validation frames are not neighbours of training frames
+        split = len(features) - int(round(len(features) * args.validation))
+        train_features += features[:split]
+        train_labels += labels[:split]
+        validation_features += features[split:]
+        validation_labels += labels[split:]
+        all_features += features
+        all_labels += labels
+        occupied = float(np.mean(labels))
+        logger.info(f"{source}: {len(features)} frames x {len(parking_lot.geometry)} spaces, "
+                    f"{100 * occupied:.1f}% occupied")
+
+    if not train_features:
+        logger.error("No training data.")
+        sys.exit(1)
+
+    x_train, y_train = np.concatenate(train_features), np.concatenate(train_labels)
+    logger.info(f"Training on {len(x_train)} patches ({int(y_train.sum())} occupied)")
+
+    # 3. Fit and evaluate the classifier
+    classifier = PatchClassifier.train(x_train, y_train, epochs=args.epochs, learning_rate=args.learning_rate,
+                                       l2=args.l2, patch_size=tuple(args.patch_size))
+    classifier.threshold = args.threshold
+
+    result = scores(classifier.predict(x_train), y_train)
+    logger.info(f"Training:   accuracy {result['accuracy']:.3f}  precision {result['precision']:.3f}  "
+                f"recall {result['recall']:.3f}  F1 {result['f1']:.3f}")
+    if validation_features:
+        result = scores(classifier.predict(np.concatenate(validation_features)), np.concatenate(validation_labels))
+        logger.info(f"Validation: accuracy {result['accuracy']:.3f}  precision {result['precision']:.3f}  "
+                    f"recall {result['recall']:.3f}  F1 {result['f1']:.3f}  (agreement with the YOLO labels)")
+    logger.info(f"Per frame: detector + occupancy {1000 * detect_seconds / frame_count:.1f}ms, "
+                f"patch features {1000 * classify_seconds / frame_count:.2f}ms")
+
+    # 4. Save the classifier (and the dataset)
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    classifier.save(args.output)
+    logger.info(f"Classifier saved to {args.output}")
+
+    if args.dataset:
+        np.savez_compressed(args.dataset, patches=np.stack(patches),
+                            features=np.stack(all_features),
+                            labels=np.stack(all_labels),
+                            space_ids=np.array(parking_lot.geometry.space_ids, dtype=str))
+        logger.info(f"Dataset saved to {args.dataset}")
+
+
+if __name__ == "__main__":
+    main()